@@ -1,6 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from typing import Optional, Dict, Any
+import asyncio
+import json
 import logging
+import uuid
 
 from app.models.schemas import (
     ChatRequest,
@@ -8,10 +13,21 @@ from app.models.schemas import (
     ArchitectureRequest,
     UIResearchRequest,
     UIResearchResponse,
+    JobRequest,
+    JobResponse,
+    BatchRequest,
+    DesignRequest,
+    RefineRequest,
 )
 from app.services.agents.architecture_agent import ArchitectureAgent
 from app.services.agents.ui_research_agent import UIResearchAgent
-from app.services.cache import CacheService
+from app.services.batch import BatchRunner
+from app.services.cache import CacheService, make_cache_key, safe_cache_get, safe_cache_set
+from app.services.generation import MARKDOWN_CATEGORIES, generate_for_category, stream_category
+from app.services.jobs import JobService
+from app.services.knowledge_base import SharedRetrieval
+from app.services.llm import llm_service
+from app.services.stream_hub import StreamExpired
 from app.config import get_settings
 
 router = APIRouter()
@@ -26,51 +42,160 @@ def get_knowledge_base(request: Request):
     return getattr(request.app.state, 'knowledge_base', None)
 
 
-async def safe_cache_get(cache: Optional[CacheService], key: str) -> Optional[str]:
-    if cache:
-        try:
-            return await cache.get(key)
-        except Exception as e:
-            logger.warning(f"Cache get error: {e}")
-    return None
+def get_jobs(request: Request) -> Optional[JobService]:
+    return getattr(request.app.state, 'jobs', None)
 
 
-async def safe_cache_set(cache: Optional[CacheService], key: str, value: str, ttl: int):
-    if cache:
+def get_streams(request: Request):
+    return getattr(request.app.state, 'streams', None)
+
+
+async def cancel_on_disconnect(http_request: Request, awaitable, poll_interval: float = 0.5):
+    """Await a generation, cancelling it if the client goes away first"""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                logger.info("Client disconnected, cancelling %s", http_request.url.path)
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def shared_stream(streams, key: str, produce, last_event_id: Optional[str] = None, resumable: bool = True):
+    """(event id, chunk) pairs of the generation for `key`, shared with concurrent identical requests.
+    
+    With `last_event_id` the buffered stream is resumed instead; StreamExpired
+    if that is no longer possible. `resumable=False` for clients that can't
+    reconnect by event id, so the generation stops as soon as they all leave.
+    """
+    if streams:
         try:
-            await cache.set(key, value, ttl=ttl)
-        except Exception as e:
-            logger.warning(f"Cache set error: {e}")
+            async for item in streams.stream(key, produce, after=last_event_id, resumable=resumable):
+                yield item
+            return
+        except StreamExpired:
+            if last_event_id is not None:
+                raise
+            # Joined too late to replay from the start: generate independently
+            logger.info("Shared stream '%s' head expired, generating separately", key)
+    elif last_event_id is not None:
+        raise StreamExpired("Streams are not buffered")
+    
+    async for chunk in produce():
+        yield None, chunk
+
+
+def sse_event(event: str, data: dict, event_id: Optional[str] = None) -> str:
+    prefix = f"id: {event_id}\n" if event_id else ""
+    return f"{prefix}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("/chat/architecture", response_model=ChatResponse)
 async def architecture_chat(
     request: ArchitectureRequest,
+    http_request: Request,
     cache: Optional[CacheService] = Depends(get_cache),
     kb = Depends(get_knowledge_base),
 ):
-    cache_key = f"arch:{hash(request.prompt)}"
+    cache_key = make_cache_key("architecture", request.prompt)
     cached = await safe_cache_get(cache, cache_key)
     if cached:
         return ChatResponse(content=cached, cached=True)
     
     try:
         agent = ArchitectureAgent(knowledge_base=kb)
-        response = await agent.generate(request.prompt, request.context)
+        response = await cancel_on_disconnect(
+            http_request,
+            agent.generate(request.prompt, request.context, sectioned=request.sectioned),
+        )
         
         await safe_cache_set(cache, cache_key, response, get_settings().cache_ttl)
         return ChatResponse(content=response, cached=False)
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Architecture generation error: {e}")
+        logger.error("Architecture generation error: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to generate response: {str(e)}")
 
 
+@router.post("/chat/architecture/stream")
+async def architecture_chat_stream(
+    request: ArchitectureRequest,
+    http_request: Request,
+    cache: Optional[CacheService] = Depends(get_cache),
+    kb = Depends(get_knowledge_base),
+    streams = Depends(get_streams),
+):
+    cache_key = make_cache_key("architecture", request.prompt)
+    last_event_id = http_request.headers.get("last-event-id")
+    
+    async def produce():
+        parts = []
+        async for chunk in stream_category(
+            "architecture",
+            request.prompt,
+            request.context,
+            sectioned=request.sectioned,
+            knowledge_base=kb,
+        ):
+            parts.append(chunk)
+            yield chunk
+        await safe_cache_set(cache, cache_key, "".join(parts), get_settings().cache_ttl)
+    
+    async def events():
+        if last_event_id:
+            try:
+                async for event_id, chunk in shared_stream(streams, cache_key, produce, last_event_id):
+                    yield sse_event("chunk", {"content": chunk}, event_id)
+                yield sse_event("done", {"cached": False, "resumed": True})
+                return
+            except StreamExpired:
+                # Tell the client to discard what it has; the full answer follows
+                yield sse_event("reset", {"detail": "Stream can no longer be resumed"})
+            except Exception as e:
+                logger.error("Architecture streaming error: %s", e)
+                yield sse_event("error", {"detail": f"Failed to generate response: {str(e)}"})
+                return
+        
+        cached = await safe_cache_get(cache, cache_key)
+        if cached:
+            yield sse_event("chunk", {"content": cached})
+            yield sse_event("done", {"cached": True})
+            return
+        
+        try:
+            async for event_id, chunk in shared_stream(streams, cache_key, produce):
+                yield sse_event("chunk", {"content": chunk}, event_id)
+        except Exception as e:
+            logger.error("Architecture streaming error: %s", e)
+            yield sse_event("error", {"detail": f"Failed to generate response: {str(e)}"})
+            return
+        
+        yield sse_event("done", {"cached": False})
+    
+    return sse_response(events())
+
+
 @router.post("/chat/ui", response_model=UIResearchResponse)
 async def ui_research_chat(
     request: UIResearchRequest,
+    http_request: Request,
     cache: Optional[CacheService] = Depends(get_cache),
 ):
-    cache_key = f"ui:{hash(request.prompt)}"
+    cache_key = make_cache_key("ui", request.prompt)
     cached = await safe_cache_get(cache, cache_key)
     if cached:
         try:
@@ -80,75 +205,393 @@ async def ui_research_chat(
     
     try:
         agent = UIResearchAgent()
-        response = await agent.research(request.prompt, request.industry)
+        response = await cancel_on_disconnect(http_request, agent.research(request.prompt, request.industry))
         
         await safe_cache_set(cache, cache_key, response.model_dump_json(), get_settings().cache_ttl)
         return response
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"UI research error: {e}")
+        logger.error("UI research error: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to generate response: {str(e)}")
 
 
+def ui_research_events(response: UIResearchResponse):
+    """The SSE events /chat/ui/stream would have sent for a complete response"""
+    yield "content", None, response.content
+    for index, palette in enumerate(response.color_palettes):
+        yield "color_palettes", index, palette
+    yield "fonts", None, response.fonts
+    for field in ("inspirations", "design_principles", "image_suggestions"):
+        for index, value in enumerate(getattr(response, field)):
+            yield field, index, value
+
+
+@router.post("/chat/ui/stream")
+async def ui_research_chat_stream(
+    request: UIResearchRequest,
+    cache: Optional[CacheService] = Depends(get_cache),
+):
+    cache_key = make_cache_key("ui", request.prompt)
+    
+    def event(field: str, index: Optional[int], value) -> str:
+        if hasattr(value, "model_dump"):
+            value = value.model_dump()
+        return sse_event(field, {"index": index, "value": value})
+    
+    async def events():
+        cached = await safe_cache_get(cache, cache_key)
+        if cached:
+            try:
+                response = UIResearchResponse.model_validate_json(cached)
+                for item in ui_research_events(response):
+                    yield event(*item)
+                yield sse_event("done", {"cached": True})
+                return
+            except Exception:
+                pass  # Continue to generate new response
+        
+        try:
+            agent = UIResearchAgent()
+            async for field, index, value in agent.stream_research(request.prompt, request.industry):
+                if field == "done":
+                    await safe_cache_set(cache, cache_key, value.model_dump_json(), get_settings().cache_ttl)
+                    yield sse_event("done", {"cached": False, "response": value.model_dump()})
+                else:
+                    yield event(field, index, value)
+        except Exception as e:
+            logger.error("UI research streaming error: %s", e)
+            yield sse_event("error", {"detail": f"Failed to generate response: {str(e)}"})
+    
+    return sse_response(events())
+
+
 @router.post("/chat/database", response_model=ChatResponse)
 async def database_chat(
     request: ChatRequest,
+    http_request: Request,
     cache: Optional[CacheService] = Depends(get_cache),
     kb = Depends(get_knowledge_base),
 ):
-    cache_key = f"db:{hash(request.prompt)}"
+    cache_key = make_cache_key("database", request.prompt)
     cached = await safe_cache_get(cache, cache_key)
     if cached:
         return ChatResponse(content=cached, cached=True)
     
     try:
         agent = ArchitectureAgent(knowledge_base=kb)
-        response = await agent.generate_database_schema(request.prompt)
+        response = await cancel_on_disconnect(http_request, agent.generate_database_schema(request.prompt))
         
         await safe_cache_set(cache, cache_key, response, get_settings().cache_ttl)
         return ChatResponse(content=response, cached=False)
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Database schema generation error: {e}")
+        logger.error("Database schema generation error: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to generate response: {str(e)}")
 
 
 @router.post("/chat/api", response_model=ChatResponse)
 async def api_design_chat(
     request: ChatRequest,
+    http_request: Request,
     cache: Optional[CacheService] = Depends(get_cache),
     kb = Depends(get_knowledge_base),
 ):
-    cache_key = f"api:{hash(request.prompt)}"
+    cache_key = make_cache_key("api", request.prompt)
     cached = await safe_cache_get(cache, cache_key)
     if cached:
         return ChatResponse(content=cached, cached=True)
     
     try:
         agent = ArchitectureAgent(knowledge_base=kb)
-        response = await agent.generate_api_design(request.prompt)
+        response = await cancel_on_disconnect(http_request, agent.generate_api_design(request.prompt))
         
         await safe_cache_set(cache, cache_key, response, get_settings().cache_ttl)
         return ChatResponse(content=response, cached=False)
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"API design generation error: {e}")
+        logger.error("API design generation error: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to generate response: {str(e)}")
 
 
 @router.post("/chat/prompts", response_model=ChatResponse)
 async def prompts_chat(
     request: ChatRequest,
+    http_request: Request,
     cache: Optional[CacheService] = Depends(get_cache),
 ):
-    cache_key = f"prompts:{hash(request.prompt)}"
+    cache_key = make_cache_key("prompts", request.prompt)
     cached = await safe_cache_get(cache, cache_key)
     if cached:
         return ChatResponse(content=cached, cached=True)
     
     try:
         agent = ArchitectureAgent()
-        response = await agent.generate_prompt_template(request.prompt)
+        response = await cancel_on_disconnect(http_request, agent.generate_prompt_template(request.prompt))
         
         await safe_cache_set(cache, cache_key, response, get_settings().cache_ttl)
         return ChatResponse(content=response, cached=False)
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Prompt template generation error: {e}")
+        logger.error("Prompt template generation error: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to generate response: {str(e)}")
+
+
+@router.post("/chat/refine", response_model=ChatResponse)
+async def refine_section(
+    request: RefineRequest,
+    http_request: Request,
+    cache: Optional[CacheService] = Depends(get_cache),
+):
+    category = request.category.value
+    if category not in MARKDOWN_CATEGORIES:
+        raise HTTPException(status_code=400, detail=f"Category '{category}' has no markdown sections to refine")
+    
+    ttl = get_settings().cache_ttl
+    cache_key = make_cache_key(category, request.prompt)
+    source_key = cache_key if request.version is None else f"{cache_key}:v{request.version}"
+    document = request.content or await safe_cache_get(cache, source_key)
+    if not document:
+        raise HTTPException(status_code=404, detail="No document to refine: generate it first or pass its content")
+    
+    try:
+        agent = ArchitectureAgent()
+        refined, section = await cancel_on_disconnect(
+            http_request,
+            agent.refine_section(category, request.prompt, document, request.section, request.instructions),
+        )
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Section refinement error: %s", e)
+        raise HTTPException(status_code=500, detail=f"Failed to generate response: {str(e)}")
+    
+    # Refinements of client-supplied content are returned as-is: the shared key
+    # and its history only ever hold documents this server generated.
+    version = None
+    if request.content:
+        return ChatResponse(content=refined, cached=False, metadata={"version": version, "section": section.title})
+    
+    # Every refinement is kept as <key>:v<n>; the plain key always holds the latest
+    if cache:
+        try:
+            version = await cache.incr(f"{cache_key}:version", ttl=ttl)
+            if version == 1 and request.version is None:
+                await cache.set(f"{cache_key}:v0", document, ttl=ttl)
+            if version is not None:
+                await cache.set(f"{cache_key}:v{version}", refined, ttl=ttl)
+        except Exception as e:
+            logger.warning("Cache version error: %s", e)
+    await safe_cache_set(cache, cache_key, refined, ttl)
+    
+    return ChatResponse(content=refined, cached=False, metadata={"version": version, "section": section.title})
+
+
+@router.post("/chat/batch")
+async def batch_chat(
+    request: BatchRequest,
+    cache: Optional[CacheService] = Depends(get_cache),
+    kb = Depends(get_knowledge_base),
+):
+    settings = get_settings()
+    runner = BatchRunner(
+        cache=cache,
+        knowledge_base=kb,
+        max_concurrency=settings.batch_max_concurrency,
+        cache_ttl=settings.cache_ttl,
+    )
+    items = [item.model_dump(mode="json") for item in request.requests]
+    
+    async def lines():
+        async for line in runner.run(items):
+            yield json.dumps(line) + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.post("/chat/design")
+async def full_design_chat(
+    request: DesignRequest,
+    cache: Optional[CacheService] = Depends(get_cache),
+    kb = Depends(get_knowledge_base),
+):
+    categories = list(dict.fromkeys(c.value for c in request.categories))
+    runner = BatchRunner(
+        cache=cache,
+        knowledge_base=SharedRetrieval(kb) if kb else None,
+        max_concurrency=len(categories),
+        cache_ttl=get_settings().cache_ttl,
+    )
+    items = [
+        {
+            "category": category,
+            "prompt": request.prompt,
+            "context": request.context,
+            "industry": request.industry,
+            "sectioned": request.sectioned and category == "architecture",
+        }
+        for category in categories
+    ]
+    
+    async def events():
+        async for line in runner.run(items):
+            if line["status"] == "succeeded":
+                yield sse_event("result", {"category": line["category"], **line["result"]})
+            else:
+                yield sse_event("error", {"category": line["category"], "detail": line["error"]})
+        yield sse_event("done", {"categories": categories})
+    
+    return sse_response(events())
+
+
+@router.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket):
+    """Bidirectional chat channel.
+    
+    Client messages:
+        {"type": "generate", "id": "...", "category": "...", "prompt": "...", ...}
+        {"type": "cancel", "id": "..."}
+        {"type": "ping"}
+    
+    Server messages carry the same id: "chunk" (markdown categories),
+    "result" (ui), "done", "error" and "cancelled".
+    """
+    await websocket.accept()
+    cache = getattr(websocket.app.state, 'cache', None)
+    kb = getattr(websocket.app.state, 'knowledge_base', None)
+    streams = getattr(websocket.app.state, 'streams', None)
+    readiness = getattr(websocket.app.state, 'readiness', None)
+    cache_ttl = get_settings().cache_ttl
+    tasks: Dict[str, asyncio.Task] = {}
+    send_lock = asyncio.Lock()
+    
+    async def send(message: Dict[str, Any]):
+        async with send_lock:
+            await websocket.send_json(message)
+    
+    async def generate(message_id: str, request: JobRequest):
+        category = request.category.value
+        cache_key = make_cache_key(category, request.prompt)
+        try:
+            cached = await safe_cache_get(cache, cache_key)
+            if category not in MARKDOWN_CATEGORIES:
+                if cached:
+                    result = {**json.loads(cached), "cached": True}
+                else:
+                    response = await generate_for_category(category, request.prompt, industry=request.industry)
+                    await safe_cache_set(cache, cache_key, response.model_dump_json(), cache_ttl)
+                    result = response.model_dump()
+                await send({"type": "result", "id": message_id, "result": result})
+                await send({"type": "done", "id": message_id, "cached": bool(cached)})
+                return
+            
+            if cached:
+                await send({"type": "chunk", "id": message_id, "content": cached})
+                await send({"type": "done", "id": message_id, "cached": True})
+                return
+            
+            async def produce():
+                parts = []
+                async for chunk in stream_category(
+                    category,
+                    request.prompt,
+                    request.context,
+                    sectioned=request.sectioned,
+                    knowledge_base=kb,
+                ):
+                    parts.append(chunk)
+                    yield chunk
+                await safe_cache_set(cache, cache_key, "".join(parts), cache_ttl)
+            
+            # WebSocket clients never resume by event id: a cancel or disconnect ends the generation
+            async for _, chunk in shared_stream(streams, cache_key, produce, resumable=False):
+                await send({"type": "chunk", "id": message_id, "content": chunk})
+            await send({"type": "done", "id": message_id, "cached": False})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("WebSocket generation error (%s): %s", category, e)
+            try:
+                await send({"type": "error", "id": message_id, "detail": f"Failed to generate response: {str(e)}"})
+            except Exception:
+                pass
+        finally:
+            tasks.pop(message_id, None)
+    
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+                message_type = message.get("type")
+            except (ValueError, AttributeError):
+                await send({"type": "error", "detail": "Messages must be JSON objects"})
+                continue
+            message_id = str(message.get("id") or uuid.uuid4().hex)
+            
+            if message_type == "generate":
+                if readiness is not None and readiness.draining:
+                    await send({"type": "error", "id": message_id, "detail": "Server is shutting down, retry on another connection"})
+                    continue
+                if message_id in tasks:
+                    await send({"type": "error", "id": message_id, "detail": "A generation with this id is already running"})
+                    continue
+                try:
+                    request = JobRequest.model_validate(message)
+                except ValidationError as e:
+                    await send({"type": "error", "id": message_id, "detail": e.errors(include_url=False)})
+                    continue
+                tasks[message_id] = asyncio.create_task(generate(message_id, request))
+            elif message_type == "cancel":
+                task = tasks.pop(message_id, None)
+                if task is None:
+                    await send({"type": "error", "id": message_id, "detail": "No running generation with this id"})
+                    continue
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await send({"type": "cancelled", "id": message_id})
+            elif message_type == "ping":
+                await send({"type": "pong"})
+            else:
+                await send({"type": "error", "id": message_id, "detail": f"Unknown message type: {message_type}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Abandoned generations stop consuming provider quota and threads
+        running = list(tasks.values())
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+
+@router.post("/jobs", response_model=JobResponse, status_code=202)
+async def create_job(
+    request: JobRequest,
+    jobs: Optional[JobService] = Depends(get_jobs),
+):
+    if jobs is None or not jobs.accepting:
+        raise HTTPException(status_code=503, detail="Job service unavailable")
+    job = await jobs.submit(request.category.value, request.model_dump(exclude={"category"}))
+    return JobResponse(**job)
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: str,
+    jobs: Optional[JobService] = Depends(get_jobs),
+):
+    if jobs is None:
+        raise HTTPException(status_code=503, detail="Job service unavailable")
+    job = await jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobResponse(**job)
+
+
+@router.get("/llm/endpoints")
+async def llm_endpoints():
+    return llm_service.endpoint_stats()
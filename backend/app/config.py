@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
-from typing import List
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -10,29 +10,161 @@ class Settings(BaseSettings):
     cors_origins: str = "http://localhost:8080,http://localhost:5173,http://localhost:3000"
     cache_ttl: int = 3600
     
+    # LLM backend: "gemini", or "fake" for the deterministic offline provider
+    llm_provider: str = "gemini"
+    
     # Gemini API settings
     gemini_api_key: str = ""
     gemini_model: str = "gemini-2.5-flash"
     
+    # Endpoint pool: extra keys/models (comma-separated). Every key is paired
+    # with every model; gemini_api_key and gemini_model are always included.
+    gemini_api_keys: str = ""
+    gemini_models: str = ""
+    llm_routing_strategy: str = "least_outstanding"  # or "ewma_latency"
+    llm_endpoint_max_concurrency: int = 8
+    llm_endpoint_rate_per_minute: float = 60.0
+    llm_endpoint_burst: int = 10
+    llm_endpoint_cooldown: float = 30.0  # seconds an endpoint is skipped after a 429
+    
+    # Retries, hedging and circuit breaking for LLM calls
+    llm_retry_attempts: int = 3
+    llm_retry_initial_backoff: float = 1.0
+    llm_retry_max_backoff: float = 20.0
+    llm_retry_jitter: float = 1.0
+    llm_hedge_enabled: bool = True
+    llm_hedge_initial_delay: float = 15.0  # used until enough first-token samples exist for a p95
+    llm_hedge_min_delay: float = 2.0
+    llm_breaker_failure_threshold: int = 5
+    llm_breaker_recovery_timeout: float = 30.0
+    
+    # Fake provider (LLM_PROVIDER=fake) for load testing without quota
+    fake_llm_profile: str = "realistic"  # instant, fast, realistic, degraded
+    fake_llm_endpoints: int = 1
+    fake_llm_response_words: int = 1500
+    fake_llm_seed: int = 0
+    # Optional overrides of the chosen profile
+    fake_llm_first_token_latency: Optional[float] = None
+    fake_llm_tokens_per_second: Optional[float] = None
+    fake_llm_error_rate: Optional[float] = None
+    fake_llm_tail_probability: Optional[float] = None
+    fake_llm_tail_delay: Optional[float] = None
+    
     # Embedding model (local)
     embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
+    # Set by the pre-fork launcher (run.py --workers N): shared index files and embedding sidecar
+    kb_index_path: str = ""  # workers map <path>.npy/.json read-only instead of re-embedding
+    embedding_sidecar_address: str = ""  # host:port of the shared embedding process
+    embedding_sidecar_authkey: str = ""
     
     # Generation settings
-    max_new_tokens: int = 65536  # Maximum for comprehensive responses
+    max_new_tokens: Optional[int] = None  # output cap for calls that don't set one; unset lets the model use its own maximum
     temperature: float = 0.7
     
+    # Provider-side context caching for the static system prompts
+    prompt_cache_enabled: bool = True
+    prompt_cache_ttl: int = 3600  # seconds a cached prefix lives on the provider
+    prompt_cache_refresh_margin: int = 300  # refresh this many seconds before expiry
+    
+    # Sectioned architecture generation: concurrent section calls
+    sectioned_max_parallel: int = 4
+    # Output cap per section: ~3000 words, far above a section's share of a 1500-2000
+    # word document, but one runaway section can't hold up the sections after it
+    sectioned_max_tokens: int = 4096
+    
+    # Ask the provider for schema-constrained JSON on UI research (Gemini response_schema)
+    ui_structured_output: bool = True
+    
+    # Background generation jobs
+    job_backend: str = "memory"  # memory (in-process asyncio queue) or redis (shared across workers)
+    job_workers: int = 2
+    job_result_ttl: int = 86400  # seconds job status and results are kept
+    job_partial_flush_interval: float = 1.0  # seconds between partial-output saves
+    
+    # Batch generation
+    batch_max_concurrency: int = 4  # LLM calls in flight per batch request
+    
+    # Shared streams: one in-flight generation per cache key, fanned out to every client
+    stream_backend: str = "memory"  # "memory" (per process) or "redis" (across workers)
+    stream_buffer_chunks: int = 2048  # ring buffer size for late joiners
+    stream_buffer_bytes: int = 1_000_000  # per generation, memory backend
+    stream_retention: int = 300  # seconds a finished stream stays resumable
+    stream_orphan_grace: float = 10.0  # seconds a generation every SSE client left waits for one to resume before it is cancelled
+    stream_owner_lease: int = 30  # seconds; renewed while the owning worker produces
+    
+    # Warm-up: knowledge-base routes wait this long for the index, then answer without retrieval
+    kb_ready_timeout: float = 2.0
+    
+    # Server runner (run.py): development (reload, one process) or production
+    server_profile: str = "development"
+    server_host: str = "0.0.0.0"
+    server_port: int = 8000
+    # Optional overrides of the chosen profile
+    server_workers: Optional[int] = None  # production default: one per available CPU (affinity and cgroup quota)
+    server_keep_alive: Optional[int] = None  # seconds an idle keep-alive connection stays open
+    server_backlog: Optional[int] = None  # pending connections queued by the kernel
+    server_limit_concurrency: Optional[int] = None  # per worker; beyond it requests get 503
+    server_graceful_timeout: Optional[int] = None  # seconds to finish requests on shutdown
+    server_pre_stop_delay: Optional[float] = None  # seconds reporting not-ready, still serving, after SIGTERM
+    
+    # Shutdown: seconds background jobs and shared generations get to finish before being interrupted
+    shutdown_grace_period: float = 20.0
+    
+    # Prometheus metrics at /metrics
+    metrics_enabled: bool = True
+    metrics_multiprocess_dir: str = ""  # shared by worker processes so /metrics covers all of them; set by run.py with --workers > 1
+    metrics_flush_interval: float = 5.0  # seconds between each worker's snapshot writes to that directory
+    
+    # Logging: records go through a queue to a background writer thread
+    log_level: str = "INFO"
+    log_format: str = "json"  # json (one object per line) or text
+    log_sample_rates: str = ""  # e.g. "app.services.cache=0.1,app.trace=0.25"; INFO and below only
+    log_queue_size: int = 10000  # records beyond this are dropped rather than block
+    
+    # Request tracing: X-Request-ID and Server-Timing on every response
+    trace_export: str = "none"  # none, log (one JSON line per request) or otlp
+    trace_slow_threshold_ms: float = 0.0  # only export traces at least this slow
+    otlp_endpoint: str = "http://localhost:4318/v1/traces"  # OTLP/HTTP JSON collector
+    
+    # Event-loop lag metric and blocked-loop stack capture
+    loop_monitor_enabled: bool = True
+    loop_lag_interval_ms: float = 100.0
+    loop_block_threshold_ms: float = 250.0
+    loop_debug_slow_callback_ms: float = 0.0  # >0: asyncio debug mode, flags loop callbacks slower than this
+    
+    # Admin endpoints (/admin/profile, /admin/loop); disabled while empty
+    admin_token: str = ""
+    profiler_interval_ms: float = 5.0
+    profiler_max_seconds: float = 60.0
+    
+    # Startup budget enforced by profile_imports.py
+    import_time_budget_ms: float = 1500.0
+    
     # Request timeout
     request_timeout: int = 300  # 5 minutes for long responses
 
     @property
     def cors_origins_list(self) -> List[str]:
         return [origin.strip() for origin in self.cors_origins.split(",")]
+    
+    @property
+    def gemini_api_keys_list(self) -> List[str]:
+        return _merge_list(self.gemini_api_key, self.gemini_api_keys)
+    
+    @property
+    def gemini_models_list(self) -> List[str]:
+        return _merge_list(self.gemini_model, self.gemini_models)
 
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
 
 
+def _merge_list(primary: str, extra: str) -> List[str]:
+    items = [primary.strip()] + [item.strip() for item in extra.split(",")]
+    return list(dict.fromkeys(item for item in items if item))
+
+
 @lru_cache()
 def get_settings() -> Settings:
     return Settings()
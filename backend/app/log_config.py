@@ -0,0 +1,180 @@
+from typing import Optional, Dict
+from datetime import datetime, timezone
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+
+from app.config import Settings
+from app.services.metrics import REGISTRY, Gauge
+from app.services.tracing import current_request_id
+
+LOG_FORMATS = ("json", "text")
+
+# LogRecord attributes; anything else on a record came from `extra=` and is emitted as a field
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "request_id", "color_message",
+}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _extras(record: logging.LogRecord) -> Dict[str, object]:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS and not key.startswith("_")}
+
+
+def _json_default(value):
+    # Objects passed via `extra=` are serialized here, on the listener thread
+    to_dict = getattr(value, "to_dict", None)
+    return to_dict() if callable(to_dict) else str(value)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, request_id, exception and `extra=` fields"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        entry.update(_extras(record))
+        return json.dumps(entry, default=_json_default, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines for development; `extra=` fields are appended as JSON"""
+    
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        extras = _extras(record)
+        if extras:
+            text += " " + json.dumps(extras, default=_json_default, ensure_ascii=False)
+        return text
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of INFO-and-below records per logger prefix; warnings and errors always pass"""
+    
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # Longest prefix first so `app.services.cache` overrides `app.services`
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + "."):
+                return rate >= 1.0 or random.random() < rate
+        return True
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps the request id while still in the request's context (formatting happens later, elsewhere)"""
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = current_request_id()
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread unformatted and drops them when the queue is full.
+
+    The stdlib QueueHandler formats the message in the caller; here `msg % args`,
+    exception formatting and the write all happen on the listener thread.
+    """
+    
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """`app.services.cache=0.1,app.trace=0.5` -> {"app.services.cache": 0.1, "app.trace": 0.5}"""
+    rates = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        name, rate = item.split("=", 1)
+        try:
+            rates[name.strip()] = max(0.0, min(1.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+def configure_logging(settings: Settings):
+    """Route every log record through a queue to one background writer thread.
+
+    Replaces the root logger's handlers; uvicorn's loggers are pointed at the
+    same pipeline. Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+    
+    log_format = settings.log_format if settings.log_format in LOG_FORMATS else "json"
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if log_format == "json" else TextFormatter())
+    
+    log_queue: queue.Queue = queue.Queue(maxsize=settings.log_queue_size)
+    handler = NonBlockingQueueHandler(log_queue)
+    rates = parse_sample_rates(settings.log_sample_rates)
+    if rates:
+        handler.addFilter(SamplingFilter(rates))
+    handler.addFilter(RequestContextFilter())
+    
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(settings.log_level.upper())
+    REGISTRY.register(Gauge(
+        "promptcraft_log_records_dropped", "Log records dropped because the logging queue was full",
+        collect=lambda: {(): handler.dropped},
+    ))
+    
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        if name == "uvicorn.access" and not uvicorn_logger.propagate and not uvicorn_logger.handlers:
+            # uvicorn's access_log=False (the production profile) leaves it like this; keep it off
+            continue
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+    
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    if log_format != settings.log_format:
+        logging.getLogger(__name__).warning("Unknown LOG_FORMAT '%s', using json", settings.log_format)
+
+
+def stop_logging():
+    """Flush queued records; registered with atexit"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
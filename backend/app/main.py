@@ -1,15 +1,33 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Header
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import logging
+import time
 
 from app.config import get_settings
+from app.log_config import configure_logging
 from app.api.routes import router as api_router
 from app.services.cache import CacheService
 from app.services.knowledge_base import KnowledgeBaseService
+from app.services.jobs import JobService
+from app.services.stream_hub import create_stream_hub
+from app.services.readiness import Readiness, on_shutdown_signal
+from app.services.tracing import TracingMiddleware, create_trace_exporter
+from app.services.loop_monitor import LoopMonitor
+from app.services.profiler import PROFILE_FORMATS, PROFILES, Profile, ProfilerMiddleware, StackSampler, admin_authorized
 from app.services.llm import llm_service
+from app.services.metrics import (
+    JOB_QUEUE_DEPTH,
+    REGISTRY,
+    Gauge,
+    InstrumentedExecutor,
+    MetricsMiddleware,
+    register_executor,
+)
 
-logging.basicConfig(level=logging.INFO)
+configure_logging(get_settings())
 logger = logging.getLogger(__name__)
 
 
@@ -20,14 +38,41 @@ async def lifespan(app: FastAPI):
     logger.info("=" * 50)
     logger.info("Starting PromptCraft AI Backend (Gemini)")
     logger.info("=" * 50)
+    logger.info(f"LLM Provider: {llm_service.provider_name}")
     logger.info(f"Gemini Model: {settings.gemini_model}")
     
-    try:
-        await llm_service.initialize()
-        logger.info("✓ Gemini LLM service initialized")
-    except Exception as e:
-        logger.error(f"✗ Failed to initialize Gemini: {e}")
-        logger.info("Please check your GEMINI_API_KEY in .env")
+    readiness = Readiness()
+    app.state.readiness = readiness
+    app.state.trace_exporter = create_trace_exporter(settings)
+    
+    # Embedding, index builds and SDK calls run here; instrumented for utilization metrics
+    executor = InstrumentedExecutor(thread_name_prefix="promptcraft")
+    asyncio.get_running_loop().set_default_executor(executor)
+    register_executor(executor)
+    
+    # With several workers each one publishes its metrics for whichever worker /metrics hits
+    metrics_flush = None
+    if settings.metrics_enabled and settings.metrics_multiprocess_dir:
+        async def flush_metrics():
+            loop = asyncio.get_running_loop()
+            while True:
+                try:
+                    await loop.run_in_executor(None, REGISTRY.write_snapshot, settings.metrics_multiprocess_dir)
+                except OSError as e:
+                    logger.warning(f"Could not write metrics snapshot: {e}")
+                await asyncio.sleep(settings.metrics_flush_interval)
+        
+        metrics_flush = asyncio.create_task(flush_metrics())
+    
+    app.state.loop_monitor = None
+    if settings.loop_monitor_enabled:
+        app.state.loop_monitor = LoopMonitor(
+            asyncio.get_running_loop(),
+            interval=settings.loop_lag_interval_ms / 1000,
+            block_threshold=settings.loop_block_threshold_ms / 1000,
+            slow_callback=settings.loop_debug_slow_callback_ms / 1000,
+        )
+        app.state.loop_monitor.start()
     
     try:
         app.state.cache = CacheService(settings.redis_url)
@@ -36,22 +81,97 @@ async def lifespan(app: FastAPI):
         logger.warning(f"Cache service unavailable: {e}")
         app.state.cache = None
     
-    try:
-        app.state.knowledge_base = KnowledgeBaseService()
+    # Model and index warm-up runs in the background so the server starts
+    # accepting connections immediately; /health/ready reports progress.
+    async def warm_llm():
+        await llm_service.initialize()
+        if not llm_service.ready:
+            raise RuntimeError("LLM provider did not initialize; check GEMINI_API_KEY in .env")
+    
+    async def warm_embeddings():
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, llm_service.embeddings._load_model)
+    
+    app.state.knowledge_base = KnowledgeBaseService()
+    
+    async def warm_knowledge_base():
+        await readiness.wait("embeddings")
         await app.state.knowledge_base.initialize()
-        logger.info("✓ Knowledge base initialized")
+        if app.state.knowledge_base.last_error:
+            raise RuntimeError(app.state.knowledge_base.last_error)
+    
+    readiness.start("llm", warm_llm)
+    readiness.start("embeddings", warm_embeddings, required=False)
+    readiness.start("knowledge_base", warm_knowledge_base, required=False)
+    
+    try:
+        app.state.jobs = JobService.from_settings(settings)
+        app.state.jobs.start(cache=app.state.cache, knowledge_base=app.state.knowledge_base)
+        logger.info(f"✓ Job service initialized ({settings.job_backend})")
+    except Exception as e:
+        logger.warning(f"Job service unavailable: {e}")
+        app.state.jobs = None
+    
+    try:
+        app.state.streams = create_stream_hub(settings)
+        logger.info(f"✓ Stream hub initialized ({settings.stream_backend})")
     except Exception as e:
-        logger.warning(f"Knowledge base initialization error: {e}")
-        app.state.knowledge_base = None
+        logger.warning(f"Stream hub unavailable: {e}")
+        app.state.streams = None
+    
+    # Flipped on SIGTERM while the server still listens (the pre-stop window,
+    # see app.server), so load balancers see /health/ready fail before the
+    # listeners close; and again here for servers that skip that step
+    def begin_draining():
+        readiness.draining = True
+        if app.state.jobs:
+            app.state.jobs.stop_accepting()
+    
+    remove_shutdown_hook = on_shutdown_signal(begin_draining)
     
     logger.info("=" * 50)
-    logger.info("Backend ready! API available at /api/v1")
+    logger.info("Backend accepting requests at /api/v1 (warm-up continues in the background)")
     logger.info("=" * 50)
     
     yield
     
+    # Drain: stop taking new LLM work and give running jobs and shared
+    # generations the grace period before closing clients
+    remove_shutdown_hook()
+    begin_draining()
+    await readiness.stop()
+    deadline = time.monotonic() + settings.shutdown_grace_period
+    logger.info(f"Draining in-flight generations (up to {settings.shutdown_grace_period:.0f}s)")
+    if app.state.jobs:
+        left = await app.state.jobs.drain(deadline - time.monotonic())
+        if left:
+            logger.warning(f"{left} job(s) still running after the grace period; requeueing with partial output")
+    if app.state.streams:
+        left = await app.state.streams.drain(deadline - time.monotonic())
+        if left:
+            logger.warning(f"Cancelling {left} shared generation(s) still running after the grace period")
+    
+    if app.state.jobs:
+        await app.state.jobs.stop()
+    if app.state.streams:
+        await app.state.streams.close()
     if app.state.cache:
         await app.state.cache.close()
+    try:
+        await llm_service.close()
+    except Exception as e:
+        logger.warning(f"LLM service shutdown error: {e}")
+    if app.state.trace_exporter:
+        await app.state.trace_exporter.close()
+    if metrics_flush:
+        metrics_flush.cancel()
+        await asyncio.gather(metrics_flush, return_exceptions=True)
+        try:
+            REGISTRY.write_snapshot(settings.metrics_multiprocess_dir)
+        except OSError:
+            pass
+    if app.state.loop_monitor:
+        app.state.loop_monitor.stop()
     logger.info("Backend shutdown complete")
 
 
@@ -75,6 +195,17 @@ def create_app() -> FastAPI:
     
     app.include_router(api_router, prefix="/api/v1")
     
+    if settings.metrics_enabled:
+        app.add_middleware(MetricsMiddleware)
+    if settings.admin_token:
+        app.add_middleware(
+            ProfilerMiddleware,
+            admin_token=settings.admin_token,
+            interval=settings.profiler_interval_ms / 1000,
+        )
+    # Outermost, so the request id exists before profiling starts
+    app.add_middleware(TracingMiddleware, slow_threshold_ms=settings.trace_slow_threshold_ms)
+    
     return app
 
 
@@ -87,7 +218,119 @@ async def health_check():
     return {
         "status": "healthy",
         "service": "promptcraft-backend",
-        "llm": "gemini",
-        "model": settings.gemini_model,
+        "llm": llm_service.provider_name,
+        "model": settings.gemini_model if llm_service.provider_name == "gemini" else f"fake-{settings.fake_llm_profile}",
         "version": "1.0.0"
     }
+
+
+@app.get("/health/live")
+async def liveness():
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness_check():
+    report = app.state.readiness.report()
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
+
+
+def _llm_outstanding():
+    return {(e["name"],): e["outstanding"] for e in llm_service.endpoint_stats()["endpoints"]}
+
+
+REGISTRY.register(Gauge(
+    "promptcraft_llm_outstanding_requests", "LLM calls in flight per provider endpoint",
+    ("endpoint",), collect=_llm_outstanding,
+))
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    if not get_settings().metrics_enabled:
+        return PlainTextResponse("metrics disabled\n", status_code=404)
+    jobs = getattr(app.state, "jobs", None)
+    if jobs:
+        try:
+            JOB_QUEUE_DEPTH.set(await jobs.backend.queue_depth())
+        except Exception as e:
+            logger.warning(f"Could not read job queue depth: {e}")
+    directory = get_settings().metrics_multiprocess_dir
+    if directory:
+        text = await asyncio.get_running_loop().run_in_executor(None, REGISTRY.render_aggregate, directory)
+    else:
+        text = REGISTRY.render()
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+
+def _admin_error(token: str):
+    admin_token = get_settings().admin_token
+    if not admin_token:
+        return PlainTextResponse("not found\n", status_code=404)
+    if not admin_authorized(admin_token, token):
+        return PlainTextResponse("invalid admin token\n", status_code=403)
+    return None
+
+
+def _profile_response(profile: Profile, format: str):
+    if format == "speedscope":
+        return JSONResponse(
+            profile.speedscope(),
+            headers={"Content-Disposition": 'attachment; filename="profile.speedscope.json"'},
+        )
+    return PlainTextResponse(profile.collapsed())
+
+
+@app.post("/admin/profile", include_in_schema=False)
+async def profile_window(
+    seconds: float = 10.0,
+    format: str = "collapsed",
+    interval_ms: float = None,
+    idle: bool = False,
+    x_admin_token: str = Header(default=None),
+):
+    """Sample every thread for `seconds` and return the stacks"""
+    error = _admin_error(x_admin_token)
+    if error:
+        return error
+    settings = get_settings()
+    if format not in PROFILE_FORMATS:
+        return PlainTextResponse(f"format must be one of {', '.join(PROFILE_FORMATS)}\n", status_code=400)
+    if not PROFILES.claim():
+        return PlainTextResponse("a profile is already running\n", status_code=409)
+    seconds = max(0.1, min(seconds, settings.profiler_max_seconds))
+    interval = (interval_ms or settings.profiler_interval_ms) / 1000
+    try:
+        sampler = StackSampler(f"{seconds:g}s window", interval=max(interval, 0.001), include_idle=idle).start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile = sampler.stop()
+    finally:
+        PROFILES.release()
+    return _profile_response(profile, format)
+
+
+@app.get("/admin/profile/{request_id}", include_in_schema=False)
+async def request_profile(request_id: str, format: str = "collapsed", x_admin_token: str = Header(default=None)):
+    """Profile of a request sent with `X-Profile: 1`, by its X-Request-ID"""
+    error = _admin_error(x_admin_token)
+    if error:
+        return error
+    profile = PROFILES.get(request_id)
+    if profile is None:
+        return PlainTextResponse("no profile for that request on this worker\n", status_code=404)
+    if format not in PROFILE_FORMATS:
+        return PlainTextResponse(f"format must be one of {', '.join(PROFILE_FORMATS)}\n", status_code=400)
+    return _profile_response(profile, format)
+
+
+@app.get("/admin/loop", include_in_schema=False)
+async def loop_report(x_admin_token: str = Header(default=None)):
+    """Event-loop monitor settings and the stacks of recent blocking calls"""
+    error = _admin_error(x_admin_token)
+    if error:
+        return error
+    if not app.state.loop_monitor:
+        return PlainTextResponse("loop monitor disabled\n", status_code=404)
+    return app.state.loop_monitor.report()
@@ -21,6 +21,16 @@ class ArchitectureRequest(BaseModel):
     context: Optional[str] = None
     scale: Optional[str] = Field(default="large", description="small, medium, large, enterprise")
     requirements: Optional[List[str]] = None
+    sectioned: bool = Field(default=False, description="Generate sections concurrently from a shared outline")
+
+
+class RefineRequest(BaseModel):
+    category: CategoryType
+    prompt: str = Field(..., min_length=1, max_length=5000, description="Prompt the document was generated for")
+    section: str = Field(..., min_length=1, max_length=200, description="Section number (e.g. 3 or 3.2) or title")
+    instructions: str = Field(..., min_length=1, max_length=5000)
+    content: Optional[str] = Field(default=None, description="Document to refine; defaults to the cached answer. Results for supplied content are not cached")
+    version: Optional[int] = Field(default=None, ge=0, description="Refine this stored version instead of the latest")
 
 
 class UIResearchRequest(BaseModel):
@@ -52,6 +62,20 @@ class UIInspiration(BaseModel):
     url: Optional[str] = None
 
 
+class UIResearchOutput(BaseModel):
+    """JSON document the UI research model is asked to return.
+
+    Field order is generation order: the short structured fields come first so
+    they stream before the long markdown analysis.
+    """
+    color_palettes: List[ColorPalette]
+    fonts: FontRecommendation
+    inspirations: List[UIInspiration]
+    design_principles: List[str]
+    image_suggestions: List[str]
+    analysis: str
+
+
 class UIResearchResponse(BaseModel):
     content: str
     color_palettes: List[ColorPalette]
@@ -68,6 +92,45 @@ class ChatResponse(BaseModel):
     metadata: Optional[Dict[str, Any]] = None
 
 
+class DesignRequest(BaseModel):
+    prompt: str = Field(..., min_length=1, max_length=5000)
+    context: Optional[str] = None
+    industry: Optional[str] = None
+    categories: List[CategoryType] = Field(default_factory=lambda: list(CategoryType), min_length=1)
+    sectioned: bool = Field(default=False, description="Generate architecture sections concurrently")
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class JobRequest(BaseModel):
+    category: CategoryType
+    prompt: str = Field(..., min_length=1, max_length=5000)
+    context: Optional[str] = None
+    industry: Optional[str] = None
+    sectioned: bool = False
+
+
+class BatchRequest(BaseModel):
+    requests: List[JobRequest] = Field(..., min_length=1, max_length=100)
+
+
+class JobResponse(BaseModel):
+    id: str
+    category: CategoryType
+    status: JobStatus
+    partial: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
 class SystemArchitecture(BaseModel):
     name: str
     description: str
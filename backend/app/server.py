@@ -0,0 +1,171 @@
+from typing import Optional, Dict, Any
+from types import FrameType
+import asyncio
+import importlib.util
+import logging
+import os
+
+import uvicorn
+from uvicorn.supervisors import ChangeReload, Multiprocess
+
+from app.config import Settings
+from app.services.readiness import shutdown_signaled
+
+logger = logging.getLogger(__name__)
+
+# Uvicorn settings per runner profile. Production keeps idle connections open
+# longer than typical load-balancer idle timeouts (60s) so the balancer, not
+# the server, closes them, caps in-flight requests per worker so overload
+# becomes fast 503s instead of a growing queue, and skips the access log.
+# On SIGTERM it reports not-ready for `pre_stop_delay` seconds while still
+# serving, so the balancer stops routing here before the listeners close.
+SERVER_PROFILES: Dict[str, Dict[str, Any]] = {
+    "development": {
+        "reload": True,
+        "workers": 1,
+        "keep_alive": 5,
+        "backlog": 2048,
+        "limit_concurrency": None,
+        "graceful_timeout": None,
+        "pre_stop_delay": 0,
+        "access_log": True,
+    },
+    "production": {
+        "reload": False,
+        "workers": 0,  # one per available CPU, see available_cpus()
+        "keep_alive": 75,
+        "backlog": 4096,
+        "limit_concurrency": 1000,
+        "graceful_timeout": 30,
+        "pre_stop_delay": 5,
+        "access_log": False,
+    },
+}
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def _cgroup_cpu_quota() -> Optional[float]:
+    """CPUs allowed by the container's cgroup CPU quota (v2, then v1); None when unlimited"""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        return None if quota <= 0 or period <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus() -> int:
+    """CPUs this process can actually use: its affinity mask, capped by a cgroup quota.
+
+    os.cpu_count() reports the host's CPUs, which in a container or under
+    taskset can be many times what the workers get to run on.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS / Windows
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, int(quota))
+    return max(1, cpus)
+
+
+def server_options(settings: Settings, profile_name: str = None) -> Dict[str, Any]:
+    """Keyword arguments for `serve` (uvicorn.run's, plus pre_stop_delay) for the configured runner profile"""
+    profile_name = profile_name or settings.server_profile
+    if profile_name not in SERVER_PROFILES:
+        logger.warning(f"Unknown server profile '{profile_name}', using development")
+        profile_name = "development"
+    profile = dict(SERVER_PROFILES[profile_name])
+    overrides = {
+        "workers": settings.server_workers,
+        "keep_alive": settings.server_keep_alive,
+        "backlog": settings.server_backlog,
+        "limit_concurrency": settings.server_limit_concurrency,
+        "graceful_timeout": settings.server_graceful_timeout,
+        "pre_stop_delay": settings.server_pre_stop_delay,
+    }
+    profile.update({key: value for key, value in overrides.items() if value is not None})
+    
+    workers = profile["workers"] or available_cpus()
+    options = {
+        "host": settings.server_host,
+        "port": settings.server_port,
+        "workers": workers,
+        "reload": profile["reload"] and workers == 1,
+        "timeout_keep_alive": profile["keep_alive"],
+        "backlog": profile["backlog"],
+        "limit_concurrency": profile["limit_concurrency"],
+        "timeout_graceful_shutdown": profile["graceful_timeout"],
+        "pre_stop_delay": profile["pre_stop_delay"],
+        "access_log": profile["access_log"],
+        "log_level": "info",
+    }
+    if profile_name == "production":
+        # Fall back to the pure-Python implementations when the C extensions are missing
+        options["loop"] = "uvloop" if _installed("uvloop") else "asyncio"
+        options["http"] = "httptools" if _installed("httptools") else "h11"
+    return options
+
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn.Server that runs the app's shutdown hooks as soon as SIGTERM arrives.
+    
+    uvicorn closes its listeners before the lifespan shutdown runs, so the app
+    would never get to report not-ready while reachable. Here the hooks flip
+    readiness first and the actual exit waits `pre_stop_delay` seconds; a
+    second signal exits immediately.
+    """
+    
+    def __init__(self, config: uvicorn.Config, pre_stop_delay: float = 0.0):
+        super().__init__(config)
+        self.pre_stop_delay = pre_stop_delay
+        self._stopping = False
+    
+    def handle_exit(self, sig: int, frame: FrameType) -> None:
+        if self._stopping or self.pre_stop_delay <= 0:
+            if not self._stopping:
+                self._stopping = True
+                shutdown_signaled()
+            super().handle_exit(sig, frame)
+            return
+        self._stopping = True
+        shutdown_signaled()
+        logger.info(f"Shutdown requested; reporting not-ready for {self.pre_stop_delay:g}s before closing listeners")
+        asyncio.get_event_loop().call_later(self.pre_stop_delay, super().handle_exit, sig, frame)
+
+
+class ParallelStopMultiprocess(Multiprocess):
+    """Signals every worker before waiting on any, so pre-stop delays overlap instead of adding up"""
+    
+    def shutdown(self) -> None:
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        logger.info(f"Stopping parent process [{self.pid}]")
+
+
+def serve(app: str, options: Dict[str, Any]):
+    """uvicorn.run with DrainingServer in the single-process, reload and multi-worker modes"""
+    options = dict(options)
+    pre_stop_delay = options.pop("pre_stop_delay", 0) or 0
+    config = uvicorn.Config(app, **options)
+    server = DrainingServer(config, pre_stop_delay=pre_stop_delay)
+    if config.should_reload:
+        ChangeReload(config, target=server.run, sockets=[config.bind_socket()]).run()
+    elif config.workers > 1:
+        ParallelStopMultiprocess(config, target=server.run, sockets=[config.bind_socket()]).run()
+    else:
+        server.run()
@@ -1,6 +1,10 @@
-from typing import Optional, List
+from typing import Optional, List, AsyncIterator, Tuple
+import asyncio
+from app.config import get_settings
 from app.services.llm import llm_service
 from app.services.knowledge_base import KnowledgeBaseService
+from app.services.metrics import timed_stage
+from app.services.sections import Section, compact_outline, find_section, index_sections, splice_section
 
 ARCHITECTURE_SYSTEM_PROMPT = """You are an elite system architect with 20+ years of experience designing production-level distributed systems at companies like Amazon, Netflix, YouTube, Uber, Spotify, Google, Meta, and other tech giants. You have deep expertise in handling billions of requests per day and petabytes of data.
 
@@ -109,6 +113,24 @@ Explain each pattern with:
 - Provide specific numbers (QPS, latency, storage)
 - No vague or generic advice - be specific and actionable"""
 
+# Mandatory sections of ARCHITECTURE_SYSTEM_PROMPT, in document order. Used by
+# sectioned generation to write each section as a separate, parallel call.
+ARCHITECTURE_SECTIONS = [
+    "📋 EXECUTIVE SUMMARY",
+    "🏗️ SYSTEM ARCHITECTURE OVERVIEW",
+    "🔧 TECHNOLOGY STACK",
+    "📦 CORE COMPONENTS",
+    "💾 DATA ARCHITECTURE",
+    "🔄 DESIGN PATTERNS USED",
+    "📊 SCALABILITY & PERFORMANCE",
+    "🛡️ RELIABILITY & FAULT TOLERANCE",
+    "🔐 SECURITY ARCHITECTURE",
+    "📈 MONITORING & OBSERVABILITY",
+    "💰 COST ESTIMATION",
+    "🚀 IMPLEMENTATION ROADMAP",
+    "⚠️ TRADE-OFFS & ALTERNATIVES",
+]
+
 DATABASE_SYSTEM_PROMPT = """You are a world-class database architect with 15+ years of experience designing data systems for companies handling billions of records and petabytes of data (Amazon, Google, Netflix, Uber).
 
 ## YOUR MISSION
@@ -496,16 +518,33 @@ Follow-up prompts for refinement:
 - Add comments explaining key parts"""
 
 
+SYSTEM_PROMPTS = {
+    "architecture": ARCHITECTURE_SYSTEM_PROMPT,
+    "database": DATABASE_SYSTEM_PROMPT,
+    "api": API_SYSTEM_PROMPT,
+    "prompts": PROMPTS_SYSTEM_PROMPT,
+}
+
+
 class ArchitectureAgent:
     def __init__(self, knowledge_base: Optional[KnowledgeBaseService] = None):
         self.knowledge_base = knowledge_base
     
-    async def generate(self, prompt: str, context: Optional[str] = None) -> str:
-        kb_context = ""
-        if self.knowledge_base:
-            kb_context = await self.knowledge_base.get_architecture_context(prompt)
+    async def generate(
+        self,
+        prompt: str,
+        context: Optional[str] = None,
+        sectioned: bool = False,
+    ) -> str:
+        if sectioned:
+            sections = [section async for section in self.stream_sections(prompt, context)]
+            return "\n\n".join(sections)
         
-        full_prompt = f"""
+        full_prompt, system_prompt = await self._document_request("architecture", prompt, context)
+        return await llm_service.generate(prompt=full_prompt, system_prompt=system_prompt)
+    
+    def _architecture_prompt(self, prompt: str, context: Optional[str], kb_context: str) -> str:
+        return f"""
 User Request: {prompt}
 
 {f"Additional Context: {context}" if context else ""}
@@ -515,19 +554,163 @@ Reference Information from Knowledge Base:
 
 Based on the user's request and the reference architectures above, provide a comprehensive system architecture recommendation. Include specific technologies, design patterns, and scalability considerations.
 """
+
+    async def stream_sections(self, prompt: str, context: Optional[str] = None) -> AsyncIterator[str]:
+        """Generate the architecture document section by section.
         
-        return await llm_service.generate(
-            prompt=full_prompt,
+        A short outline of shared decisions is produced first, then every
+        section is written concurrently (bounded by sectioned_max_parallel)
+        with the outline as common context. Sections are yielded in document
+        order, each as soon as it and all earlier sections are complete.
+        """
+        kb_context = await self._architecture_context(prompt)
+        request_block = f"""
+User Request: {prompt}
+
+{f"Additional Context: {context}" if context else ""}
+
+Reference Information from Knowledge Base:
+{kb_context}
+"""
+
+        outline = await llm_service.generate(
+            prompt=f"""{request_block}
+Do NOT write the architecture document yet. Produce a compact outline (max 300 words) of the shared decisions every section must agree on:
+- Expected scale (users, QPS, data volume)
+- Chosen architecture style and core components (with names)
+- Technology choices per layer
+- Data stores and caching approach
+- Key trade-offs already decided
+Use terse bullet points only.
+""",
             system_prompt=ARCHITECTURE_SYSTEM_PROMPT,
+            max_tokens=1024,
         )
+        
+        settings = get_settings()
+        semaphore = asyncio.Semaphore(max(1, settings.sectioned_max_parallel))
+        
+        async def write_section(index: int, title: str) -> str:
+            async with semaphore:
+                body = await llm_service.generate(
+                    prompt=f"""{request_block}
+Shared Outline (all sections must stay consistent with it):
+{outline}
+
+Write ONLY section {index}. {title} of the architecture document, following the requirements for that section in the system instructions.
+Start directly with the section content - do not repeat the section heading and do not write any other section.
+""",
+                    system_prompt=ARCHITECTURE_SYSTEM_PROMPT,
+                    max_tokens=settings.sectioned_max_tokens,
+                )
+            return f"## {index}. {title}\n\n{_strip_leading_heading(body, title)}"
+        
+        tasks = [
+            asyncio.create_task(write_section(i, title))
+            for i, title in enumerate(ARCHITECTURE_SECTIONS, start=1)
+        ]
+        try:
+            for task in tasks:
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def _architecture_context(self, prompt: str) -> str:
+        if self.knowledge_base:
+            return await self.knowledge_base.get_architecture_context(prompt)
+        return ""
     
     async def generate_database_schema(self, prompt: str) -> str:
+        full_prompt, system_prompt = await self._document_request("database", prompt)
+        return await llm_service.generate(prompt=full_prompt, system_prompt=system_prompt)
+    
+    async def generate_api_design(self, prompt: str) -> str:
+        full_prompt, system_prompt = await self._document_request("api", prompt)
+        return await llm_service.generate(prompt=full_prompt, system_prompt=system_prompt)
+    
+    async def generate_prompt_template(self, prompt: str) -> str:
+        full_prompt, system_prompt = await self._document_request("prompts", prompt)
+        return await llm_service.generate(prompt=full_prompt, system_prompt=system_prompt)
+    
+    async def stream_document(
+        self,
+        category: str,
+        prompt: str,
+        context: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """Stream the markdown document for any category this agent handles"""
+        full_prompt, system_prompt = await self._document_request(category, prompt, context)
+        async for chunk in llm_service.stream(prompt=full_prompt, system_prompt=system_prompt):
+            yield chunk
+    
+    async def refine_section(
+        self,
+        category: str,
+        prompt: str,
+        document: str,
+        section_query: str,
+        instructions: str,
+    ) -> Tuple[str, Section]:
+        """Regenerate one ##/### section of a document and splice it back in.
+        
+        Only the target section is sent in full; the rest of the document goes
+        along as a compact outline so the rewrite stays consistent with it.
+        """
+        sections = index_sections(document)
+        section = find_section(sections, section_query)
+        if section is None:
+            raise LookupError(f"Section '{section_query}' not found")
+        
+        current = document[section.body_start:section.end].strip()
+        body = await llm_service.generate(
+            prompt=f"""
+User Request: {prompt}
+
+Outline of the rest of the document (keep consistent with it):
+{compact_outline(document, sections, section)}
+
+Current version of section "{section.title}":
+{current}
+
+Rewrite ONLY the section "{section.title}" following these instructions:
+{instructions}
+
+Start directly with the section content - do not repeat the section heading and do not write any other section.
+""",
+            system_prompt=SYSTEM_PROMPTS[category],
+        )
+        return splice_section(document, section, _strip_leading_heading(body, section.title)), section
+    
+    async def _document_request(
+        self,
+        category: str,
+        prompt: str,
+        context: Optional[str] = None,
+    ) -> Tuple[str, str]:
+        """(user prompt, system prompt) for a markdown category"""
         kb_context = ""
-        if self.knowledge_base:
+        if category == "architecture":
+            kb_context = await self._architecture_context(prompt)
+        elif category == "database" and self.knowledge_base:
             results = await self.knowledge_base.query(prompt, n_results=2)
             kb_context = "\n".join([r["content"] for r in results])
+        return self._build_document_request(category, prompt, context, kb_context)
+    
+    @timed_stage("prompt_build")
+    def _build_document_request(
+        self,
+        category: str,
+        prompt: str,
+        context: Optional[str],
+        kb_context: str,
+    ) -> Tuple[str, str]:
+        """String assembly only; knowledge-base retrieval is timed under its own stages"""
+        if category == "architecture":
+            return self._architecture_prompt(prompt, context, kb_context), ARCHITECTURE_SYSTEM_PROMPT
         
-        full_prompt = f"""
+        if category == "database":
+            return f"""
 User Request: {prompt}
 
 Reference Information:
@@ -539,15 +722,10 @@ Design a comprehensive database schema for this use case. Include:
 3. Indexes and constraints
 4. Query patterns and optimization
 5. Scaling strategy
-"""
-        
-        return await llm_service.generate(
-            prompt=full_prompt,
-            system_prompt=DATABASE_SYSTEM_PROMPT,
-        )
-    
-    async def generate_api_design(self, prompt: str) -> str:
-        full_prompt = f"""
+""", DATABASE_SYSTEM_PROMPT
+
+        if category == "api":
+            return f"""
 User Request: {prompt}
 
 Design a comprehensive API specification including:
@@ -557,15 +735,10 @@ Design a comprehensive API specification including:
 4. Error handling
 5. Pagination and filtering
 6. Rate limiting strategy
-"""
-        
-        return await llm_service.generate(
-            prompt=full_prompt,
-            system_prompt=API_SYSTEM_PROMPT,
-        )
-    
-    async def generate_prompt_template(self, prompt: str) -> str:
-        full_prompt = f"""
+""", API_SYSTEM_PROMPT
+
+        if category == "prompts":
+            return f"""
 User Request: {prompt}
 
 Create effective prompt templates for AI coding assistants that will help with this use case. Include:
@@ -573,9 +746,16 @@ Create effective prompt templates for AI coding assistants that will help with t
 2. Task-specific prompts
 3. Context setting examples
 4. Output format specifications
-"""
-        
-        return await llm_service.generate(
-            prompt=full_prompt,
-            system_prompt=PROMPTS_SYSTEM_PROMPT,
-        )
+""", PROMPTS_SYSTEM_PROMPT
+
+        raise ValueError(f"Unsupported category: {category}")
+
+
+def _strip_leading_heading(text: str, title: str) -> str:
+    """Drop a heading the model repeated at the top of a section"""
+    text = text.strip()
+    first_line, _, rest = text.partition("\n")
+    keyword = title.split(" ", 1)[-1].split(" ")[0].lower()
+    if first_line.lstrip().startswith("#") and keyword in first_line.lower():
+        return rest.strip()
+    return text
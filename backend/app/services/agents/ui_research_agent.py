@@ -1,8 +1,27 @@
-from typing import Optional, List
+from typing import Optional, List, Dict, Any, Tuple, AsyncIterator
 import json
+import logging
+from pydantic import ValidationError
+from app.config import get_settings
 from app.services.llm import llm_service
-from app.models.schemas import UIResearchResponse, ColorPalette, FontRecommendation, UIInspiration
-from app.knowledge.ui_knowledge import UI_INSPIRATIONS, INDUSTRY_PALETTES, FONT_PAIRINGS
+from app.services.json_stream import StreamingJSONObjectParser, parse_json_object
+from app.services.metrics import timed_stage
+from app.models.schemas import UIResearchResponse, UIResearchOutput, ColorPalette, FontRecommendation, UIInspiration
+
+logger = logging.getLogger(__name__)
+
+# (response field, index within a list field or None, validated value)
+UIResearchEvent = Tuple[str, Optional[int], Any]
+
+# Streamed JSON member -> UIResearchResponse field
+_RESPONSE_FIELDS = {
+    "analysis": "content",
+    "color_palettes": "color_palettes",
+    "fonts": "fonts",
+    "inspirations": "inspirations",
+    "design_principles": "design_principles",
+    "image_suggestions": "image_suggestions",
+}
 
 UI_RESEARCH_SYSTEM_PROMPT = """You are a world-class UI/UX designer and brand strategist with 15+ years of experience at top design agencies (IDEO, Pentagram, Frog Design) and tech companies (Apple, Airbnb, Stripe).
 
@@ -10,15 +29,15 @@ UI_RESEARCH_SYSTEM_PROMPT = """You are a world-class UI/UX designer and brand st
 Provide COMPREHENSIVE UI/UX research and recommendations that a design team could use to create a stunning, conversion-optimized interface. Your responses must be DETAILED, SPECIFIC, and ACTIONABLE.
 
 ## RESPONSE FORMAT (JSON)
-You MUST return a valid JSON object with this structure. Make the "analysis" field extremely detailed (1000+ words).
+You MUST return a valid JSON object with exactly this key order: the short structured fields first, then the "analysis" field last. Make the "analysis" field extremely detailed (1000+ words).
 
 {
-  "analysis": "YOUR DETAILED MARKDOWN ANALYSIS HERE - THIS MUST BE COMPREHENSIVE",
   "color_palettes": [...],
   "fonts": {...},
   "inspirations": [...],
   "design_principles": [...],
-  "image_suggestions": [...]
+  "image_suggestions": [...],
+  "analysis": "YOUR DETAILED MARKDOWN ANALYSIS HERE - THIS MUST BE COMPREHENSIVE"
 }
 
 ## ANALYSIS SECTION REQUIREMENTS (Mandatory Sections)
@@ -161,9 +180,40 @@ class UIResearchAgent:
         pass
     
     async def research(self, prompt: str, industry: Optional[str] = None) -> UIResearchResponse:
+        response = await llm_service.generate(
+            prompt=self._research_prompt(prompt, industry),
+            system_prompt=UI_RESEARCH_SYSTEM_PROMPT,
+            **self._output_options(),
+        )
+        
+        return self._parse_response(response)
+    
+    async def stream_research(self, prompt: str, industry: Optional[str] = None) -> AsyncIterator[UIResearchEvent]:
+        """Yield each palette, font set, inspiration, etc. as soon as the model
+        closes it, then ("done", None, UIResearchResponse) with the full result"""
+        parser = StreamingJSONObjectParser()
+        async for chunk in llm_service.stream(
+            prompt=self._research_prompt(prompt, industry),
+            system_prompt=UI_RESEARCH_SYSTEM_PROMPT,
+            **self._output_options(),
+        ):
+            for key, index, value in parser.feed(chunk):
+                event = self._validate_event(key, index, value)
+                if event:
+                    yield event
+        
+        yield "done", None, self._parse_response(parser.text, parser)
+    
+    def _output_options(self) -> Dict[str, Any]:
+        if get_settings().ui_structured_output:
+            return {"response_schema": UIResearchOutput}
+        return {}
+    
+    @timed_stage("prompt_build")
+    def _research_prompt(self, prompt: str, industry: Optional[str]) -> str:
         context = self._build_context(prompt, industry)
         
-        full_prompt = f"""
+        return f"""
 User Request: {prompt}
 
 Industry: {industry or "Not specified"}
@@ -180,15 +230,29 @@ Research and recommend UI design elements for this project. Consider:
 
 Provide your response in the specified JSON format.
 """
-        
-        response = await llm_service.generate(
-            prompt=full_prompt,
-            system_prompt=UI_RESEARCH_SYSTEM_PROMPT,
-        )
-        
-        return self._parse_response(response)
+
+    def _validate_event(self, key: str, index: Optional[int], value: Any) -> Optional[UIResearchEvent]:
+        field = _RESPONSE_FIELDS.get(key)
+        if field is None or (index is None and field not in ("content", "fonts")):
+            # Unknown member, or a list whose elements were already sent
+            return None
+        try:
+            if field == "color_palettes":
+                value = ColorPalette.model_validate(value)
+            elif field == "inspirations":
+                value = UIInspiration.model_validate(value)
+            elif field == "fonts":
+                value = self._fonts(value)
+            elif not isinstance(value, str):
+                return None
+        except (ValidationError, TypeError, AttributeError) as e:
+            logger.debug("Dropping invalid %s element: %s", key, e)
+            return None
+        return field, index, value
     
     def _build_context(self, prompt: str, industry: Optional[str]) -> str:
+        from app.knowledge.ui_knowledge import UI_INSPIRATIONS, INDUSTRY_PALETTES, FONT_PAIRINGS
+        
         context_parts = []
         
         prompt_lower = prompt.lower()
@@ -206,52 +270,67 @@ Provide your response in the specified JSON format.
         
         return "\n\n".join(context_parts) if context_parts else "No specific references found."
     
-    def _parse_response(self, response: str) -> UIResearchResponse:
+    @timed_stage("json_parse")
+    def _parse_response(self, response: str, parser: Optional[StreamingJSONObjectParser] = None) -> UIResearchResponse:
+        # Schema-constrained output decodes and validates in one pass
+        try:
+            output = UIResearchOutput.model_validate_json(response)
+        except ValidationError:
+            data = parser.partial() if parser else parse_json_object(response)
+            return self._build_response(data, response)
+        
+        return UIResearchResponse(
+            content=output.analysis or response,
+            color_palettes=output.color_palettes or [self._default_palette()],
+            fonts=output.fonts,
+            inspirations=output.inspirations,
+            design_principles=output.design_principles,
+            image_suggestions=output.image_suggestions,
+        )
+    
+    def _build_response(self, data: Dict[str, Any], response: str) -> UIResearchResponse:
+        """Response from decoded JSON members, keeping every valid element even
+        when the model's output was cut off; the raw text stands in for a
+        missing analysis"""
+        color_palettes = self._valid_items(ColorPalette, data.get("color_palettes"))
+        inspirations = self._valid_items(UIInspiration, data.get("inspirations"))
+        
         try:
-            start_idx = response.find("{")
-            end_idx = response.rfind("}") + 1
-            if start_idx != -1 and end_idx > start_idx:
-                json_str = response[start_idx:end_idx]
-                data = json.loads(json_str)
-                
-                color_palettes = [
-                    ColorPalette(**palette) for palette in data.get("color_palettes", [])
-                ]
-                
-                fonts_data = data.get("fonts", {})
-                fonts = FontRecommendation(
-                    heading=fonts_data.get("heading", "Inter"),
-                    body=fonts_data.get("body", "Inter"),
-                    accent=fonts_data.get("accent"),
-                    fallbacks=fonts_data.get("fallbacks", ["system-ui", "sans-serif"]),
-                )
-                
-                inspirations = [
-                    UIInspiration(**insp) for insp in data.get("inspirations", [])
-                ]
-                
-                return UIResearchResponse(
-                    content=data.get("analysis", response),
-                    color_palettes=color_palettes or [self._default_palette()],
-                    fonts=fonts,
-                    inspirations=inspirations,
-                    design_principles=data.get("design_principles", []),
-                    image_suggestions=data.get("image_suggestions", []),
-                )
-        except (json.JSONDecodeError, KeyError, TypeError):
-            pass
+            fonts = self._fonts(data.get("fonts") or {})
+        except (ValidationError, TypeError, AttributeError):
+            fonts = self._fonts({})
         
+        analysis = data.get("analysis")
         return UIResearchResponse(
-            content=response,
-            color_palettes=[self._default_palette()],
-            fonts=FontRecommendation(
-                heading="Inter",
-                body="Inter",
-                fallbacks=["system-ui", "sans-serif"],
-            ),
-            inspirations=[],
-            design_principles=[],
-            image_suggestions=[],
+            content=analysis if isinstance(analysis, str) and analysis else response,
+            color_palettes=color_palettes or [self._default_palette()],
+            fonts=fonts,
+            inspirations=inspirations,
+            design_principles=self._strings(data.get("design_principles")),
+            image_suggestions=self._strings(data.get("image_suggestions")),
+        )
+    
+    @staticmethod
+    def _valid_items(model, items: Any) -> List[Any]:
+        valid = []
+        for item in items if isinstance(items, list) else []:
+            try:
+                valid.append(model.model_validate(item))
+            except ValidationError:
+                continue
+        return valid
+    
+    @staticmethod
+    def _strings(items: Any) -> List[str]:
+        return [item for item in items if isinstance(item, str)] if isinstance(items, list) else []
+    
+    @staticmethod
+    def _fonts(fonts_data: Dict[str, Any]) -> FontRecommendation:
+        return FontRecommendation(
+            heading=fonts_data.get("heading", "Inter"),
+            body=fonts_data.get("body", "Inter"),
+            accent=fonts_data.get("accent"),
+            fallbacks=fonts_data.get("fallbacks", ["system-ui", "sans-serif"]),
         )
     
     def _default_palette(self) -> ColorPalette:
@@ -0,0 +1,143 @@
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
+import asyncio
+import json
+import logging
+
+from app.services.cache import CacheService, make_cache_key, safe_cache_set
+from app.services.generation import MARKDOWN_CATEGORIES, generate_for_category
+
+logger = logging.getLogger(__name__)
+
+# Categories whose agents query the knowledge base with the raw prompt
+RETRIEVAL_CATEGORIES = ("architecture", "database")
+
+# (category, prompt, context, industry, sectioned)
+BatchKey = Tuple[str, str, Optional[str], Optional[str], bool]
+
+
+def _batch_key(item: Dict[str, Any]) -> BatchKey:
+    return (
+        item["category"],
+        item["prompt"],
+        item.get("context"),
+        item.get("industry"),
+        bool(item.get("sectioned", False)),
+    )
+
+
+def _result(category: str, value: Any, cached: bool) -> Dict[str, Any]:
+    if category == "ui":
+        payload = json.loads(value) if isinstance(value, str) else value.model_dump()
+        return {**payload, "cached": cached}
+    return {"content": value, "cached": cached}
+
+
+class BatchRunner:
+    """Runs many category requests with one cache round trip and bounded LLM fan-out"""
+    
+    def __init__(
+        self,
+        cache: Optional[CacheService] = None,
+        knowledge_base=None,
+        max_concurrency: int = 4,
+        cache_ttl: int = 3600,
+    ):
+        self.cache = cache
+        self.knowledge_base = knowledge_base
+        self.max_concurrency = max(1, max_concurrency)
+        self.cache_ttl = cache_ttl
+    
+    async def run(self, items: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """Yield one result line per input item, in completion order.
+        
+        Identical items are generated once and reported under every index
+        that asked for them.
+        """
+        groups: Dict[BatchKey, List[int]] = {}
+        for index, item in enumerate(items):
+            groups.setdefault(_batch_key(item), []).append(index)
+        
+        keys = list(groups)
+        cached_values = await self._cache_get_many([make_cache_key(k[0], k[1]) for k in keys])
+        
+        pending: List[BatchKey] = []
+        for key, cached in zip(keys, cached_values):
+            if cached is None:
+                pending.append(key)
+                continue
+            try:
+                result = _result(key[0], cached, cached=True)
+            except ValueError:
+                pending.append(key)
+                continue
+            for line in self._lines(key, groups[key], "succeeded", result=result):
+                yield line
+        
+        if not pending:
+            return
+        
+        await self._prefetch_embeddings([k[1] for k in pending if k[0] in RETRIEVAL_CATEGORIES])
+        
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async def generate(key: BatchKey):
+            async with semaphore:
+                try:
+                    return key, await self._generate(key), None
+                except Exception as e:
+                    logger.error(f"Batch item ({key[0]}) failed: {e}")
+                    return key, None, f"Failed to generate response: {str(e)}"
+        
+        tasks = [asyncio.create_task(generate(key)) for key in pending]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                key, result, error = await next_done
+                status = "failed" if error else "succeeded"
+                for line in self._lines(key, groups[key], status, result=result, error=error):
+                    yield line
+        finally:
+            # The client went away: stop generating for it
+            for task in tasks:
+                task.cancel()
+    
+    async def _generate(self, key: BatchKey) -> Dict[str, Any]:
+        category, prompt, context, industry, sectioned = key
+        response = await generate_for_category(
+            category,
+            prompt,
+            context,
+            industry=industry,
+            sectioned=sectioned,
+            knowledge_base=self.knowledge_base if category in MARKDOWN_CATEGORIES else None,
+        )
+        value = response if category in MARKDOWN_CATEGORIES else response.model_dump_json()
+        await safe_cache_set(self.cache, make_cache_key(category, prompt), value, self.cache_ttl)
+        return _result(category, response, cached=False)
+    
+    @staticmethod
+    def _lines(
+        key: BatchKey,
+        indices: List[int],
+        status: str,
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        return [
+            {"index": index, "category": key[0], "status": status, "result": result, "error": error}
+            for index in indices
+        ]
+    
+    async def _prefetch_embeddings(self, prompts: List[str]):
+        if self.knowledge_base and prompts:
+            try:
+                await self.knowledge_base.prefetch_embeddings(prompts)
+            except Exception as e:
+                logger.warning(f"Batch embedding prefetch failed: {e}")
+    
+    async def _cache_get_many(self, keys: List[str]) -> List[Optional[str]]:
+        if self.cache:
+            try:
+                return await self.cache.get_many(keys)
+            except Exception as e:
+                logger.warning(f"Cache get error: {e}")
+        return [None] * len(keys)
@@ -1,6 +1,54 @@
 import redis.asyncio as redis
-from typing import Optional
+from typing import Optional, List
+import hashlib
 import json
+import logging
+
+from app.services.metrics import CACHE_REQUESTS, stage
+
+logger = logging.getLogger(__name__)
+
+# Cache key prefix per chat category
+CACHE_KEY_PREFIXES = {
+    "architecture": "arch",
+    "ui": "ui",
+    "database": "db",
+    "api": "api",
+    "prompts": "prompts",
+}
+
+
+def make_cache_key(category: str, prompt: str) -> str:
+    # sha256 rather than hash(): str hashes are salted per process, so keys
+    # built with hash() never match across workers or restarts
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:32]
+    return f"{CACHE_KEY_PREFIXES[category]}:{digest}"
+
+
+_PREFIX_CATEGORIES = {prefix: category for category, prefix in CACHE_KEY_PREFIXES.items()}
+
+
+def _record_lookup(key: str, hit: bool):
+    category = _PREFIX_CATEGORIES.get(key.split(":", 1)[0], "other")
+    CACHE_REQUESTS.inc(category, "hit" if hit else "miss")
+
+
+async def safe_cache_get(cache: Optional["CacheService"], key: str) -> Optional[str]:
+    """Cached value, or None when there is no cache or Redis fails"""
+    if cache:
+        try:
+            return await cache.get(key)
+        except Exception as e:
+            logger.warning("Cache get error: %s", e)
+    return None
+
+
+async def safe_cache_set(cache: Optional["CacheService"], key: str, value: str, ttl: int):
+    if cache:
+        try:
+            await cache.set(key, value, ttl=ttl)
+        except Exception as e:
+            logger.warning("Cache set error: %s", e)
 
 
 class CacheService:
@@ -18,23 +66,53 @@ class CacheService:
         return self._client
     
     async def get(self, key: str) -> Optional[str]:
+        value = None
+        with stage("cache_get"):
+            try:
+                client = await self._get_client()
+                if client:
+                    value = await client.get(key)
+            except Exception:
+                pass
+        _record_lookup(key, value is not None)
+        return value
+    
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        if not keys:
+            return []
+        values = [None] * len(keys)
+        with stage("cache_get"):
+            try:
+                client = await self._get_client()
+                if client:
+                    values = await client.mget(keys)
+            except Exception:
+                pass
+        for key, value in zip(keys, values):
+            _record_lookup(key, value is not None)
+        return values
+    
+    async def set(self, key: str, value: str, ttl: int = 3600) -> bool:
         try:
             client = await self._get_client()
             if client:
-                return await client.get(key)
+                with stage("cache_set"):
+                    await client.setex(key, ttl, value)
+                return True
         except Exception:
             pass
-        return None
+        return False
     
-    async def set(self, key: str, value: str, ttl: int = 3600) -> bool:
+    async def incr(self, key: str, ttl: int = 3600) -> Optional[int]:
         try:
             client = await self._get_client()
             if client:
-                await client.setex(key, ttl, value)
-                return True
+                value = await client.incr(key)
+                await client.expire(key, ttl)
+                return value
         except Exception:
             pass
-        return False
+        return None
     
     async def delete(self, key: str) -> bool:
         try:
@@ -0,0 +1,128 @@
+from typing import List, Tuple
+from multiprocessing.connection import Client, Listener
+import logging
+import multiprocessing
+import secrets
+import threading
+
+logger = logging.getLogger(__name__)
+
+_CONNECT_TIMEOUT = 120.0
+
+
+def _serve_connection(conn, embeddings):
+    with conn:
+        while True:
+            try:
+                texts = conn.recv()
+            except EOFError:
+                return
+            try:
+                conn.send(("ok", embeddings.encode(texts) if texts else []))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+def _serve(model_name: str, authkey: bytes, ready):
+    """Sidecar process: load the model once, then embed for every connected worker"""
+    from app.services.llm import LocalEmbeddings
+    
+    embeddings = LocalEmbeddings(model_name)
+    try:
+        embeddings._load_model()
+    except Exception as e:
+        ready.send(("error", f"{type(e).__name__}: {e}"))
+        return
+    
+    with Listener(("127.0.0.1", 0), authkey=authkey) as listener:
+        ready.send(("ok", listener.address))
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=_serve_connection, args=(conn, embeddings), daemon=True).start()
+
+
+class EmbeddingSidecar:
+    """One embedding-model process shared by every worker, so adding workers doesn't add models"""
+    
+    def __init__(self, process, address: Tuple[str, int], authkey: bytes):
+        self.process = process
+        self.address = address
+        self.authkey = authkey
+    
+    @classmethod
+    def start(cls, model_name: str) -> "EmbeddingSidecar":
+        authkey = secrets.token_bytes(32)
+        context = multiprocessing.get_context("spawn")
+        parent, child = context.Pipe(duplex=False)
+        process = context.Process(target=_serve, args=(model_name, authkey, child), name="embedding-sidecar", daemon=True)
+        process.start()
+        child.close()
+        
+        if not parent.poll(_CONNECT_TIMEOUT):
+            process.terminate()
+            raise TimeoutError("Embedding sidecar did not start")
+        status, detail = parent.recv()
+        if status != "ok":
+            process.join()
+            raise RuntimeError(f"Embedding sidecar failed to load the model: {detail}")
+        logger.info(f"Embedding sidecar serving {model_name} on {detail[0]}:{detail[1]} (pid {process.pid})")
+        return cls(process, tuple(detail), authkey)
+    
+    @property
+    def address_string(self) -> str:
+        return f"{self.address[0]}:{self.address[1]}"
+    
+    def stop(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join(timeout=5)
+
+
+class RemoteEmbeddings:
+    """Drop-in for LocalEmbeddings that asks the sidecar process instead of loading a model"""
+    
+    def __init__(self, address: str, authkey: str):
+        host, _, port = address.rpartition(":")
+        self.address = (host, int(port))
+        self._authkey = bytes.fromhex(authkey)
+        self._conn = None
+        # Executor threads share one connection; requests on it are serialized
+        self._lock = threading.Lock()
+    
+    @property
+    def loaded(self) -> bool:
+        return self._conn is not None
+    
+    def _load_model(self):
+        """Connect to the sidecar (named like LocalEmbeddings for the warm-up hook)"""
+        with self._lock:
+            self._connect()
+    
+    def _connect(self):
+        if self._conn is None:
+            self._conn = Client(self.address, authkey=self._authkey)
+    
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            for attempt in range(2):
+                self._connect()
+                try:
+                    self._conn.send(list(texts))
+                    status, result = self._conn.recv()
+                    break
+                except (EOFError, OSError):
+                    # Sidecar restarted or dropped us: reconnect once
+                    self._close()
+                    if attempt:
+                        raise
+        if status != "ok":
+            raise RuntimeError(f"Embedding sidecar error: {result}")
+        return result
+    
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except OSError:
+                pass
+            self._conn = None
@@ -0,0 +1,198 @@
+from typing import Optional, List, Dict, Any, AsyncIterator
+import asyncio
+import hashlib
+import json
+import random
+import re
+
+from app.config import Settings
+from app.services.llm import LLMProvider
+from app.services.metrics import LLM_TOKENS
+
+# Latency/failure shapes for load testing. first_token is the mean wait before
+# the first chunk (exponentially distributed), tokens_per_second the streaming
+# rate (0 = emit everything at once), error_rate the share of calls failing
+# with a retryable 503/429, and tail_probability the share of calls delayed by
+# an extra tail_delay seconds.
+FAKE_LATENCY_PROFILES: Dict[str, Dict[str, float]] = {
+    "instant": {"first_token": 0.0, "tokens_per_second": 0.0, "error_rate": 0.0, "tail_probability": 0.0, "tail_delay": 0.0},
+    "fast": {"first_token": 0.2, "tokens_per_second": 400.0, "error_rate": 0.0, "tail_probability": 0.0, "tail_delay": 0.0},
+    "realistic": {"first_token": 1.5, "tokens_per_second": 80.0, "error_rate": 0.01, "tail_probability": 0.02, "tail_delay": 20.0},
+    "degraded": {"first_token": 4.0, "tokens_per_second": 25.0, "error_rate": 0.1, "tail_probability": 0.1, "tail_delay": 45.0},
+}
+
+_VOCABULARY = (
+    "service cache shard replica queue latency throughput partition gateway index "
+    "consistency availability region cluster stream batch schema endpoint token "
+    "failover budget capacity pipeline worker scaling tenant storage event"
+).split()
+
+_FONTS = ["Inter", "Manrope", "Poppins", "Roboto", "Source Sans 3", "DM Sans", "Playfair Display", "Space Grotesk"]
+_PLATFORMS = ["Stripe", "Linear", "Notion", "Airbnb", "Spotify", "Figma", "Vercel", "Duolingo"]
+
+_TOKEN_PATTERN = re.compile(r"\s*\S+")
+
+
+class FakeProviderError(Exception):
+    """Simulated provider failure carrying an HTTP-style status code"""
+    
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeLLM(LLMProvider):
+    """Deterministic offline provider with configurable latency and failure shapes"""
+    
+    def __init__(
+        self,
+        response_words: int = 1500,
+        first_token: float = 1.5,
+        tokens_per_second: float = 80.0,
+        error_rate: float = 0.0,
+        tail_probability: float = 0.0,
+        tail_delay: float = 0.0,
+        seed: int = 0,
+        model_name: str = "fake-llm",
+    ):
+        self.model_name = model_name
+        self.response_words = response_words
+        self.first_token = first_token
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.tail_probability = tail_probability
+        self.tail_delay = tail_delay
+        self.seed = seed
+        # Timing draws vary call to call but replay identically for a given seed
+        self._timing = random.Random(seed)
+    
+    @classmethod
+    def from_settings(cls, settings: Settings, seed_offset: int = 0) -> "FakeLLM":
+        profile = dict(FAKE_LATENCY_PROFILES.get(settings.fake_llm_profile, FAKE_LATENCY_PROFILES["realistic"]))
+        overrides = {
+            "first_token": settings.fake_llm_first_token_latency,
+            "tokens_per_second": settings.fake_llm_tokens_per_second,
+            "error_rate": settings.fake_llm_error_rate,
+            "tail_probability": settings.fake_llm_tail_probability,
+            "tail_delay": settings.fake_llm_tail_delay,
+        }
+        profile.update({key: value for key, value in overrides.items() if value is not None})
+        return cls(
+            response_words=settings.fake_llm_response_words,
+            seed=settings.fake_llm_seed + seed_offset,
+            model_name=f"fake-{settings.fake_llm_profile}",
+            **profile,
+        )
+    
+    async def stream(
+        self,
+        prompt: str,
+        system_prompt: str,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        delay = self._timing.expovariate(1 / self.first_token) if self.first_token > 0 else 0.0
+        if self._timing.random() < self.tail_probability:
+            delay += self.tail_delay
+        if delay:
+            await asyncio.sleep(delay)
+        if self._timing.random() < self.error_rate:
+            code = self._timing.choice([503, 429])
+            raise FakeProviderError(code, f"Simulated provider error {code}")
+        
+        text = self.render(prompt, system_prompt, max_tokens=max_tokens, **kwargs)
+        tokens = _TOKEN_PATTERN.findall(text)
+        # Word counts stand in for the provider's token usage
+        LLM_TOKENS.inc("prompt", amount=len(_TOKEN_PATTERN.findall(system_prompt)) + len(_TOKEN_PATTERN.findall(prompt)))
+        LLM_TOKENS.inc("completion", amount=len(tokens))
+        if self.tokens_per_second <= 0:
+            yield text
+            return
+        
+        chunk_size = 8
+        for start in range(0, len(tokens), chunk_size):
+            await asyncio.sleep(chunk_size / self.tokens_per_second)
+            yield "".join(tokens[start:start + chunk_size])
+    
+    def render(self, prompt: str, system_prompt: str, max_tokens: Optional[int] = None, **kwargs) -> str:
+        """Deterministic response text for a prompt pair"""
+        digest = hashlib.sha256(f"{self.seed}\x00{system_prompt}\x00{prompt}".encode("utf-8")).hexdigest()
+        rng = random.Random(int(digest[:16], 16))
+        words = self.response_words if not max_tokens else max(50, min(self.response_words, int(max_tokens * 0.75)))
+        
+        if kwargs.get("response_schema") is not None or '"color_palettes"' in system_prompt:
+            return json.dumps(self._ui_payload(rng, prompt, system_prompt, words), indent=2)
+        return self._markdown(rng, prompt, system_prompt, words)
+    
+    def _markdown(self, rng: random.Random, prompt: str, system_prompt: str, words: int) -> str:
+        titles = re.findall(r"^###\s+(\d+\.\s*.+)$", system_prompt, re.MULTILINE) or [
+            "1. Overview", "2. Details", "3. Recommendations",
+        ]
+        single = re.search(r"Write ONLY section (\d+)\.", prompt)
+        if single:
+            titles = [t for t in titles if t.startswith(f"{single.group(1)}.")] or titles[:1]
+        
+        request = next((line.strip() for line in prompt.splitlines() if line.strip()), "")[:200]
+        per_section = max(20, words // len(titles))
+        parts = [] if single else [f"> {request}"]
+        for title in titles:
+            if not single:
+                parts.append(f"## {title}")
+            parts.append(self._paragraph(rng, per_section * 2 // 3))
+            parts.append("| Component | Choice | Target |\n|-----------|--------|--------|")
+            parts.append("\n".join(
+                f"| {rng.choice(_VOCABULARY).title()} | {rng.choice(_VOCABULARY)} | {rng.randint(10, 999)} ms |"
+                for _ in range(3)
+            ))
+            parts.append("\n".join(f"- **{rng.choice(_VOCABULARY)}**: {self._sentence(rng)}" for _ in range(3)))
+        return "\n\n".join(parts)
+    
+    def _ui_payload(self, rng: random.Random, prompt: str, system_prompt: str, words: int) -> Dict[str, Any]:
+        def color() -> str:
+            return f"#{rng.randint(0, 0xFFFFFF):06x}"
+        
+        return {
+            "color_palettes": [
+                {
+                    "primary": color(),
+                    "secondary": color(),
+                    "accent": color(),
+                    "background": color(),
+                    "text": color(),
+                    "additional": [color() for _ in range(3)],
+                }
+                for _ in range(2)
+            ],
+            "fonts": {
+                "heading": rng.choice(_FONTS),
+                "body": rng.choice(_FONTS),
+                "accent": rng.choice(_FONTS),
+                "fallbacks": ["system-ui", "sans-serif"],
+            },
+            "inspirations": [
+                {
+                    "platform_name": name,
+                    "description": self._sentence(rng),
+                    "key_features": [self._sentence(rng, 4) for _ in range(3)],
+                    "url": f"https://{name.lower()}.com",
+                }
+                for name in rng.sample(_PLATFORMS, 5)
+            ],
+            "design_principles": [self._sentence(rng) for _ in range(8)],
+            "image_suggestions": [self._sentence(rng) for _ in range(8)],
+            "analysis": self._markdown(rng, prompt, system_prompt, words),
+        }
+    
+    def _sentence(self, rng: random.Random, length: Optional[int] = None) -> str:
+        length = length or rng.randint(6, 14)
+        return " ".join(rng.choice(_VOCABULARY) for _ in range(length)).capitalize() + "."
+    
+    def _paragraph(self, rng: random.Random, words: int) -> str:
+        sentences: List[str] = []
+        count = 0
+        while count < words:
+            sentence = self._sentence(rng)
+            sentences.append(sentence)
+            count += sentence.count(" ") + 1
+        return " ".join(sentences)
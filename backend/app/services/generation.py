@@ -0,0 +1,53 @@
+from typing import Optional, Union, AsyncIterator
+from contextlib import aclosing
+
+from app.models.schemas import UIResearchResponse
+from app.services.agents.architecture_agent import ArchitectureAgent
+from app.services.agents.ui_research_agent import UIResearchAgent
+
+# Categories answered with a single markdown document
+MARKDOWN_CATEGORIES = ("architecture", "database", "api", "prompts")
+
+
+async def stream_category(
+    category: str,
+    prompt: str,
+    context: Optional[str] = None,
+    sectioned: bool = False,
+    knowledge_base=None,
+) -> AsyncIterator[str]:
+    """Stream a markdown category; the chunks concatenate to the full document"""
+    if category not in MARKDOWN_CATEGORIES:
+        raise ValueError(f"Category '{category}' does not produce a markdown document")
+    
+    # The prompts agent never used the knowledge base
+    agent = ArchitectureAgent(knowledge_base=knowledge_base if category != "prompts" else None)
+    if category == "architecture" and sectioned:
+        first = True
+        async with aclosing(agent.stream_sections(prompt, context)) as sections:
+            async for section in sections:
+                yield section if first else f"\n\n{section}"
+                first = False
+        return
+    
+    async with aclosing(agent.stream_document(category, prompt, context)) as chunks:
+        async for chunk in chunks:
+            yield chunk
+
+
+async def generate_for_category(
+    category: str,
+    prompt: str,
+    context: Optional[str] = None,
+    industry: Optional[str] = None,
+    sectioned: bool = False,
+    knowledge_base=None,
+) -> Union[str, UIResearchResponse]:
+    """Run the agent behind a chat category to completion"""
+    if category == "ui":
+        return await UIResearchAgent().research(prompt, industry)
+    
+    parts = []
+    async for chunk in stream_category(category, prompt, context, sectioned, knowledge_base):
+        parts.append(chunk)
+    return "".join(parts)
@@ -0,0 +1,382 @@
+from typing import Optional, Dict, Any, List
+import asyncio
+import json
+import logging
+import math
+import os
+import socket
+import time
+import uuid
+import redis.asyncio as redis
+
+from app.config import Settings
+from app.services.cache import CacheService, make_cache_key, safe_cache_get, safe_cache_set
+from app.services.generation import MARKDOWN_CATEGORIES, generate_for_category, stream_category
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ("succeeded", "failed")
+
+INTERRUPTED_ERROR = "Interrupted by server shutdown, please resubmit"
+
+
+class MemoryJobBackend:
+    """In-process asyncio queue and job store for single-worker setups"""
+    
+    # Jobs can't outlive the process, so one interrupted by shutdown can't be handed on
+    durable = False
+    
+    def __init__(self, result_ttl: int = 86400):
+        self.result_ttl = result_ttl
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._queue: asyncio.Queue = asyncio.Queue()
+    
+    async def save(self, job: Dict[str, Any]):
+        self._jobs[job["id"]] = dict(job)
+        self._evict_expired()
+    
+    async def load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job else None
+    
+    async def enqueue(self, job_id: str):
+        await self._queue.put(job_id)
+    
+    async def dequeue(self, timeout: float) -> Optional[str]:
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+    
+    async def ack(self, job_id: str):
+        pass
+    
+    async def requeue(self, job_id: str):
+        await self._queue.put(job_id)
+    
+    async def heartbeat(self):
+        pass
+    
+    async def recover(self) -> int:
+        # Jobs live and die with this process; nothing can be orphaned
+        return 0
+    
+    async def queue_depth(self) -> int:
+        return self._queue.qsize()
+    
+    async def close(self):
+        # Nothing will ever run what is still queued; say so to anyone polling until exit
+        while not self._queue.empty():
+            job = self._jobs.get(self._queue.get_nowait())
+            if job and job["status"] == "queued":
+                job.update(status="failed", error=INTERRUPTED_ERROR, finished_at=time.time())
+    
+    def _evict_expired(self):
+        cutoff = time.time() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["status"] in FINISHED_STATUSES and (job.get("finished_at") or 0) < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+class RedisJobBackend:
+    """Redis list queue and job records shared by every worker process.
+    
+    Dequeuing atomically moves a job id into this process's processing list
+    (BLMOVE), and it leaves that list only when the job finishes (`ack`) or is
+    handed back (`requeue`). Each process keeps a heartbeat key alive; ids left
+    in the processing list of a process whose heartbeat expired (killed or
+    crashed mid-job) are moved back to the queue by `recover`.
+    """
+    
+    QUEUE_KEY = "jobs:queue"
+    CONSUMERS_KEY = "jobs:consumers"
+    durable = True
+    
+    def __init__(self, redis_url: str, result_ttl: int = 86400, heartbeat_ttl: int = 30):
+        self.result_ttl = result_ttl
+        self.heartbeat_ttl = heartbeat_ttl
+        self.consumer = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._client = redis.from_url(redis_url, decode_responses=True)
+    
+    @staticmethod
+    def _processing_key(consumer: str) -> str:
+        return f"jobs:processing:{consumer}"
+    
+    @staticmethod
+    def _heartbeat_key(consumer: str) -> str:
+        return f"jobs:consumer:{consumer}"
+    
+    @staticmethod
+    def _key(job_id: str) -> str:
+        return f"job:{job_id}"
+    
+    async def save(self, job: Dict[str, Any]):
+        await self._client.set(self._key(job["id"]), json.dumps(job), ex=self.result_ttl)
+    
+    async def load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raw = await self._client.get(self._key(job_id))
+        return json.loads(raw) if raw else None
+    
+    async def enqueue(self, job_id: str):
+        await self._client.lpush(self.QUEUE_KEY, job_id)
+    
+    async def dequeue(self, timeout: float) -> Optional[str]:
+        return await self._client.blmove(
+            self.QUEUE_KEY,
+            self._processing_key(self.consumer),
+            max(1, math.ceil(timeout)),
+            src="RIGHT",
+            dest="LEFT",
+        )
+    
+    async def ack(self, job_id: str):
+        await self._client.lrem(self._processing_key(self.consumer), 1, job_id)
+    
+    async def requeue(self, job_id: str):
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.lrem(self._processing_key(self.consumer), 1, job_id)
+            pipe.rpush(self.QUEUE_KEY, job_id)  # dequeued from the right: runs next
+            await pipe.execute()
+    
+    async def heartbeat(self):
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.sadd(self.CONSUMERS_KEY, self.consumer)
+            pipe.set(self._heartbeat_key(self.consumer), "1", ex=self.heartbeat_ttl)
+            await pipe.execute()
+    
+    async def recover(self) -> int:
+        """Requeue jobs held by processes whose heartbeat expired; returns how many"""
+        recovered = 0
+        for consumer in await self._client.smembers(self.CONSUMERS_KEY):
+            if consumer == self.consumer or await self._client.exists(self._heartbeat_key(consumer)):
+                continue
+            processing = self._processing_key(consumer)
+            while True:
+                job_id = await self._client.lmove(processing, self.QUEUE_KEY, "RIGHT", "RIGHT")
+                if job_id is None:
+                    break
+                job = await self.load(job_id)
+                if job and job["status"] == "running":
+                    # Kept partial output is overwritten when the job runs again
+                    job.update(status="queued", started_at=None)
+                    await self.save(job)
+                recovered += 1
+            await self._client.srem(self.CONSUMERS_KEY, consumer)
+        return recovered
+    
+    async def queue_depth(self) -> int:
+        return await self._client.llen(self.QUEUE_KEY)
+    
+    async def close(self):
+        try:
+            await self._client.srem(self.CONSUMERS_KEY, self.consumer)
+            await self._client.delete(self._heartbeat_key(self.consumer))
+        finally:
+            await self._client.close()
+
+
+class JobService:
+    """Accepts generation jobs and runs them on background worker tasks"""
+    
+    def __init__(
+        self,
+        backend,
+        workers: int = 2,
+        partial_flush_interval: float = 1.0,
+        cache_ttl: int = 3600,
+    ):
+        self.backend = backend
+        self.workers = max(1, workers)
+        self.partial_flush_interval = partial_flush_interval
+        self.cache_ttl = cache_ttl
+        self._cache: Optional[CacheService] = None
+        self._knowledge_base = None
+        self._tasks: List[asyncio.Task] = []
+        self._maintenance: Optional[asyncio.Task] = None
+        self._draining = False
+        self._accepting = True
+        self._running = 0
+    
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "JobService":
+        if settings.job_backend == "redis":
+            backend = RedisJobBackend(settings.redis_url, settings.job_result_ttl)
+        else:
+            backend = MemoryJobBackend(settings.job_result_ttl)
+        return cls(
+            backend,
+            workers=settings.job_workers,
+            partial_flush_interval=settings.job_partial_flush_interval,
+            cache_ttl=settings.cache_ttl,
+        )
+    
+    def start(self, cache: Optional[CacheService] = None, knowledge_base=None):
+        self._cache = cache
+        self._knowledge_base = knowledge_base
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self._maintenance = asyncio.create_task(self._maintain())
+        logger.info(f"Started {self.workers} job worker(s) on {type(self.backend).__name__}")
+    
+    async def drain(self, timeout: float) -> int:
+        """Stop taking new jobs and give running ones up to `timeout` seconds.
+        
+        Returns how many are still running; `stop` hands those back to the
+        queue with their partial output, or marks them failed when the
+        backend doesn't outlive this process.
+        """
+        self._draining = True
+        if not self._tasks:
+            return 0
+        await asyncio.wait(self._tasks, timeout=max(0.0, timeout))
+        return self._running
+    
+    async def stop(self):
+        if self._maintenance:
+            self._maintenance.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *filter(None, [self._maintenance]), return_exceptions=True)
+        self._tasks = []
+        self._maintenance = None
+        await self.backend.close()
+    
+    async def _maintain(self, interval: float = 10.0):
+        """Keep this process's heartbeat alive and requeue jobs orphaned by dead ones"""
+        while True:
+            try:
+                await self.backend.heartbeat()
+                recovered = await self.backend.recover()
+                if recovered:
+                    logger.warning(f"Requeued {recovered} job(s) left running by a stopped worker process")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Job queue maintenance error: {e}")
+            await asyncio.sleep(interval)
+    
+    def stop_accepting(self):
+        """Refuse new submissions; workers keep processing the queue until `drain`"""
+        self._accepting = False
+    
+    @property
+    def accepting(self) -> bool:
+        return self._accepting and not self._draining
+    
+    async def submit(self, category: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        job = {
+            "id": uuid.uuid4().hex,
+            "category": category,
+            "payload": payload,
+            "status": "queued",
+            "partial": None,
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        await self.backend.save(job)
+        await self.backend.enqueue(job["id"])
+        return job
+    
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.backend.load(job_id)
+    
+    async def _worker(self, index: int):
+        # Draining workers finish their current job, then exit
+        while not self._draining:
+            try:
+                job_id = await self.backend.dequeue(timeout=1.0)
+                if job_id:
+                    self._running += 1
+                    try:
+                        await self._run(job_id)
+                    finally:
+                        self._running -= 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job worker {index} error: {e}")
+                await asyncio.sleep(1.0)
+    
+    async def _run(self, job_id: str):
+        job = await self.backend.load(job_id)
+        if not job or job["status"] != "queued":
+            await self.backend.ack(job_id)
+            return
+        
+        job.update(status="running", started_at=time.time())
+        await self.backend.save(job)
+        try:
+            job["result"] = await self._execute(job)
+            job.update(status="succeeded", partial=None)
+        except asyncio.CancelledError:
+            if self.backend.durable:
+                # Shut down mid-generation: keep the partial output and requeue for another worker
+                job.update(status="queued", started_at=None)
+                await asyncio.shield(self._requeue(job))
+            else:
+                job.update(status="failed", error=INTERRUPTED_ERROR, finished_at=time.time())
+                await asyncio.shield(self.backend.save(job))
+                logger.warning(f"Job {job_id} interrupted by shutdown ({len(job.get('partial') or '')} chars of partial output)")
+            raise
+        except Exception as e:
+            logger.error(f"Job {job_id} ({job['category']}) failed: {e}")
+            job.update(status="failed", error=f"Failed to generate response: {str(e)}")
+        job["finished_at"] = time.time()
+        await self.backend.save(job)
+        await self.backend.ack(job_id)
+    
+    async def _requeue(self, job: Dict[str, Any]):
+        try:
+            await self.backend.save(job)
+            await self.backend.requeue(job["id"])
+            logger.info(f"Requeued interrupted job {job['id']} ({len(job.get('partial') or '')} chars of partial output)")
+        except Exception as e:
+            logger.error(f"Could not requeue interrupted job {job['id']}: {e}")
+    
+    async def _execute(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        category = job["category"]
+        payload = job["payload"]
+        cache_key = make_cache_key(category, payload["prompt"])
+        
+        cached = await safe_cache_get(self._cache, cache_key)
+        if cached:
+            if category == "ui":
+                return {**json.loads(cached), "cached": True}
+            return {"content": cached, "cached": True}
+        
+        if category not in MARKDOWN_CATEGORIES:
+            response = await generate_for_category(
+                category,
+                payload["prompt"],
+                industry=payload.get("industry"),
+            )
+            await safe_cache_set(self._cache, cache_key, response.model_dump_json(), self.cache_ttl)
+            return response.model_dump()
+        
+        parts = []
+        flushed_at = time.monotonic()
+        try:
+            async for chunk in stream_category(
+                category,
+                payload["prompt"],
+                payload.get("context"),
+                sectioned=payload.get("sectioned", False),
+                knowledge_base=self._knowledge_base,
+            ):
+                parts.append(chunk)
+                if time.monotonic() - flushed_at >= self.partial_flush_interval:
+                    job["partial"] = "".join(parts)
+                    await self.backend.save(job)
+                    flushed_at = time.monotonic()
+        except asyncio.CancelledError:
+            job["partial"] = "".join(parts)
+            raise
+        
+        content = "".join(parts)
+        await safe_cache_set(self._cache, cache_key, content, self.cache_ttl)
+        return {"content": content, "cached": False}
@@ -0,0 +1,178 @@
+from typing import Optional, Dict, Any, List, Tuple
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# (member key, array index or None for a whole member, decoded value)
+JSONEvent = Tuple[str, Optional[int], Any]
+
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+
+class _Frame:
+    __slots__ = ("is_object", "start", "key", "expect_key", "value_start", "literal_start", "index", "items")
+    
+    def __init__(self, is_object: bool, start: int):
+        self.is_object = is_object
+        self.start = start
+        self.key: Optional[str] = None
+        self.expect_key = is_object
+        self.value_start: Optional[int] = None
+        self.literal_start: Optional[int] = None
+        self.index = 0
+        self.items: List[Any] = []
+
+
+class StreamingJSONObjectParser:
+    """Incremental parser for one top-level JSON object arriving in chunks.
+
+    `feed` returns an event for every top-level member whose value has just
+    closed, plus one per element of a top-level array as soon as that element
+    closes, so callers can act on e.g. each color palette before the model has
+    written the rest. Text before the first "{" (prose, ```json fences) and
+    after the closing "}" is ignored. Elements that aren't valid JSON on their
+    own are skipped rather than failing the whole document.
+    """
+    
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._events: List[JSONEvent] = []
+        self.members: Dict[str, Any] = {}
+        self.done = False
+    
+    @property
+    def text(self) -> str:
+        return self._buffer
+    
+    def feed(self, chunk: str) -> List[JSONEvent]:
+        self._buffer += chunk
+        buf = self._buffer
+        i = self._pos
+        n = len(buf)
+        while i < n:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    i += 1
+                    continue
+                # Jump straight to the next quote or backslash
+                match = _STRING_SPECIAL.search(buf, i)
+                if match is None:
+                    break
+                i = match.start()
+                if buf[i] == "\\":
+                    self._escape = True
+                else:
+                    self._in_string = False
+                    self._string_closed(i + 1)
+                i += 1
+                continue
+            
+            ch = buf[i]
+            i += 1
+            if not self._stack:
+                if ch == "{" and not self.done:
+                    self._stack.append(_Frame(True, i - 1))
+                continue
+            
+            frame = self._stack[-1]
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i - 1
+                if not frame.expect_key:
+                    frame.value_start = i - 1
+            elif ch in "{[":
+                frame.value_start = i - 1
+                self._stack.append(_Frame(ch == "{", i - 1))
+            elif ch in "}]":
+                self._end_literal(frame, i - 1)
+                closed = self._stack.pop()
+                if not self._stack:
+                    self.done = True
+                else:
+                    self._value_closed(closed.start, i, closed)
+            elif ch == ":":
+                frame.expect_key = False
+            elif ch == ",":
+                self._end_literal(frame, i - 1)
+                frame.expect_key = frame.is_object
+            elif not ch.isspace() and frame.value_start is None and not frame.expect_key:
+                frame.value_start = frame.literal_start = i - 1
+        self._pos = len(buf)
+        
+        events, self._events = self._events, []
+        return events
+    
+    def partial(self) -> Dict[str, Any]:
+        """Members decoded so far, including elements of an unfinished array
+        and the text of an unterminated top-level string"""
+        result = dict(self.members)
+        if len(self._stack) >= 2 and not self._stack[1].is_object and self._stack[0].key:
+            result.setdefault(self._stack[0].key, list(self._stack[1].items))
+        elif len(self._stack) == 1 and self._in_string and not self._stack[0].expect_key and self._stack[0].key:
+            raw = self._buffer[self._string_start:].rstrip("\\")
+            try:
+                result.setdefault(self._stack[0].key, json.loads(raw + '"'))
+            except ValueError:
+                pass
+        return result
+    
+    def _string_closed(self, end: int):
+        frame = self._stack[-1]
+        if frame.expect_key:
+            if len(self._stack) == 1:
+                frame.key = json.loads(self._buffer[self._string_start:end])
+        else:
+            self._value_closed(self._string_start, end)
+    
+    def _end_literal(self, frame: _Frame, end: int):
+        if frame.literal_start is not None:
+            self._value_closed(frame.literal_start, end)
+    
+    def _value_closed(self, start: int, end: int, container: Optional[_Frame] = None):
+        """A value finished inside the frame now on top of the stack"""
+        frame = self._stack[-1]
+        frame.value_start = frame.literal_start = None
+        depth = len(self._stack)
+        if depth > 2:
+            return
+        
+        if depth == 2 and (frame.is_object or not self._stack[0].key):
+            return
+        
+        if container is not None and not container.is_object and depth == 1:
+            # Elements were decoded one by one as they closed
+            value = container.items
+        else:
+            try:
+                value = json.loads(self._buffer[start:end])
+            except ValueError as e:
+                logger.debug(f"Skipping malformed JSON value: {e}")
+                if depth == 2:
+                    frame.index += 1
+                return
+        
+        if depth == 1:
+            if frame.key is not None:
+                self.members[frame.key] = value
+                self._events.append((frame.key, None, value))
+        else:
+            key = self._stack[0].key
+            frame.items.append(value)
+            self._events.append((key, frame.index, value))
+            frame.index += 1
+
+
+def parse_json_object(text: str) -> Dict[str, Any]:
+    """Best-effort decode of the first JSON object in `text`, keeping every
+    member and array element that closed before any truncation"""
+    parser = StreamingJSONObjectParser()
+    parser.feed(text)
+    return parser.partial()
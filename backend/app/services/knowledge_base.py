@@ -1,13 +1,19 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, TYPE_CHECKING
+from collections import OrderedDict
+import asyncio
+import functools
+import hashlib
 import json
-import numpy as np
 import logging
+import os
+import threading
 
 from app.config import get_settings
-from app.knowledge.system_architectures import SYSTEM_ARCHITECTURES
-from app.knowledge.design_patterns import DESIGN_PATTERNS
-from app.knowledge.tech_stacks import TECH_STACKS
 from app.services.llm import llm_service
+from app.services.metrics import stage
+
+if TYPE_CHECKING:
+    import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -19,10 +25,19 @@ class SimpleVectorStore:
         self.documents: List[str] = []
         self.metadatas: List[Dict] = []
         self.ids: List[str] = []
-        self.embeddings: Optional[np.ndarray] = None
+        # numpy is imported on first use so importing the app stays cheap
+        self.embeddings: Optional["np.ndarray"] = None
+        # Recent query embeddings, so repeated or pre-batched queries skip the model.
+        # Used from concurrent executor threads (query, embed_queries), hence the lock;
+        # it is never held while the model runs.
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._query_cache_size = 1024
+        self._query_cache_lock = threading.Lock()
     
     def add(self, documents: List[str], metadatas: List[Dict], ids: List[str]):
         """Add documents to the store"""
+        import numpy as np
+        
         self.documents.extend(documents)
         self.metadatas.extend(metadatas)
         self.ids.extend(ids)
@@ -48,8 +63,9 @@ class SimpleVectorStore:
         if self.embeddings is None or len(self.documents) == 0:
             return {"documents": [[]], "metadatas": [[]], "distances": [[]]}
         
-        # Get query embedding
-        query_embedding = np.array(llm_service.get_embeddings([query_text])[0])
+        import numpy as np
+        
+        query_embedding = self._query_embedding(query_text)
         
         # Calculate cosine similarity
         similarities = np.dot(self.embeddings, query_embedding) / (
@@ -78,8 +94,161 @@ class SimpleVectorStore:
             "distances": [[1 - similarities[i] for i in top_indices]],  # Convert similarity to distance
         }
     
+    def embed_queries(self, query_texts: List[str]):
+        """Embed query texts in one batch and keep them for subsequent queries"""
+        with self._query_cache_lock:
+            missing = [text for text in dict.fromkeys(query_texts) if text not in self._query_cache]
+        if missing:
+            import numpy as np
+            for text, embedding in zip(missing, llm_service.get_embeddings(missing)):
+                self._remember_query(text, np.array(embedding))
+    
+    def _query_embedding(self, query_text: str) -> "np.ndarray":
+        with self._query_cache_lock:
+            cached = self._query_cache.get(query_text)
+            if cached is not None:
+                self._query_cache.move_to_end(query_text)
+                return cached
+        
+        import numpy as np
+        
+        embedding = np.array(llm_service.get_embeddings([query_text])[0])
+        self._remember_query(query_text, embedding)
+        return embedding
+    
+    def _remember_query(self, query_text: str, embedding: "np.ndarray"):
+        with self._query_cache_lock:
+            self._query_cache[query_text] = embedding
+            while len(self._query_cache) > self._query_cache_size:
+                self._query_cache.popitem(last=False)
+    
     def count(self) -> int:
         return len(self.documents)
+    
+    def save(self, path: str, fingerprint: str):
+        """Write the embedding matrix and documents next to each other under `path`"""
+        import numpy as np
+        
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        manifest = {
+            "fingerprint": fingerprint,
+            "documents": self.documents,
+            "metadatas": self.metadatas,
+            "ids": self.ids,
+        }
+        # Write-then-rename so a worker never maps a half-written file
+        with open(f"{path}.npy.tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(self.embeddings, dtype=np.float32))
+        os.replace(f"{path}.npy.tmp", f"{path}.npy")
+        with open(f"{path}.json.tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(f"{path}.json.tmp", f"{path}.json")
+        logger.info(f"Saved knowledge index to {path} ({len(self.documents)} documents)")
+    
+    @classmethod
+    def load(cls, path: str, fingerprint: str) -> Optional["SimpleVectorStore"]:
+        """Map a saved index read-only; every process mapping it shares the same pages"""
+        import numpy as np
+        
+        try:
+            with open(f"{path}.json", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("fingerprint") != fingerprint:
+                return None
+            embeddings = np.load(f"{path}.npy", mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        
+        store = cls()
+        store.documents = manifest["documents"]
+        store.metadatas = manifest["metadatas"]
+        store.ids = manifest["ids"]
+        store.embeddings = embeddings
+        return store
+
+
+def knowledge_documents() -> Tuple[List[str], List[Dict[str, Any]], List[str]]:
+    """Documents, metadata and ids indexed from the built-in knowledge dictionaries"""
+    from app.knowledge.system_architectures import SYSTEM_ARCHITECTURES
+    from app.knowledge.design_patterns import DESIGN_PATTERNS
+    from app.knowledge.tech_stacks import TECH_STACKS
+    
+    documents = []
+    metadatas = []
+    ids = []
+    
+    for arch_id, arch in SYSTEM_ARCHITECTURES.items():
+        doc = f"System: {arch['name']}\n\n{arch['description']}\n\n"
+        doc += f"Scale: {arch['scale']}\n"
+        doc += f"Key Components: {', '.join(arch['components'])}\n"
+        doc += f"Technologies: {json.dumps(arch['technologies'])}\n"
+        doc += f"Patterns: {', '.join(arch['patterns'])}\n"
+        doc += f"Use Cases: {', '.join(arch['use_cases'])}"
+        
+        documents.append(doc)
+        metadatas.append({
+            "type": "architecture",
+            "name": arch["name"],
+            "scale": arch["scale"],
+        })
+        ids.append(f"arch_{arch_id}")
+    
+    for pattern_id, pattern in DESIGN_PATTERNS.items():
+        doc = f"Pattern: {pattern['name']}\n\n{pattern['description']}\n\n"
+        doc += f"When to use: {pattern['when_to_use']}\n"
+        doc += f"Benefits: {', '.join(pattern['benefits'])}\n"
+        doc += f"Considerations: {', '.join(pattern['considerations'])}"
+        
+        documents.append(doc)
+        metadatas.append({
+            "type": "pattern",
+            "name": pattern["name"],
+            "category": pattern.get("category", "general"),
+        })
+        ids.append(f"pattern_{pattern_id}")
+    
+    for stack_id, stack in TECH_STACKS.items():
+        doc = f"Tech Stack: {stack['name']}\n\n{stack['description']}\n\n"
+        doc += f"Best for: {', '.join(stack['best_for'])}\n"
+        doc += f"Components: {json.dumps(stack['components'])}"
+        
+        documents.append(doc)
+        metadatas.append({
+            "type": "tech_stack",
+            "name": stack["name"],
+        })
+        ids.append(f"stack_{stack_id}")
+    
+    return documents, metadatas, ids
+
+
+def index_fingerprint(documents: List[str], model_name: str) -> str:
+    digest = hashlib.sha256(model_name.encode("utf-8"))
+    for doc in documents:
+        digest.update(b"\x00" + doc.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def build_shared_index(path: str) -> SimpleVectorStore:
+    """Build the corpus index once and write it to `path`.npy/.json for workers to map.
+    
+    An existing index for the same documents and embedding model is reused.
+    """
+    store = load_shared_index(path)
+    if store is not None:
+        return store
+    
+    documents, metadatas, ids = knowledge_documents()
+    store = SimpleVectorStore()
+    store.add(documents, metadatas, ids)
+    store.save(path, index_fingerprint(documents, get_settings().embedding_model))
+    return store
+
+
+def load_shared_index(path: str) -> Optional[SimpleVectorStore]:
+    """Map an index written by `build_shared_index`; None if absent or built from other documents"""
+    documents, _, _ = knowledge_documents()
+    return SimpleVectorStore.load(path, index_fingerprint(documents, get_settings().embedding_model))
 
 
 class KnowledgeBaseService:
@@ -87,11 +256,30 @@ class KnowledgeBaseService:
         self.settings = get_settings()
         self._store: Optional[SimpleVectorStore] = None
         self._initialized = False
+        self._init_task: Optional[asyncio.Task] = None
+        self.last_error: Optional[str] = None
+    
+    @property
+    def ready(self) -> bool:
+        return self._initialized
     
     async def initialize(self):
+        # Concurrent callers (warm-up, early queries) share one build
+        if self._init_task is None:
+            self._init_task = asyncio.ensure_future(self._build())
+        await asyncio.shield(self._init_task)
+    
+    async def wait_ready(self, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for the index; False if it is still building"""
         if self._initialized:
-            return
-        
+            return True
+        try:
+            await asyncio.wait_for(self.initialize(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return self._initialized
+    
+    async def _build(self):
         self._store = SimpleVectorStore()
         
         try:
@@ -100,62 +288,25 @@ class KnowledgeBaseService:
             logger.info("✓ Knowledge base initialized with in-memory vector store")
         except Exception as e:
             logger.error(f"Failed to initialize knowledge base: {e}")
+            self.last_error = str(e)
             # Still mark as initialized so app can start
             self._initialized = True
     
     async def _populate_knowledge_base(self):
-        documents = []
-        metadatas = []
-        ids = []
-        
-        for arch_id, arch in SYSTEM_ARCHITECTURES.items():
-            doc = f"System: {arch['name']}\n\n{arch['description']}\n\n"
-            doc += f"Scale: {arch['scale']}\n"
-            doc += f"Key Components: {', '.join(arch['components'])}\n"
-            doc += f"Technologies: {json.dumps(arch['technologies'])}\n"
-            doc += f"Patterns: {', '.join(arch['patterns'])}\n"
-            doc += f"Use Cases: {', '.join(arch['use_cases'])}"
-            
-            documents.append(doc)
-            metadatas.append({
-                "type": "architecture",
-                "name": arch["name"],
-                "scale": arch["scale"],
-            })
-            ids.append(f"arch_{arch_id}")
-        
-        for pattern_id, pattern in DESIGN_PATTERNS.items():
-            doc = f"Pattern: {pattern['name']}\n\n{pattern['description']}\n\n"
-            doc += f"When to use: {pattern['when_to_use']}\n"
-            doc += f"Benefits: {', '.join(pattern['benefits'])}\n"
-            doc += f"Considerations: {', '.join(pattern['considerations'])}"
-            
-            documents.append(doc)
-            metadatas.append({
-                "type": "pattern",
-                "name": pattern["name"],
-                "category": pattern.get("category", "general"),
-            })
-            ids.append(f"pattern_{pattern_id}")
-        
-        for stack_id, stack in TECH_STACKS.items():
-            doc = f"Tech Stack: {stack['name']}\n\n{stack['description']}\n\n"
-            doc += f"Best for: {', '.join(stack['best_for'])}\n"
-            doc += f"Components: {json.dumps(stack['components'])}"
-            
-            documents.append(doc)
-            metadatas.append({
-                "type": "tech_stack",
-                "name": stack["name"],
-            })
-            ids.append(f"stack_{stack_id}")
+        loop = asyncio.get_event_loop()
+        if self.settings.kb_index_path:
+            # Index published by the pre-fork launcher: map it read-only instead of re-embedding
+            store = await loop.run_in_executor(None, load_shared_index, self.settings.kb_index_path)
+            if store is not None:
+                self._store = store
+                logger.info(f"Attached shared knowledge index at {self.settings.kb_index_path} ({store.count()} documents)")
+                return
+            logger.warning(f"Shared knowledge index at {self.settings.kb_index_path} missing or stale, building locally")
         
+        documents, metadatas, ids = knowledge_documents()
         if documents:
-            self._store.add(
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids,
-            )
+            # Embedding the corpus is CPU-bound; keep it off the event loop
+            await loop.run_in_executor(None, self._store.add, documents, metadatas, ids)
     
     async def query(
         self,
@@ -163,16 +314,20 @@ class KnowledgeBaseService:
         n_results: int = 5,
         filter_type: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        if not self._initialized:
-            await self.initialize()
+        if not await self.wait_ready(self.settings.kb_ready_timeout):
+            # Still warming up: answer without retrieval rather than stall the request
+            logger.info("Knowledge base not ready, skipping retrieval")
+            return []
         
         where_filter = {"type": filter_type} if filter_type else None
         
-        results = self._store.query(
-            query_text=query,
-            n_results=n_results,
-            where=where_filter,
-        )
+        # Embedding the query is model inference or, with the sidecar, blocking socket IPC
+        loop = asyncio.get_running_loop()
+        with stage("vector_query"):
+            results = await loop.run_in_executor(
+                None,
+                functools.partial(self._store.query, query_text=query, n_results=n_results, where=where_filter),
+            )
         
         formatted_results = []
         if results and results["documents"]:
@@ -185,6 +340,16 @@ class KnowledgeBaseService:
         
         return formatted_results
     
+    async def prefetch_embeddings(self, queries: List[str]):
+        """Embed many queries in one model call ahead of their retrieval"""
+        if not await self.wait_ready(self.settings.kb_ready_timeout):
+            return
+        if not queries or self._store.embeddings is None:
+            return
+        
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._store.embed_queries, queries)
+    
     async def get_architecture_context(self, query: str) -> str:
         results = await self.query(query, n_results=3, filter_type="architecture")
         patterns = await self.query(query, n_results=2, filter_type="pattern")
@@ -198,3 +363,42 @@ class KnowledgeBaseService:
             context += f"{p['content']}\n\n---\n\n"
         
         return context
+
+
+class SharedRetrieval:
+    """Per-request view of the knowledge base that runs each distinct lookup once.
+    
+    Several agents answering the same product description can share one
+    instance; concurrent identical queries await the same task.
+    """
+    
+    def __init__(self, knowledge_base: KnowledgeBaseService):
+        self.knowledge_base = knowledge_base
+        self._lookups: Dict[tuple, asyncio.Task] = {}
+    
+    def _lookup(self, key: tuple, factory):
+        task = self._lookups.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._lookups[key] = task
+        return task
+    
+    async def query(
+        self,
+        query: str,
+        n_results: int = 5,
+        filter_type: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        return await self._lookup(
+            ("query", query, n_results, filter_type),
+            lambda: self.knowledge_base.query(query, n_results=n_results, filter_type=filter_type),
+        )
+    
+    async def prefetch_embeddings(self, queries: List[str]):
+        await self.knowledge_base.prefetch_embeddings(queries)
+    
+    async def get_architecture_context(self, query: str) -> str:
+        return await self._lookup(
+            ("architecture_context", query),
+            lambda: self.knowledge_base.get_architecture_context(query),
+        )
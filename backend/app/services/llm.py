@@ -1,30 +1,121 @@
-from typing import Optional, List
+from typing import Optional, List, Dict, Any, AsyncIterator, Iterator, Tuple
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from contextlib import aclosing
+from functools import lru_cache
 import asyncio
+import datetime
+import hashlib
 import logging
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+import threading
+import time
 
 from app.config import get_settings
+from app.services.llm_routing import EndpointPool, LLMEndpoint
+from app.services.metrics import LLM_ERRORS, LLM_TOKENS, STAGE_LATENCY, timed_stage
+from app.services.tracing import traced
+from app.services.resilience import CircuitBreaker, RetryPolicy
 
 logger = logging.getLogger(__name__)
 
 
-class GeminiLLM:
+LLM_PROVIDERS = ("gemini", "fake")
+
+EMPTY_RESPONSE_MESSAGE = "I apologize, but I couldn't generate a response for this request. Please try rephrasing your question."
+
+# Static guidance sent with every request. It lives in the system instruction
+# (not the user turn) so the whole instruction is a stable, cacheable prefix.
+RESPONSE_GUIDELINES = """## IMPORTANT
+- Provide a COMPREHENSIVE, DETAILED response
+- Include ALL sections mentioned in the system instructions
+- Use proper Markdown formatting with headers, tables, code blocks
+- Minimum 1500 words for thorough coverage
+- Be specific and actionable, not generic
+- Include real-world examples and specific recommendations"""
+
+
+class LLMProvider(ABC):
+    """Interface for text-generation backends routed by LLMService; subclasses implement `stream`"""
+    
+    model_name: str = ""
+    
+    def _initialize(self):
+        """Set up clients; safe to call repeatedly"""
+    
+    async def generate(
+        self,
+        prompt: str,
+        system_prompt: str,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        **kwargs
+    ) -> str:
+        chunks = []
+        async for chunk in self.stream(prompt, system_prompt, temperature, max_tokens, **kwargs):
+            chunks.append(chunk)
+        return "".join(chunks)
+    
+    @abstractmethod
+    def stream(
+        self,
+        prompt: str,
+        system_prompt: str,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """Yield response text chunks as they are produced"""
+    
+    def release_prompt_caches(self):
+        """Drop provider-side caches held by this client"""
+
+
+@dataclass
+class _PromptCacheEntry:
+    key: str
+    instruction: str
+    cache_name: Optional[str] = None
+    expires_at: float = float("inf")
+
+
+class GeminiLLM(LLMProvider):
     """Google Gemini API LLM Service"""
     
-    def __init__(self, api_key: str, model: str = "gemini-1.5-flash"):
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "gemini-1.5-flash",
+        context_cache: bool = True,
+        cache_ttl: int = 3600,
+        cache_refresh_margin: int = 300,
+    ):
         self.api_key = api_key
         self.model_name = model
-        self._model = None
+        self.context_cache = context_cache
+        self.cache_ttl = cache_ttl
+        self.cache_refresh_margin = cache_refresh_margin
+        self._generative_client = None
+        self._cache_client = None
         self._initialized = False
+        # One context cache (or plain system instruction) per distinct system prompt, keyed by its hash
+        self._prompt_cache: Dict[str, _PromptCacheEntry] = {}
+        self._prompt_cache_lock = threading.Lock()
+        # Serialize cache create/refresh RPCs per system prompt; the shared lock only guards the dicts
+        self._prompt_key_locks: Dict[str, threading.Lock] = {}
     
     def _initialize(self):
         if self._initialized:
             return
         
         try:
-            import google.generativeai as genai
-            genai.configure(api_key=self.api_key)
-            self._model = genai.GenerativeModel(self.model_name)
+            import google.generativeai  # noqa: F401  (protos and response types used below)
+            from google.ai import generativelanguage as glm
+            # Per-instance clients instead of genai.configure(), which is
+            # process-global and would make every endpoint share one API key;
+            # requests go through these public clients, not GenerativeModel.
+            client_options = {"api_key": self.api_key}
+            self._generative_client = glm.GenerativeServiceClient(client_options=client_options)
+            self._cache_client = glm.CacheServiceClient(client_options=client_options)
             self._initialized = True
             logger.info(f"Gemini model '{self.model_name}' initialized successfully")
         except ImportError:
@@ -33,86 +124,393 @@ class GeminiLLM:
             logger.error(f"Failed to initialize Gemini: {e}")
             raise
     
+    @property
+    def _model_path(self) -> str:
+        return self.model_name if "/" in self.model_name else f"models/{self.model_name}"
+    
+    def _prompt_entry(self, system_prompt: str) -> _PromptCacheEntry:
+        """The system instruction's context cache when possible, refreshed before it expires"""
+        instruction = f"{system_prompt}\n\n{RESPONSE_GUIDELINES}"
+        key = hashlib.sha256(instruction.encode("utf-8")).hexdigest()
+        
+        with self._prompt_cache_lock:
+            entry = self._prompt_cache.get(key)
+            if entry and time.monotonic() < entry.expires_at - self.cache_refresh_margin:
+                return entry
+            key_lock = self._prompt_key_locks.setdefault(key, threading.Lock())
+        
+        # The RPCs below run outside the shared lock, so other prompts never wait on them
+        if entry and time.monotonic() < entry.expires_at:
+            # Still live: one thread refreshes it while the others keep using it
+            if not key_lock.acquire(blocking=False):
+                return entry
+        else:
+            key_lock.acquire()
+        try:
+            with self._prompt_cache_lock:
+                entry = self._prompt_cache.get(key)
+                if entry and time.monotonic() < entry.expires_at - self.cache_refresh_margin:
+                    return entry
+            
+            if entry and entry.cache_name is not None:
+                entry = self._refresh_cached_content(entry)
+            else:
+                entry = self._create_prompt_cache_entry(key, instruction)
+            with self._prompt_cache_lock:
+                self._prompt_cache[key] = entry
+            return entry
+        finally:
+            key_lock.release()
+    
+    def _create_prompt_cache_entry(self, key: str, instruction: str) -> _PromptCacheEntry:
+        from google.generativeai import protos
+        
+        if self.context_cache:
+            try:
+                cached_content = self._cache_client.create_cached_content(
+                    protos.CreateCachedContentRequest(
+                        cached_content=protos.CachedContent(
+                            model=self._model_path,
+                            display_name=f"promptcraft-{key[:16]}",
+                            system_instruction=protos.Content(parts=[protos.Part(text=instruction)]),
+                            ttl=datetime.timedelta(seconds=self.cache_ttl),
+                        )
+                    )
+                )
+                logger.info(f"Registered context cache '{cached_content.name}' for system prompt {key[:12]}")
+                return _PromptCacheEntry(
+                    key=key,
+                    instruction=instruction,
+                    cache_name=cached_content.name,
+                    expires_at=time.monotonic() + self.cache_ttl,
+                )
+            except Exception as e:
+                # Prompts below the provider's minimum cacheable size, or models
+                # without caching support, still get a stable system-instruction slot.
+                logger.warning(f"Context cache unavailable for system prompt {key[:12]}: {e}")
+        
+        return _PromptCacheEntry(key=key, instruction=instruction)
+    
+    def _refresh_cached_content(self, entry: _PromptCacheEntry) -> _PromptCacheEntry:
+        from google.generativeai import protos
+        from google.protobuf import field_mask_pb2
+        
+        try:
+            self._cache_client.update_cached_content(
+                protos.UpdateCachedContentRequest(
+                    cached_content=protos.CachedContent(
+                        name=entry.cache_name,
+                        ttl=datetime.timedelta(seconds=self.cache_ttl),
+                    ),
+                    update_mask=field_mask_pb2.FieldMask(paths=["ttl"]),
+                )
+            )
+            entry.expires_at = time.monotonic() + self.cache_ttl
+            logger.info(f"Refreshed context cache '{entry.cache_name}'")
+            return entry
+        except Exception as e:
+            logger.warning(f"Failed to refresh context cache '{entry.cache_name}': {e}")
+        
+        # The cache expired or was evicted - register the prefix again
+        return self._create_prompt_cache_entry(entry.key, entry.instruction)
+    
+    def release_prompt_caches(self):
+        """Delete provider-side context caches registered by this client"""
+        with self._prompt_cache_lock:
+            entries = list(self._prompt_cache.values())
+            self._prompt_cache.clear()
+        
+        for entry in entries:
+            if entry.cache_name is None:
+                continue
+            try:
+                self._cache_client.delete_cached_content(name=entry.cache_name)
+            except Exception as e:
+                logger.warning(f"Failed to delete context cache '{entry.cache_name}': {e}")
+    
     async def generate(
         self,
         prompt: str,
         system_prompt: str,
         temperature: float = 0.7,
-        max_tokens: int = 8192,
+        max_tokens: Optional[int] = None,
         **kwargs
     ) -> str:
         self._initialize()
         
-        # Combine system prompt and user prompt for comprehensive response
-        full_prompt = f"""## SYSTEM INSTRUCTIONS
-{system_prompt}
-
-## USER REQUEST
-{prompt}
-
-## IMPORTANT
-- Provide a COMPREHENSIVE, DETAILED response
-- Include ALL sections mentioned in the system instructions
-- Use proper Markdown formatting with headers, tables, code blocks
-- Minimum 1500 words for thorough coverage
-- Be specific and actionable, not generic
-- Include real-world examples and specific recommendations"""
-        
         # Run in executor since Gemini SDK is synchronous
         loop = asyncio.get_event_loop()
         try:
             response = await loop.run_in_executor(
                 None,
-                lambda: self._generate_sync(full_prompt, temperature, max_tokens)
+                lambda: self._generate_sync(
+                    _user_turn(prompt),
+                    system_prompt,
+                    temperature,
+                    max_tokens,
+                    response_schema=kwargs.get("response_schema"),
+                )
             )
             return response
         except Exception as e:
-            logger.error(f"Gemini generation error: {e}")
+            logger.error("Gemini generation error: %s", e)
             raise
     
-    def _generate_sync(self, prompt: str, temperature: float, max_tokens: int) -> str:
-        import google.generativeai as genai
+    async def stream(
+        self,
+        prompt: str,
+        system_prompt: str,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """Stream response text as Gemini produces it.
+        
+        The synchronous SDK iterator runs in an executor thread and hands chunks
+        to the event loop through a queue. Closing or cancelling the consumer
+        stops the thread at the next chunk, so abandoned calls end early.
+        """
+        self._initialize()
+        
+        loop = asyncio.get_event_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                pass  # Event loop already closed
+        
+        def produce():
+            try:
+                for text in self._stream_sync(
+                    _user_turn(prompt),
+                    system_prompt,
+                    temperature,
+                    max_tokens,
+                    response_schema=kwargs.get("response_schema"),
+                ):
+                    if stop.is_set():
+                        break
+                    put(("chunk", text))
+                put(("done", None))
+            except Exception as e:
+                put(("error", e))
         
+        loop.run_in_executor(None, produce)
         try:
-            # Use maximum available tokens for comprehensive responses
-            generation_config = genai.GenerationConfig(
+            while True:
+                kind, value = await queue.get()
+                if kind == "chunk":
+                    yield value
+                elif kind == "error":
+                    logger.error(f"Gemini generation error: {value}")
+                    raise value
+                else:
+                    return
+        finally:
+            stop.set()
+    
+    def _request(
+        self,
+        prompt: str,
+        system_prompt: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        response_schema=None,
+    ):
+        """GenerateContentRequest against the system prompt's context cache, or with it inline"""
+        import google.generativeai as genai
+        from google.generativeai import protos
+        from google.generativeai.types.generation_types import to_generation_config_dict
+        
+        def generation_config(**structured):
+            # None (no caller cap and MAX_NEW_TOKENS unset) is dropped, leaving the model's own maximum
+            return protos.GenerationConfig(to_generation_config_dict(genai.GenerationConfig(
                 temperature=temperature,
-                max_output_tokens=65536,  # Maximum for gemini-2.5-flash
+                max_output_tokens=max_tokens,
                 top_p=0.95,
                 top_k=40,
-            )
-            
+                **structured,
+            )))
+        
+        config = None
+        if response_schema is not None and response_schema not in _REJECTED_SCHEMAS:
+            try:
+                # Native JSON mode: the model can only emit documents matching the schema
+                config = generation_config(
+                    response_mime_type="application/json",
+                    response_schema=gemini_response_schema(response_schema),
+                )
+            except (ValueError, TypeError, KeyError) as e:
+                # The prompt still asks for JSON and callers parse text, so go on without the schema
+                _REJECTED_SCHEMAS.add(response_schema)
+                logger.warning(f"Gemini SDK rejected the response schema for {response_schema.__name__}, sending without it: {e}")
+        if config is None:
+            config = generation_config(**({"response_mime_type": "application/json"} if response_schema is not None else {}))
+        
+        entry = self._prompt_entry(system_prompt)
+        request = protos.GenerateContentRequest(
+            model=self._model_path,
+            contents=[protos.Content(role="user", parts=[protos.Part(text=prompt)])],
+            generation_config=config,
             # Safety settings to avoid blocking
-            safety_settings = [
-                {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-            ]
-            
-            response = self._model.generate_content(
-                prompt,
-                generation_config=generation_config,
-                safety_settings=safety_settings,
-            )
+            safety_settings=[
+                protos.SafetySetting(category=category, threshold=protos.SafetySetting.HarmBlockThreshold.BLOCK_NONE)
+                for category in (
+                    protos.HarmCategory.HARM_CATEGORY_HARASSMENT,
+                    protos.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
+                    protos.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT,
+                    protos.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT,
+                )
+            ],
+        )
+        if entry.cache_name is not None:
+            request.cached_content = entry.cache_name
+        else:
+            request.system_instruction = protos.Content(parts=[protos.Part(text=entry.instruction)])
+        return request
+    
+    def _generate_sync(
+        self,
+        prompt: str,
+        system_prompt: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        response_schema=None,
+    ) -> str:
+        from google.generativeai.types import GenerateContentResponse
+        
+        try:
+            request = self._request(prompt, system_prompt, temperature, max_tokens, response_schema)
+            response = GenerateContentResponse.from_response(self._generative_client.generate_content(request))
             
             # Check for blocked content or empty response
             if not response.parts:
                 logger.warning("Gemini returned empty response")
                 if response.prompt_feedback:
-                    logger.warning(f"Prompt feedback: {response.prompt_feedback}")
-                return "I apologize, but I couldn't generate a response for this request. Please try rephrasing your question."
+                    logger.warning("Prompt feedback: %s", response.prompt_feedback)
+                return EMPTY_RESPONSE_MESSAGE
             
             # Get full text response
             full_text = response.text
             
             # Log response length for debugging
-            logger.info(f"Generated response length: {len(full_text)} characters")
+            logger.info("Generated response length: %d characters", len(full_text))
+            _log_cache_usage(response)
             
             return full_text
         except Exception as e:
-            logger.error(f"Gemini API error: {type(e).__name__}: {e}")
+            logger.error("Gemini API error: %s: %s", type(e).__name__, e)
             raise
+    
+    def _stream_sync(
+        self,
+        prompt: str,
+        system_prompt: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        response_schema=None,
+    ) -> Iterator[str]:
+        from google.generativeai.types import GenerateContentResponse
+        
+        try:
+            request = self._request(prompt, system_prompt, temperature, max_tokens, response_schema)
+            response = GenerateContentResponse.from_iterator(self._generative_client.stream_generate_content(request))
+            
+            length = 0
+            last_chunk = None
+            for chunk in response:
+                last_chunk = chunk
+                if not chunk.parts:
+                    continue
+                length += len(chunk.text)
+                yield chunk.text
+            
+            if length == 0:
+                logger.warning("Gemini returned empty response")
+                if last_chunk is not None and last_chunk.prompt_feedback:
+                    logger.warning("Prompt feedback: %s", last_chunk.prompt_feedback)
+                yield EMPTY_RESPONSE_MESSAGE
+                return
+            
+            logger.info("Generated response length: %d characters", length)
+            _log_cache_usage(last_chunk)
+        except Exception as e:
+            logger.error("Gemini API error: %s: %s", type(e).__name__, e)
+            raise
+
+
+def _user_turn(prompt: str) -> str:
+    # The system prompt goes into the (cached) system instruction; only the
+    # user request is sent as content on each call.
+    return f"""## USER REQUEST
+{prompt}"""
+
+
+# Response models whose schema the installed SDK refused; sent without one from then on
+_REJECTED_SCHEMAS: set = set()
+
+
+@lru_cache(maxsize=None)
+def _schema_field_supported(name: str) -> bool:
+    """Whether the installed SDK's Schema proto has `name` (newer fields are missing from older releases)"""
+    try:
+        from google.generativeai import protos
+    except ImportError:
+        return False
+    return name in protos.Schema.meta.fields
+
+
+@lru_cache(maxsize=None)
+def gemini_response_schema(model) -> Dict[str, Any]:
+    """Gemini response_schema for a pydantic model class"""
+    schema = model.model_json_schema()
+    return _openapi_subset(schema, schema.get("$defs", {}), _schema_field_supported("property_ordering"))
+
+
+def _openapi_subset(schema: Dict[str, Any], defs: Dict[str, Any], ordering: bool = False) -> Dict[str, Any]:
+    """Inline $refs and keep only the OpenAPI fields Gemini accepts"""
+    if "$ref" in schema:
+        return _openapi_subset(defs[schema["$ref"].rsplit("/", 1)[-1]], defs, ordering)
+    if "anyOf" in schema:
+        # Optional[X] -> X, nullable
+        options = [option for option in schema["anyOf"] if option.get("type") != "null"]
+        converted = _openapi_subset(options[0], defs, ordering)
+        if len(options) < len(schema["anyOf"]):
+            converted["nullable"] = True
+        return converted
+    
+    converted = {"type": schema["type"]}
+    for key in ("description", "enum", "format"):
+        if key in schema:
+            converted[key] = schema[key]
+    if schema["type"] == "object":
+        converted["properties"] = {
+            name: _openapi_subset(value, defs, ordering) for name, value in schema.get("properties", {}).items()
+        }
+        if ordering:
+            # Gemini otherwise picks its own key order; keep the model's, which
+            # streaming consumers rely on. Only SDK releases whose Schema proto
+            # has property_ordering accept it; older ones reject the whole schema.
+            converted["property_ordering"] = list(converted["properties"])
+        if schema.get("required"):
+            converted["required"] = list(schema["required"])
+    elif schema["type"] == "array":
+        converted["items"] = _openapi_subset(schema.get("items", {"type": "string"}), defs, ordering)
+    return converted
+
+
+def _log_cache_usage(response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    LLM_TOKENS.inc("prompt", amount=getattr(usage, "prompt_token_count", 0) or 0)
+    LLM_TOKENS.inc("completion", amount=getattr(usage, "candidates_token_count", 0) or 0)
+    if getattr(usage, "cached_content_token_count", 0):
+        LLM_TOKENS.inc("cached_prompt", amount=usage.cached_content_token_count)
+        logger.info("Served %d prompt tokens from context cache", usage.cached_content_token_count)
 
 
 class LocalEmbeddings:
@@ -121,14 +519,23 @@ class LocalEmbeddings:
     def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
         self.model_name = model_name
         self._model = None
+        self._load_lock = threading.Lock()
+    
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
     
     def _load_model(self):
         if self._model is not None:
             return
         
-        from sentence_transformers import SentenceTransformer
-        self._model = SentenceTransformer(self.model_name)
-        logger.info(f"Embedding model '{self.model_name}' loaded")
+        # Warm-up and the first request may both try to load the model
+        with self._load_lock:
+            if self._model is not None:
+                return
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+            logger.info(f"Embedding model '{self.model_name}' loaded")
     
     def encode(self, texts: List[str]) -> List[List[float]]:
         self._load_model()
@@ -137,48 +544,138 @@ class LocalEmbeddings:
 
 
 class LLMService:
-    """Main LLM Service using Gemini API"""
+    """Main LLM Service routing requests across a pool of provider endpoints"""
     
     def __init__(self):
         self.settings = get_settings()
-        self._llm: Optional[GeminiLLM] = None
-        self._embeddings: Optional[LocalEmbeddings] = None
+        self._pool: Optional[EndpointPool] = None
+        self._embeddings = None
+        self.retry_policy = RetryPolicy(
+            attempts=self.settings.llm_retry_attempts,
+            initial=self.settings.llm_retry_initial_backoff,
+            maximum=self.settings.llm_retry_max_backoff,
+            jitter=self.settings.llm_retry_jitter,
+        )
+    
+    @property
+    def provider_name(self) -> str:
+        provider = self.settings.llm_provider.lower()
+        if provider not in LLM_PROVIDERS:
+            logger.warning(f"Unknown LLM_PROVIDER '{provider}', using gemini")
+            return "gemini"
+        return provider
+    
+    @property
+    def ready(self) -> bool:
+        return self._pool is not None
+    
+    def _check_configured(self):
+        if self.provider_name == "gemini" and not self.settings.gemini_api_keys_list:
+            raise ValueError("GEMINI_API_KEY not configured. Please add it to your .env file.")
     
     async def initialize(self):
         """Initialize the LLM service"""
-        if not self.settings.gemini_api_key:
+        try:
+            self._check_configured()
+        except ValueError:
             logger.warning("GEMINI_API_KEY not set. LLM features will not work.")
             return
         
         try:
-            self._llm = GeminiLLM(
-                api_key=self.settings.gemini_api_key,
-                model=self.settings.gemini_model,
-            )
-            # Test initialization
-            self._llm._initialize()
-            logger.info("✓ Gemini LLM service initialized")
+            pool = self._create_pool()
+            # Test initialization (SDK imports and client setup block, so off the loop)
+            loop = asyncio.get_event_loop()
+            for endpoint in pool.endpoints:
+                await loop.run_in_executor(None, endpoint.provider._initialize)
+            self._pool = pool
+            logger.info(f"✓ LLM service initialized ({self.provider_name}, {len(self._pool.endpoints)} endpoint(s))")
         except Exception as e:
-            logger.error(f"✗ Failed to initialize Gemini: {e}")
+            logger.error(f"✗ Failed to initialize {self.provider_name} LLM: {e}")
             raise
     
-    @property
-    def llm(self) -> GeminiLLM:
-        if self._llm is None:
-            if not self.settings.gemini_api_key:
-                raise ValueError("GEMINI_API_KEY not configured. Please add it to your .env file.")
-            self._llm = GeminiLLM(
-                api_key=self.settings.gemini_api_key,
-                model=self.settings.gemini_model,
+    def _create_providers(self) -> List[Tuple[str, LLMProvider]]:
+        if self.provider_name == "fake":
+            from app.services.fake_llm import FakeLLM
+            return [
+                (f"fake#{index}", FakeLLM.from_settings(self.settings, seed_offset=index))
+                for index in range(max(1, self.settings.fake_llm_endpoints))
+            ]
+        
+        providers = []
+        for key_index, api_key in enumerate(self.settings.gemini_api_keys_list):
+            for model in self.settings.gemini_models_list:
+                providers.append((
+                    # Never expose the key itself in names or stats
+                    f"{model}#key{key_index}",
+                    GeminiLLM(
+                        api_key=api_key,
+                        model=model,
+                        context_cache=self.settings.prompt_cache_enabled,
+                        cache_ttl=self.settings.prompt_cache_ttl,
+                        cache_refresh_margin=self.settings.prompt_cache_refresh_margin,
+                    ),
+                ))
+        return providers
+    
+    def _create_pool(self) -> EndpointPool:
+        endpoints = [
+            LLMEndpoint(
+                name=name,
+                provider=provider,
+                max_concurrency=self.settings.llm_endpoint_max_concurrency,
+                rate_per_minute=self.settings.llm_endpoint_rate_per_minute,
+                burst=self.settings.llm_endpoint_burst,
+                breaker=CircuitBreaker(
+                    name,
+                    failure_threshold=self.settings.llm_breaker_failure_threshold,
+                    recovery_timeout=self.settings.llm_breaker_recovery_timeout,
+                ),
             )
-        return self._llm
+            for name, provider in self._create_providers()
+        ]
+        return EndpointPool(
+            endpoints,
+            strategy=self.settings.llm_routing_strategy,
+            cooldown=self.settings.llm_endpoint_cooldown,
+            hedge_initial_delay=self.settings.llm_hedge_initial_delay if self.settings.llm_hedge_enabled else None,
+            hedge_min_delay=self.settings.llm_hedge_min_delay,
+        )
+    
+    async def close(self):
+        """Release provider-side resources such as context caches"""
+        if self._pool is None:
+            return
+        loop = asyncio.get_event_loop()
+        for endpoint in self._pool.endpoints:
+            await loop.run_in_executor(None, endpoint.provider.release_prompt_caches)
+    
+    @property
+    def pool(self) -> EndpointPool:
+        if self._pool is None:
+            self._check_configured()
+            self._pool = self._create_pool()
+        return self._pool
+    
+    @property
+    def llm(self) -> LLMProvider:
+        """The preferred endpoint's provider; the first configured one while every breaker is open"""
+        candidates = self.pool.candidates()
+        return (candidates[0] if candidates else self.pool.endpoints[0]).provider
     
     @property
     def embeddings(self) -> LocalEmbeddings:
         if self._embeddings is None:
-            self._embeddings = LocalEmbeddings(self.settings.embedding_model)
+            if self.settings.embedding_sidecar_address:
+                from app.services.embedding_sidecar import RemoteEmbeddings
+                self._embeddings = RemoteEmbeddings(
+                    self.settings.embedding_sidecar_address,
+                    self.settings.embedding_sidecar_authkey,
+                )
+            else:
+                self._embeddings = LocalEmbeddings(self.settings.embedding_model)
         return self._embeddings
     
+    @traced("llm")
     async def generate(
         self,
         prompt: str,
@@ -187,17 +684,83 @@ class LLMService:
         max_tokens: Optional[int] = None,
         **kwargs
     ) -> str:
+        # Nothing reaches the caller before completion, so the whole call can be retried
+        async for attempt in self.retry_policy.retrying():
+            with attempt:
+                chunks = []
+                async with aclosing(self._stream_once(prompt, system_prompt, temperature, max_tokens, **kwargs)) as stream:
+                    async for chunk in stream:
+                        chunks.append(chunk)
+                return "".join(chunks)
+    
+    @traced("llm_stream")
+    async def stream(
+        self,
+        prompt: str,
+        system_prompt: str,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """Stream a response; retries only happen before the first chunk is emitted"""
+        attempt_number = 0
+        while True:
+            attempt_number += 1
+            emitted = False
+            try:
+                async with aclosing(self._stream_once(prompt, system_prompt, temperature, max_tokens, **kwargs)) as stream:
+                    async for chunk in stream:
+                        emitted = True
+                        yield chunk
+                return
+            except Exception as e:
+                if emitted or not self.retry_policy.should_retry(e, attempt_number):
+                    raise
+                delay = self.retry_policy.backoff(attempt_number)
+                logger.warning(f"LLM stream failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+    
+    def _stream_once(
+        self,
+        prompt: str,
+        system_prompt: str,
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        **kwargs
+    ) -> AsyncIterator[str]:
         temperature = temperature or self.settings.temperature
         max_tokens = max_tokens or self.settings.max_new_tokens
         
-        return await self.llm.generate(
+        return self._measured(self.pool.stream(lambda llm: llm.stream(
             prompt=prompt,
             system_prompt=system_prompt,
             temperature=temperature,
             max_tokens=max_tokens,
             **kwargs
-        )
+        )))
+    
+    async def _measured(self, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Record first-token and total latency of one provider call"""
+        started = time.perf_counter()
+        waiting_first = True
+        try:
+            async with aclosing(chunks):
+                async for chunk in chunks:
+                    if waiting_first:
+                        waiting_first = False
+                        STAGE_LATENCY.observe(time.perf_counter() - started, "llm_first_token")
+                    yield chunk
+        except Exception as e:
+            LLM_ERRORS.inc(type(e).__name__)
+            raise
+        STAGE_LATENCY.observe(time.perf_counter() - started, "llm_total")
+    
+    def endpoint_stats(self) -> Dict[str, Any]:
+        if self._pool is None:
+            return {"strategy": self.settings.llm_routing_strategy, "endpoints": []}
+        return self._pool.stats()
     
+    @timed_stage("embedding")
     def get_embeddings(self, texts: List[str]) -> List[List[float]]:
         return self.embeddings.encode(texts)
 
@@ -0,0 +1,339 @@
+from typing import Optional, List, Dict, Any, Callable, AsyncIterator
+from contextlib import aclosing
+import asyncio
+import logging
+import time
+
+from app.services.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LatencyWindow,
+    is_failover_error,
+    status_code_of,
+)
+
+logger = logging.getLogger(__name__)
+
+ROUTING_STRATEGIES = ("least_outstanding", "ewma_latency")
+
+# Provider operation: takes the endpoint's provider and returns a chunk stream
+StreamOperation = Callable[[Any], AsyncIterator[str]]
+
+_EXHAUSTED = object()
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts up to `capacity`"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+    
+    async def acquire(self, tokens: float = 1.0):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class LLMEndpoint:
+    """One provider endpoint (API key x model) with its own limits, breaker and latency stats"""
+    
+    def __init__(
+        self,
+        name: str,
+        provider: Any,
+        max_concurrency: int = 8,
+        rate_per_minute: float = 60.0,
+        burst: int = 10,
+        ewma_alpha: float = 0.2,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.name = name
+        self.provider = provider
+        self.max_concurrency = max(1, max_concurrency)
+        self.ewma_alpha = ewma_alpha
+        self.breaker = breaker or CircuitBreaker(name)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._bucket = TokenBucket(rate_per_minute / 60.0, burst)
+        
+        self.outstanding = 0
+        self.ewma_latency: Optional[float] = None
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.cancelled = 0
+        self.last_error: Optional[str] = None
+        self.cooldown_until = 0.0
+    
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+    
+    def score(self, strategy: str) -> float:
+        """Lower is better"""
+        if strategy == "ewma_latency":
+            # Expected first-token time if queued behind the current load
+            return (self.ewma_latency or 0.0) * (self.outstanding + 1)
+        return self.outstanding / self.max_concurrency
+    
+    def cool_down(self, seconds: float):
+        self.cooldown_until = max(self.cooldown_until, time.monotonic() + seconds)
+    
+    async def stream(
+        self,
+        operation: StreamOperation,
+        first_token: Optional[LatencyWindow] = None,
+        on_admitted: Optional[Callable[[], None]] = None,
+    ) -> AsyncIterator[str]:
+        """Stream `operation(provider)` within this endpoint's limits and circuit breaker.
+
+        First-token latency is measured from admission (concurrency slot and
+        rate token acquired), so local queueing doesn't count as a slow provider.
+        """
+        self.breaker.before_call()
+        self.outstanding += 1
+        self.requests += 1
+        verdict = False
+        try:
+            async with self._semaphore:
+                await self._bucket.acquire()
+                started = time.monotonic()
+                if on_admitted is not None:
+                    on_admitted()
+                waiting_first = True
+                try:
+                    async with aclosing(operation(self.provider)) as chunks:
+                        async for chunk in chunks:
+                            if waiting_first:
+                                waiting_first = False
+                                latency = time.monotonic() - started
+                                self.record_latency(latency)
+                                if first_token is not None:
+                                    first_token.record(latency)
+                            yield chunk
+                except Exception as e:
+                    self.failures += 1
+                    if status_code_of(e) == 429:
+                        self.rate_limited += 1
+                    self.last_error = f"{type(e).__name__}: {e}"[:300]
+                    if is_failover_error(e):
+                        self.breaker.record_failure()
+                        verdict = True
+                    raise
+                self.successes += 1
+                self.breaker.record_success()
+                verdict = True
+        except (asyncio.CancelledError, GeneratorExit):
+            self.cancelled += 1
+            raise
+        finally:
+            self.outstanding -= 1
+            if not verdict:
+                self.breaker.release()
+    
+    def record_latency(self, seconds: float):
+        if self.ewma_latency is None:
+            self.ewma_latency = seconds
+        else:
+            self.ewma_latency = self.ewma_alpha * seconds + (1 - self.ewma_alpha) * self.ewma_latency
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "available": self.available,
+            "circuit": self.breaker.state,
+            "outstanding": self.outstanding,
+            "max_concurrency": self.max_concurrency,
+            "rate_tokens_available": round(self._bucket.available, 2),
+            "ewma_first_token_s": round(self.ewma_latency, 3) if self.ewma_latency is not None else None,
+            "requests": self.requests,
+            "successes": self.successes,
+            "failures": self.failures,
+            "rate_limited": self.rate_limited,
+            "cancelled": self.cancelled,
+            "last_error": self.last_error,
+        }
+
+
+class _StreamAttempt:
+    """An endpoint stream whose first chunk is being awaited in a task"""
+    
+    def __init__(self, endpoint: LLMEndpoint, operation: StreamOperation, first_token: LatencyWindow):
+        self.endpoint = endpoint
+        # Resolves to the monotonic time the endpoint admitted the call
+        self.admitted = asyncio.get_running_loop().create_future()
+        self.chunks = endpoint.stream(operation, first_token, self._admit)
+        self.first = asyncio.ensure_future(self._first_chunk())
+    
+    def _admit(self):
+        if not self.admitted.done():
+            self.admitted.set_result(time.monotonic())
+    
+    async def _first_chunk(self):
+        try:
+            return await self.chunks.__anext__()
+        except StopAsyncIteration:
+            return _EXHAUSTED
+    
+    async def cancel(self):
+        if not self.first.done():
+            self.first.cancel()
+            try:
+                await self.first
+            except BaseException:
+                pass
+        await self.chunks.aclose()
+
+
+class EndpointPool:
+    """Routes calls across endpoints, hedges stragglers and fails over on 429/5xx"""
+    
+    def __init__(
+        self,
+        endpoints: List[LLMEndpoint],
+        strategy: str = "least_outstanding",
+        cooldown: float = 30.0,
+        hedge_initial_delay: Optional[float] = None,
+        hedge_min_delay: float = 2.0,
+        hedge_min_samples: int = 20,
+    ):
+        if not endpoints:
+            raise ValueError("EndpointPool needs at least one endpoint")
+        if strategy not in ROUTING_STRATEGIES:
+            logger.warning(f"Unknown routing strategy '{strategy}', using least_outstanding")
+            strategy = "least_outstanding"
+        self.endpoints = endpoints
+        self.strategy = strategy
+        self.cooldown = cooldown
+        self.hedge_initial_delay = hedge_initial_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.first_token = LatencyWindow()
+        self.hedges = 0
+        self.hedge_wins = 0
+    
+    def candidates(self, exclude: Optional[set] = None) -> List[LLMEndpoint]:
+        """Endpoints in routing order; cooling-down ones only as a last resort"""
+        exclude = exclude or set()
+        pool = [e for e in self.endpoints if e.name not in exclude and e.breaker.allow()]
+        return sorted(pool, key=lambda e: (not e.available, e.score(self.strategy)))
+    
+    @property
+    def hedge_delay(self) -> Optional[float]:
+        """p95 first-token latency, or the configured initial delay until enough samples exist"""
+        if self.hedge_initial_delay is None:
+            return None
+        if len(self.first_token) < self.hedge_min_samples:
+            return self.hedge_initial_delay
+        return max(self.hedge_min_delay, self.first_token.percentile(0.95))
+    
+    def _start(self, endpoint: LLMEndpoint, operation: StreamOperation) -> _StreamAttempt:
+        return _StreamAttempt(endpoint, operation, self.first_token)
+    
+    async def stream(self, operation: StreamOperation, hedge: bool = True) -> AsyncIterator[str]:
+        """Stream from the best endpoint.
+
+        Fails over to the next endpoint on retryable errors before the first
+        chunk. If the first chunk hasn't arrived within the hedge delay of the
+        call being admitted by its endpoint, a duplicate request is fired at
+        another endpoint; the first to produce a chunk wins and the other is
+        cancelled. There is no hedge when every other endpoint is unavailable.
+        """
+        tried: set = set()
+        attempts: List[_StreamAttempt] = []
+        last_error: Optional[BaseException] = None
+        hedged = not hedge or self.hedge_delay is None
+        winner: Optional[_StreamAttempt] = None
+        first_chunk = None
+        
+        try:
+            while winner is None:
+                if not attempts:
+                    endpoint = next(iter(self.candidates(tried)), None)
+                    if endpoint is None:
+                        raise last_error or CircuitOpenError("All LLM endpoints are unavailable")
+                    tried.add(endpoint.name)
+                    attempts.append(self._start(endpoint, operation))
+                
+                waiting = [a.first for a in attempts]
+                timeout = None
+                if not hedged:
+                    admitted = [a.admitted.result() for a in attempts if a.admitted.done()]
+                    if admitted:
+                        # The hedge clock starts once an endpoint admits the call
+                        timeout = max(0.0, min(admitted) + self.hedge_delay - time.monotonic())
+                    else:
+                        waiting += [a.admitted for a in attempts]
+                done, _ = await asyncio.wait(waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                
+                if not done:
+                    # Straggler: duplicate the request on an endpoint that isn't already serving it
+                    hedged = True
+                    endpoint = next(iter(self.candidates(tried)), None)
+                    if endpoint is not None:
+                        tried.add(endpoint.name)
+                        attempts.append(self._start(endpoint, operation))
+                        self.hedges += 1
+                        logger.info(f"Hedging LLM request on '{endpoint.name}' after {self.hedge_delay:.1f}s without a first token")
+                    continue
+                
+                for attempt in list(attempts):
+                    if not attempt.first.done():
+                        continue
+                    error = attempt.first.exception()
+                    if error is None:
+                        winner = attempt
+                        first_chunk = attempt.first.result()
+                        break
+                    attempts.remove(attempt)
+                    if not is_failover_error(error) and not isinstance(error, CircuitOpenError):
+                        raise error
+                    attempt.endpoint.cool_down(self.cooldown if status_code_of(error) == 429 else self.cooldown / 3)
+                    last_error = error
+                    logger.warning(f"LLM endpoint '{attempt.endpoint.name}' failed ({type(error).__name__}), failing over")
+            
+            if len(attempts) > 1 and winner is not attempts[0]:
+                self.hedge_wins += 1
+            for attempt in attempts:
+                if attempt is not winner:
+                    await attempt.cancel()
+            attempts = [winner]
+            
+            if first_chunk is not _EXHAUSTED:
+                yield first_chunk
+                async for chunk in winner.chunks:
+                    yield chunk
+        finally:
+            for attempt in attempts:
+                await attempt.cancel()
+    
+    def stats(self) -> Dict[str, Any]:
+        p95 = self.first_token.percentile(0.95)
+        return {
+            "strategy": self.strategy,
+            "first_token_p95_s": round(p95, 3) if p95 is not None else None,
+            "hedge_delay_s": self.hedge_delay,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "endpoints": [e.stats() for e in self.endpoints],
+        }
@@ -0,0 +1,108 @@
+from typing import Optional, Dict, List, Any
+from collections import deque
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from app.services.metrics import LOOP_BLOCKED, LOOP_LAG, LOOP_LAG_LAST
+
+logger = logging.getLogger(__name__)
+
+
+class LoopMonitor:
+    """Watchdog thread measuring event-loop lag and catching blocking calls.
+
+    Every `interval` seconds the watchdog schedules a no-op on the loop with
+    `call_soon_threadsafe` and times how long the loop takes to run it; that
+    delay is the lag metric. If the callback has not run after
+    `block_threshold` seconds, something synchronous is holding the loop, so
+    the loop thread's stack is captured right then (pointing at the offending
+    call) and logged once the loop recovers, with the total blocked time.
+
+    `slow_callback` (seconds) turns on asyncio debug mode, which logs every
+    callback or task step that runs longer than that on the loop thread, and
+    lowers the stack-capture threshold to match.
+    """
+    
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        interval: float = 0.1,
+        block_threshold: float = 0.25,
+        slow_callback: float = 0.0,
+        history: int = 20,
+    ):
+        self.loop = loop
+        self.interval = interval
+        self.block_threshold = min(block_threshold, slow_callback) if slow_callback > 0 else block_threshold
+        self.slow_callback = slow_callback
+        self.blocks: "deque[Dict[str, Any]]" = deque(maxlen=history)
+        self._loop_thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self):
+        """Call from the loop thread"""
+        self._loop_thread_id = threading.get_ident()
+        if self.slow_callback > 0:
+            self.loop.set_debug(True)
+            self.loop.slow_callback_duration = self.slow_callback
+            logger.info(f"Event-loop debug mode: flagging callbacks over {self.slow_callback * 1000:.0f} ms")
+        self._thread = threading.Thread(target=self._run, name="loop-monitor", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.block_threshold + self.interval + 1.0)
+            self._thread = None
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            ran = threading.Event()
+            scheduled = time.perf_counter()
+            try:
+                self.loop.call_soon_threadsafe(ran.set)
+            except RuntimeError:
+                return  # loop closed
+            if ran.wait(self.block_threshold):
+                lag = time.perf_counter() - scheduled
+                LOOP_LAG.observe(lag)
+                LOOP_LAG_LAST.set(lag)
+                continue
+            
+            stack = self._loop_stack()
+            while not ran.wait(self.interval):
+                if self._stop.is_set() or self.loop.is_closed():
+                    return
+            lag = time.perf_counter() - scheduled
+            LOOP_LAG.observe(lag)
+            LOOP_LAG_LAST.set(lag)
+            LOOP_BLOCKED.inc()
+            self.blocks.append({
+                "at": time.time() - lag,
+                "blocked_ms": round(lag * 1000, 1),
+                "stack": stack,
+            })
+            logger.warning(
+                f"Event loop blocked for at least {lag * 1000:.0f} ms; stack at {self.block_threshold * 1000:.0f} ms:\n"
+                + "".join(stack)
+            )
+    
+    def _loop_stack(self) -> List[str]:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return []
+        return traceback.format_stack(frame)
+    
+    def report(self) -> Dict[str, Any]:
+        return {
+            "interval_ms": self.interval * 1000,
+            "block_threshold_ms": self.block_threshold * 1000,
+            "debug": self.slow_callback > 0,
+            "blocked_total": LOOP_BLOCKED.value(),
+            "recent_blocks": list(self.blocks),
+        }
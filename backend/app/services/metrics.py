@@ -0,0 +1,438 @@
+from typing import Optional, Dict, List, Set, Tuple, Callable, Iterable, Any
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import functools
+import glob
+import inspect
+import json
+import os
+import threading
+import time
+
+from app.services.profiler import PROFILES
+from app.services.tracing import route_template, span
+
+# Seconds; spans sub-millisecond cache reads up to multi-minute generations
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+    
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+    
+    def collect(self) -> Dict[Labels, Any]:
+        raise NotImplementedError
+    
+    def merge(self, workers: Dict[str, Dict[Labels, Any]]) -> Tuple[Tuple[str, ...], Dict[Labels, Any]]:
+        """(label names, values) combining every worker's `collect()`, keyed by worker pid"""
+        raise NotImplementedError
+    
+    def render(self, labelnames: Optional[Tuple[str, ...]] = None, values: Optional[Dict[Labels, Any]] = None) -> List[str]:
+        """This process's values, or the given merged ones"""
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonic count per label set; `inc` is a dict update under a lock"""
+    
+    kind = "counter"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+    
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+    
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+    
+    def items(self) -> List[Tuple[Labels, float]]:
+        with self._lock:
+            return list(self._values.items())
+    
+    def collect(self) -> Dict[Labels, float]:
+        return dict(self.items())
+    
+    def merge(self, workers: Dict[str, Dict[Labels, float]]) -> Tuple[Tuple[str, ...], Dict[Labels, float]]:
+        totals: Dict[Labels, float] = {}
+        for values in workers.values():
+            for labels, value in values.items():
+                totals[labels] = totals.get(labels, 0.0) + value
+        return self.labelnames, totals
+    
+    def render(self, labelnames: Optional[Tuple[str, ...]] = None, values: Optional[Dict[Labels, float]] = None) -> List[str]:
+        lines = self._header()
+        if values is None:
+            labelnames, values = self.labelnames, self.collect()
+        for labels, value in values.items():
+            lines.append(f"{self.name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Current value per label set, either set directly or read from `collect` at scrape time"""
+    
+    kind = "gauge"
+    
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        collect: Optional[Callable[[], Dict[Labels, float]]] = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+        self._collect = collect
+    
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+    
+    def collect(self) -> Dict[Labels, float]:
+        if self._collect is not None:
+            return self._collect()
+        with self._lock:
+            return dict(self._values)
+    
+    def merge(self, workers: Dict[str, Dict[Labels, float]]) -> Tuple[Tuple[str, ...], Dict[Labels, float]]:
+        # Point-in-time values don't add up across processes; keep one series per worker
+        merged = {
+            labels + (worker,): value
+            for worker, values in workers.items()
+            for labels, value in values.items()
+        }
+        return self.labelnames + ("worker",), merged
+    
+    def render(self, labelnames: Optional[Tuple[str, ...]] = None, values: Optional[Dict[Labels, float]] = None) -> List[str]:
+        lines = self._header()
+        if values is None:
+            labelnames, values = self.labelnames, self.collect()
+        for labels, value in values.items():
+            lines.append(f"{self.name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Bucketed observations per label set (non-cumulative internally, cumulative when rendered)"""
+    
+    kind = "histogram"
+    
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count], sum
+        self._series: Dict[Labels, List[Any]] = {}
+    
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+    
+    @contextmanager
+    def time(self, *labels: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+    
+    def collect(self) -> Dict[Labels, List[Any]]:
+        with self._lock:
+            return {labels: [list(counts), total] for labels, (counts, total) in self._series.items()}
+    
+    def merge(self, workers: Dict[str, Dict[Labels, List[Any]]]) -> Tuple[Tuple[str, ...], Dict[Labels, List[Any]]]:
+        totals: Dict[Labels, List[Any]] = {}
+        for values in workers.values():
+            for labels, (counts, total) in values.items():
+                series = totals.setdefault(labels, [[0] * len(counts), 0.0])
+                series[0] = [a + b for a, b in zip(series[0], counts)]
+                series[1] += total
+        return self.labelnames, totals
+    
+    def render(self, labelnames: Optional[Tuple[str, ...]] = None, values: Optional[Dict[Labels, List[Any]]] = None) -> List[str]:
+        lines = self._header()
+        if values is None:
+            labelnames, values = self.labelnames, self.collect()
+        for labels, (counts, total) in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def clear_snapshots(directory: str):
+    """Remove snapshots left by a previous run; call before starting the workers"""
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class MetricsRegistry:
+    """Metrics of this process.
+
+    With several worker processes, each one writes a snapshot to a shared
+    directory (`write_snapshot`) and `render_aggregate` merges them: counters
+    and histograms are summed, gauges get a `worker` label per live process.
+    Snapshots of exited workers still count towards the totals, so counters
+    never go backwards.
+    """
+    
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+    
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+    
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+    
+    def write_snapshot(self, directory: str):
+        snapshot = {
+            name: [[list(labels), value] for labels, value in metric.collect().items()]
+            for name, metric in list(self._metrics.items())
+        }
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        # Written aside and renamed, so readers never see a partial file
+        with open(path + ".tmp", "w") as f:
+            json.dump(snapshot, f)
+        os.replace(path + ".tmp", path)
+    
+    def _read_snapshots(self, directory: str) -> Dict[str, Dict[str, Any]]:
+        snapshots = {}
+        for path in glob.glob(os.path.join(directory, "*.json")):
+            try:
+                with open(path) as f:
+                    snapshots[os.path.basename(path)[:-len(".json")]] = json.load(f)
+            except (OSError, ValueError):
+                continue
+        return snapshots
+    
+    def render_aggregate(self, directory: str) -> str:
+        """Every worker's metrics, merged; blocking file I/O, so call it off the event loop"""
+        self.write_snapshot(directory)
+        snapshots = self._read_snapshots(directory)
+        live: Set[str] = {pid for pid in snapshots if pid.isdigit() and _process_alive(int(pid))}
+        lines: List[str] = []
+        for name, metric in list(self._metrics.items()):
+            workers = {
+                pid: {tuple(labels): value for labels, value in snapshot.get(name, [])}
+                for pid, snapshot in snapshots.items()
+                if metric.kind != "gauge" or pid in live
+            }
+            lines.extend(metric.render(*metric.merge(workers)))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "promptcraft_http_requests_total", "HTTP requests by route, method and status", ("route", "method", "status"),
+))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "promptcraft_http_request_duration_seconds", "HTTP request latency, including streamed bodies", ("route", "method"),
+))
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "promptcraft_stage_duration_seconds",
+    "Latency of request stages: cache_get, cache_set, embedding, vector_query, prompt_build, "
+    "llm_first_token, llm_total, json_parse",
+    ("stage",),
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "promptcraft_cache_requests_total", "Response cache lookups by category and result (hit/miss)", ("category", "result"),
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "promptcraft_llm_tokens_total", "LLM tokens by kind (prompt, completion, cached_prompt)", ("kind",),
+))
+LLM_ERRORS = REGISTRY.register(Counter(
+    "promptcraft_llm_errors_total", "LLM calls that failed, by exception type", ("error",),
+))
+JOB_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "promptcraft_job_queue_depth", "Background jobs waiting in the queue",
+))
+LOOP_LAG = REGISTRY.register(Histogram(
+    "promptcraft_event_loop_lag_seconds", "Delay before the event loop ran a scheduled callback",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+))
+LOOP_LAG_LAST = REGISTRY.register(Gauge(
+    "promptcraft_event_loop_lag_last_seconds", "Most recent event-loop lag measurement",
+))
+LOOP_BLOCKED = REGISTRY.register(Counter(
+    "promptcraft_event_loop_blocked_total", "Times the event loop stayed blocked past the stack-capture threshold",
+))
+
+
+def _cache_hit_ratio() -> Dict[Labels, float]:
+    totals: Dict[str, List[float]] = {}
+    for (category, result), value in CACHE_REQUESTS.items():
+        counts = totals.setdefault(category, [0.0, 0.0])
+        counts[0 if result == "hit" else 1] += value
+    return {(category,): hits / (hits + misses) for category, (hits, misses) in totals.items() if hits + misses}
+
+
+REGISTRY.register(Gauge(
+    "promptcraft_cache_hit_ratio", "Share of response cache lookups that hit, per category since start",
+    ("category",), collect=_cache_hit_ratio,
+))
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as a request stage: the stage histogram, plus a span of the current request's trace"""
+    started = time.perf_counter()
+    try:
+        with span(name):
+            yield
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - started, name)
+
+
+def timed_stage(name: str):
+    """Decorator running a sync or async function as `stage(name)`"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class InstrumentedExecutor(ThreadPoolExecutor):
+    """Default executor that tracks busy workers and queued work for utilization gauges"""
+    
+    def __init__(self, max_workers: Optional[int] = None, **kwargs):
+        super().__init__(max_workers=max_workers, **kwargs)
+        self.busy = 0
+        self.queued = 0
+        self._counter_lock = threading.Lock()
+    
+    def submit(self, fn, /, *args, **kwargs):
+        fn = PROFILES.bind(fn)
+        with self._counter_lock:
+            self.queued += 1
+        
+        def run():
+            with self._counter_lock:
+                self.queued -= 1
+                self.busy += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._counter_lock:
+                    self.busy -= 1
+        
+        return super().submit(run)
+    
+    def collect(self) -> Dict[Labels, float]:
+        return {
+            ("busy",): self.busy,
+            ("queued",): self.queued,
+            ("max_workers",): self._max_workers,
+        }
+
+
+def register_executor(executor: InstrumentedExecutor):
+    REGISTRY.register(Gauge(
+        "promptcraft_executor_threads", "Default thread-pool executor: busy workers, queued calls and size",
+        ("state",), collect=executor.collect,
+    ))
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting HTTP requests and timing them until the last body byte"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        started = time.perf_counter()
+        status = [500]
+        
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Route templates (not raw paths) keep label cardinality bounded
+            path = route_template(scope) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUESTS.inc(path, method, str(status[0]))
+            HTTP_LATENCY.observe(time.perf_counter() - started, path, method)
@@ -0,0 +1,273 @@
+from typing import Optional, Dict, List, Set, Tuple, Union, Any
+from collections import Counter, OrderedDict
+import functools
+import hmac
+import os
+import sys
+import threading
+import time
+
+from app.services.tracing import current_request_id
+
+PROFILE_FORMATS = ("collapsed", "speedscope")
+
+# (function, file, first line) from the outermost frame inwards
+Stack = Tuple[Tuple[str, str, int], ...]
+
+# Innermost Python frames of threads that are parked, not working
+_IDLE_FRAMES = {
+    ("wait", "threading.py"),
+    ("select", "selectors.py"),
+    ("get", "queue.py"),
+    ("_worker", "thread.py"),
+    ("accept", "connection.py"),
+}
+
+
+def admin_authorized(admin_token: str, supplied: Union[str, bytes, None]) -> bool:
+    """Constant-time token check on raw header bytes; anything that doesn't match is rejected.
+
+    Header values reach FastAPI as latin-1 decoded str, so those are encoded
+    back to the bytes the client sent (`compare_digest` on str raises for
+    non-ASCII input).
+    """
+    if not admin_token or supplied is None:
+        return False
+    if isinstance(supplied, str):
+        try:
+            supplied = supplied.encode("latin-1")
+        except UnicodeEncodeError:
+            return False
+    return hmac.compare_digest(admin_token.encode(), supplied)
+
+
+class Profile:
+    """Stack samples per thread, rendered as collapsed stacks or a speedscope file"""
+    
+    def __init__(self, name: str, interval: float):
+        self.name = name
+        self.interval = interval
+        self.started = time.time()
+        self.duration = 0.0
+        self.samples: Dict[str, Counter] = {}
+    
+    @property
+    def sample_count(self) -> int:
+        return sum(sum(counts.values()) for counts in self.samples.values())
+    
+    def collapsed(self) -> str:
+        """Brendan Gregg's folded format: `thread;outer;...;inner count`, one stack per line"""
+        lines = []
+        for thread, counts in self.samples.items():
+            for stack, count in counts.most_common():
+                frames = [f"{name} ({os.path.basename(path)}:{line})" for name, path, line in stack]
+                lines.append(";".join([thread, *frames]) + f" {count}")
+        return "\n".join(lines) + "\n"
+    
+    def speedscope(self) -> Dict[str, Any]:
+        frames: List[Dict[str, Any]] = []
+        frame_index: Dict[Tuple[str, str, int], int] = {}
+        profiles = []
+        for thread, counts in self.samples.items():
+            samples, weights = [], []
+            for stack, count in counts.items():
+                indices = []
+                for frame in stack:
+                    if frame not in frame_index:
+                        frame_index[frame] = len(frames)
+                        frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                    indices.append(frame_index[frame])
+                samples.append(indices)
+                weights.append(count * self.interval)
+            profiles.append({
+                "type": "sampled",
+                "name": thread,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "promptcraft-backend",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+
+class StackSampler:
+    """Samples Python stacks from a background thread with `sys._current_frames`.
+
+    `thread_ids` limits sampling to those threads (all others when None);
+    `root_frame` keeps only samples whose stack passes through that frame,
+    which attributes event-loop samples to the task that owns it.
+    `extra_threads` is a live set of further threads sampled whole while they
+    are in it (executor workers running the profiled request's calls). Idle threads
+    are skipped unless `include_idle` is set. The only cost is the sampling
+    thread itself, which exists only between `start` and `stop`.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        interval: float = 0.005,
+        thread_ids: Optional[List[int]] = None,
+        root_frame=None,
+        include_idle: bool = False,
+        extra_threads: Optional[Set[int]] = None,
+    ):
+        self.profile = Profile(name, interval)
+        self.interval = interval
+        self.thread_ids = set(thread_ids) if thread_ids else None
+        self.root_frame = root_frame
+        self.extra_threads = extra_threads
+        self.include_idle = include_idle
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self) -> "StackSampler":
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self) -> Profile:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.profile.duration = time.time() - self.profile.started
+        return self.profile
+    
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                extra = self.extra_threads is not None and thread_id in self.extra_threads
+                if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids and not extra):
+                    continue
+                stack = self._stack(frame, root_frame=None if extra else self.root_frame)
+                if stack:
+                    thread = names.get(thread_id, str(thread_id))
+                    self.profile.samples.setdefault(thread, Counter())[stack] += 1
+    
+    def _stack(self, frame, root_frame=None) -> Optional[Stack]:
+        code = frame.f_code
+        if not self.include_idle and (code.co_name, os.path.basename(code.co_filename)) in _IDLE_FRAMES:
+            return None
+        frames = []
+        seen_root = root_frame is None
+        while frame is not None:
+            if frame is root_frame:
+                seen_root = True
+            code = frame.f_code
+            frames.append((code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        if not seen_root:
+            return None
+        return tuple(reversed(frames))
+
+
+class ProfileStore:
+    """The most recent per-request profiles, keyed by request id (per process)"""
+    
+    def __init__(self, limit: int = 20):
+        self.limit = limit
+        self._profiles: "OrderedDict[str, Profile]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.active = False
+        # Request being profiled by ProfilerMiddleware, and executor threads currently working for it
+        self.request_id: Optional[str] = None
+        self.threads: Set[int] = set()
+    
+    def add(self, key: str, profile: Profile):
+        with self._lock:
+            self._profiles[key] = profile
+            while len(self._profiles) > self.limit:
+                self._profiles.popitem(last=False)
+    
+    def get(self, key: str) -> Optional[Profile]:
+        return self._profiles.get(key)
+    
+    def claim(self) -> bool:
+        """Only one sampler runs at a time, so profiling never stacks up overhead"""
+        with self._lock:
+            if self.active:
+                return False
+            self.active = True
+            return True
+    
+    def release(self):
+        self.request_id = None
+        self.threads.clear()
+        self.active = False
+    
+    def bind(self, fn):
+        """Wrap a call submitted to the executor so its worker thread is sampled with the profiled request.
+
+        Returns `fn` unchanged unless the submitting request is being profiled.
+        """
+        if self.request_id is None or current_request_id() != self.request_id:
+            return fn
+        
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            thread_id = threading.get_ident()
+            self.threads.add(thread_id)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.threads.discard(thread_id)
+        return run
+
+
+PROFILES = ProfileStore()
+
+
+class ProfilerMiddleware:
+    """ASGI middleware sampling a single request sent with `X-Profile: 1` and a valid `X-Admin-Token`.
+
+    Only added when ADMIN_TOKEN is set. The profile is stored under the
+    request id (the `X-Request-ID` response header) and fetched from
+    `GET /admin/profile/{request_id}`. It covers the request's task on the
+    event loop plus the calls it hands to the default executor
+    (`run_in_executor(None, ...)`: embeddings, blocking LLM calls, the Gemini
+    stream producer). Sync `def` routes and dependencies run on Starlette's
+    own thread pool and are not sampled; use the window profile for those.
+    """
+    
+    def __init__(self, app, admin_token: str, interval: float = 0.005):
+        self.app = app
+        self.admin_token = admin_token
+        self.interval = interval
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        headers = dict(scope.get("headers") or [])
+        if b"x-profile" not in headers:
+            await self.app(scope, receive, send)
+            return
+        
+        supplied = headers.get(b"x-admin-token")
+        request_id = current_request_id()
+        if not admin_authorized(self.admin_token, supplied) or request_id is None or not PROFILES.claim():
+            await self.app(scope, receive, send)
+            return
+        
+        PROFILES.request_id = request_id
+        sampler = StackSampler(
+            f"{scope['method']} {scope['path']} ({request_id})",
+            interval=self.interval,
+            thread_ids=[threading.get_ident()],
+            root_frame=sys._getframe(),
+            extra_threads=PROFILES.threads,
+        ).start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            PROFILES.add(request_id, sampler.stop())
+            PROFILES.release()
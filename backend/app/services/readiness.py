@@ -0,0 +1,120 @@
+from typing import Optional, Dict, List, Any, Callable, Awaitable
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Run by the server on SIGTERM, before it stops listening (see app.server.DrainingServer)
+_shutdown_hooks: List[Callable[[], None]] = []
+
+
+def on_shutdown_signal(hook: Callable[[], None]) -> Callable[[], None]:
+    """Register `hook`; returns a function that unregisters it"""
+    _shutdown_hooks.append(hook)
+    return lambda: _shutdown_hooks.remove(hook) if hook in _shutdown_hooks else None
+
+
+def shutdown_signaled():
+    for hook in list(_shutdown_hooks):
+        try:
+            hook()
+        except Exception as e:
+            logger.warning(f"Shutdown hook failed: {e}")
+
+
+class ComponentStatus:
+    def __init__(self, name: str, required: bool):
+        self.name = name
+        self.required = required
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.duration: Optional[float] = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "required": self.required,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration_s": round(self.duration, 3) if self.duration is not None else None,
+        }
+
+
+class Readiness:
+    """Start-up components warmed in the background, with per-component state and timings.
+    
+    The app is ready once every required component is; optional ones only
+    degrade the features that use them.
+    """
+    
+    def __init__(self):
+        self.components: Dict[str, ComponentStatus] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # Set when shutdown begins: the app stops taking new LLM work and reports not-ready
+        self.draining = False
+    
+    def start(
+        self,
+        name: str,
+        warm_up: Callable[[], Awaitable[Any]],
+        required: bool = True,
+    ) -> asyncio.Task:
+        status = ComponentStatus(name, required)
+        self.components[name] = status
+        task = asyncio.create_task(self._run(status, warm_up))
+        self._tasks[name] = task
+        return task
+    
+    async def _run(self, status: ComponentStatus, warm_up: Callable[[], Awaitable[Any]]):
+        status.state = "starting"
+        status.started_at = time.time()
+        started = time.monotonic()
+        try:
+            await warm_up()
+            status.state = "ready"
+            logger.info(f"✓ {status.name} ready in {time.monotonic() - started:.2f}s")
+        except asyncio.CancelledError:
+            status.state = "cancelled"
+            raise
+        except Exception as e:
+            status.state = "failed"
+            status.error = f"{type(e).__name__}: {e}"
+            log = logger.error if status.required else logger.warning
+            log(f"✗ {status.name} failed to start: {e}")
+        finally:
+            status.finished_at = time.time()
+            status.duration = time.monotonic() - started
+    
+    async def wait(self, name: str, timeout: Optional[float] = None) -> bool:
+        """Wait for a component's warm-up; True if it ended up ready"""
+        task = self._tasks.get(name)
+        if task is None:
+            return False
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return self.components[name].state == "ready"
+    
+    @property
+    def ready(self) -> bool:
+        return not self.draining and all(
+            status.state == "ready" for status in self.components.values() if status.required
+        )
+    
+    def report(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "draining": self.draining,
+            "components": {name: status.to_dict() for name, status in self.components.items()},
+        }
+    
+    async def stop(self):
+        tasks = [task for task in self._tasks.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
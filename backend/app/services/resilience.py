@@ -0,0 +1,140 @@
+from typing import Optional
+from collections import deque
+import asyncio
+import logging
+import random
+import time
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+
+logger = logging.getLogger(__name__)
+
+# Provider status codes that mean "try again / elsewhere" rather than "bad request"
+FAILOVER_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while its circuit is open"""
+
+
+def status_code_of(error: BaseException) -> Optional[int]:
+    """Best-effort HTTP status of a provider error (google.api_core and httpx style)"""
+    for attr in ("code", "status_code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def is_failover_error(error: BaseException) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    return status_code_of(error) in FAILOVER_STATUS_CODES
+
+
+def is_retryable(error: BaseException) -> bool:
+    return is_failover_error(error) or isinstance(error, CircuitOpenError)
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter for retryable provider errors"""
+    
+    def __init__(self, attempts: int = 3, initial: float = 1.0, maximum: float = 20.0, jitter: float = 1.0):
+        self.attempts = max(1, attempts)
+        self.initial = initial
+        self.maximum = maximum
+        self.jitter = jitter
+    
+    def retrying(self) -> AsyncRetrying:
+        return AsyncRetrying(
+            stop=stop_after_attempt(self.attempts),
+            wait=wait_exponential_jitter(initial=self.initial, max=self.maximum, jitter=self.jitter),
+            retry=retry_if_exception(is_retryable),
+            before_sleep=lambda state: logger.warning(
+                f"LLM call failed ({type(state.outcome.exception()).__name__}), "
+                f"retry {state.attempt_number}/{self.attempts - 1}"
+            ),
+            reraise=True,
+        )
+    
+    def should_retry(self, error: BaseException, attempt_number: int) -> bool:
+        return attempt_number < self.attempts and is_retryable(error)
+    
+    def backoff(self, attempt_number: int) -> float:
+        """Delay before the next attempt, same shape as tenacity's wait_exponential_jitter"""
+        delay = self.initial * 2 ** (attempt_number - 1) + random.uniform(0, self.jitter)
+        return min(self.maximum, delay)
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open probe after a timeout"""
+    
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+    
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.recovery_timeout:
+            return "half_open"
+        return "open"
+    
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probe_in_flight:
+            return True
+        return False
+    
+    def before_call(self):
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit open for LLM endpoint '{self.name}'")
+        if self.state == "half_open":
+            self._probe_in_flight = True
+    
+    def record_success(self):
+        if self._opened_at is not None:
+            logger.info(f"Circuit closed for LLM endpoint '{self.name}'")
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+    
+    def record_failure(self):
+        self._failures += 1
+        self._probe_in_flight = False
+        if self._opened_at is not None or self._failures >= self.failure_threshold:
+            if self._opened_at is None:
+                logger.warning(f"Circuit opened for LLM endpoint '{self.name}' after {self._failures} failures")
+            self._opened_at = time.monotonic()
+    
+    def release(self):
+        """Forget a half-open probe that ended without a verdict (e.g. cancelled)"""
+        self._probe_in_flight = False
+
+
+class LatencyWindow:
+    """Rolling window of latency samples for percentile estimates"""
+    
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+    
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+    
+    def __len__(self) -> int:
+        return len(self._samples)
+    
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+        return ordered[index]
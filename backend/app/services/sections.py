@@ -0,0 +1,83 @@
+from typing import Optional, List
+from dataclasses import dataclass
+import re
+
+_HEADING = re.compile(r"^(#{2,3})\s+(.+?)\s*#*\s*$")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_NUMBER = re.compile(r"^(\d+(?:\.\d+)*)\.?\s")
+
+
+@dataclass
+class Section:
+    """A ## or ### heading and the text up to the next heading of the same or higher level"""
+    index: int
+    level: int
+    title: str
+    start: int  # offset of the heading line
+    body_start: int  # offset just after the heading line
+    end: int
+    
+    @property
+    def number(self) -> Optional[str]:
+        match = _NUMBER.match(self.title)
+        return match.group(1) if match else None
+
+
+def index_sections(markdown: str) -> List[Section]:
+    """Sections of a markdown document, in order; headings inside code fences are ignored"""
+    headings = []
+    offset = 0
+    in_fence = False
+    for line in markdown.splitlines(keepends=True):
+        if _FENCE.match(line):
+            in_fence = not in_fence
+        elif not in_fence:
+            match = _HEADING.match(line.rstrip("\r\n"))
+            if match:
+                headings.append((len(match.group(1)), match.group(2), offset, offset + len(line)))
+        offset += len(line)
+    
+    sections = []
+    for i, (level, title, start, body_start) in enumerate(headings):
+        end = next((h[2] for h in headings[i + 1:] if h[0] <= level), len(markdown))
+        sections.append(Section(i, level, title, start, body_start, end))
+    return sections
+
+
+def find_section(sections: List[Section], query: str) -> Optional[Section]:
+    """Section by number ("3", "3.2"), exact title, or title substring"""
+    query = query.strip().lstrip("#").strip()
+    lowered = query.lower()
+    for matches in (
+        lambda s: s.number == query.rstrip("."),
+        lambda s: s.title.lower() == lowered,
+        lambda s: lowered in s.title.lower(),
+    ):
+        found = next((s for s in sections if matches(s)), None)
+        if found:
+            return found
+    return None
+
+
+def compact_outline(markdown: str, sections: List[Section], exclude: Section, preview_chars: int = 240) -> str:
+    """Headings plus the opening of every other top-level section, as cheap context"""
+    lines = []
+    for section in sections:
+        if section.level != 2 and section.index != exclude.index:
+            continue
+        heading = f"{'#' * section.level} {section.title}"
+        if section.index == exclude.index:
+            lines.append(f"{heading}\n[SECTION BEING REWRITTEN]")
+            continue
+        preview = " ".join(markdown[section.body_start:section.end].split())
+        if len(preview) > preview_chars:
+            preview = preview[:preview_chars].rsplit(" ", 1)[0] + " ..."
+        lines.append(f"{heading}\n{preview}")
+    return "\n\n".join(lines)
+
+
+def splice_section(markdown: str, section: Section, body: str) -> str:
+    """Replace a section's body, keeping its heading and everything around it"""
+    tail = markdown[section.end:]
+    separator = "\n\n" if tail else "\n"
+    return f"{markdown[:section.body_start]}\n{body.strip()}{separator}{tail}"
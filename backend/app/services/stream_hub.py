@@ -0,0 +1,486 @@
+from typing import Optional, Dict, Any, List, Tuple, Callable, AsyncIterator
+from collections import deque
+import asyncio
+import logging
+import time
+import uuid
+import redis.asyncio as redis
+
+from app.config import Settings
+
+logger = logging.getLogger(__name__)
+
+# Starts the underlying generation; only called by the stream's producer
+ProduceStream = Callable[[], AsyncIterator[str]]
+
+STREAM_BACKENDS = ("memory", "redis")
+
+
+class StreamError(Exception):
+    """The shared generation failed; carries the producer's error message"""
+
+
+class StreamExpired(Exception):
+    """The requested position is no longer buffered"""
+
+
+def make_event_id(generation: str, seq: int) -> str:
+    return f"{generation}.{seq}"
+
+
+def parse_event_id(event_id: str) -> Tuple[str, int]:
+    """(generation, seq) of an event id; StreamExpired if it isn't one of ours"""
+    generation, _, seq = event_id.strip().rpartition(".")
+    if not generation or not seq.isdigit():
+        raise StreamExpired(f"Unrecognised event id '{event_id}'")
+    return generation, int(seq)
+
+
+class _Broadcast:
+    """One generation: a ring buffer of (seq, kind, data) entries bounded by count and size"""
+    
+    def __init__(self, key: str, max_chunks: int, max_bytes: int):
+        self.key = key
+        self.generation = uuid.uuid4().hex[:12]
+        self.entries: deque = deque(maxlen=max_chunks)
+        self.max_bytes = max_bytes
+        self.buffered_bytes = 0
+        self.next_seq = 0
+        self.finished = False
+        self.failed = False
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        # Loop time until which a client that left may still come back with its Last-Event-ID
+        self.resume_until = 0.0
+        self.reap_handle: Optional[asyncio.TimerHandle] = None
+        self.abandoned = False
+        self._wakeup = asyncio.Event()
+    
+    def append(self, kind: str, data: str):
+        if len(self.entries) == self.entries.maxlen:
+            self.buffered_bytes -= len(self.entries[0][2])
+        self.entries.append((self.next_seq, kind, data))
+        self.buffered_bytes += len(data)
+        while self.buffered_bytes > self.max_bytes and len(self.entries) > 1:
+            self.buffered_bytes -= len(self.entries.popleft()[2])
+        self.next_seq += 1
+        if kind != "chunk":
+            self.finished = True
+            self.failed = kind == "error"
+        # Wake every follower, then arm a fresh event for the next entry
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+    
+    async def follow(self, after: Optional[int]) -> AsyncIterator[Tuple[str, str]]:
+        expected = 0 if after is None else after + 1
+        while True:
+            wakeup = self._wakeup
+            while self.entries and expected <= self.entries[-1][0]:
+                offset = expected - self.entries[0][0]
+                if offset < 0:
+                    raise StreamExpired(f"Stream '{self.key}' no longer buffers entry {expected}")
+                seq, kind, data = self.entries[offset]
+                if kind == "error":
+                    raise StreamError(data)
+                if kind == "done":
+                    return
+                expected = seq + 1
+                yield make_event_id(self.generation, seq), data
+            await wakeup.wait()
+
+
+async def _wait_tasks(tasks: List[asyncio.Task], timeout: float) -> int:
+    if not tasks:
+        return 0
+    _, pending = await asyncio.wait(tasks, timeout=max(0.0, timeout))
+    return len(pending)
+
+
+class MemoryStreamHub:
+    """Shares each generation with every local client asking for the same key.
+
+    Finished generations stay buffered for `retention` seconds so dropped
+    clients can resume from their Last-Event-ID. A generation every client
+    left is cancelled: at once if none of them can resume (WebSocket
+    clients), otherwise when nobody has come back within `orphan_grace`
+    seconds of the last resumable (SSE) client leaving.
+    """
+    
+    def __init__(
+        self,
+        max_chunks: int = 2048,
+        max_bytes: int = 1_000_000,
+        orphan_grace: float = 10.0,
+        retention: float = 300.0,
+    ):
+        self.max_chunks = max(1, max_chunks)
+        self.max_bytes = max(1, max_bytes)
+        self.orphan_grace = orphan_grace
+        self.retention = retention
+        self._broadcasts: Dict[str, _Broadcast] = {}
+        self._draining = False
+        self.started = 0
+        self.joined = 0
+        self.resumed = 0
+    
+    async def stream(
+        self,
+        key: str,
+        produce: ProduceStream,
+        after: Optional[str] = None,
+        resumable: bool = True,
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """Yield (event id, chunk) for `key`, starting the generation if nobody has.
+
+        Late joiners first replay the buffered chunks, then follow live. With
+        `after` (a Last-Event-ID) the stream resumes after that event, and
+        never starts a new generation: StreamExpired if it is gone.
+        `resumable=False` marks a client that never reconnects by event id,
+        so its leaving doesn't keep the generation alive.
+        """
+        broadcast = self._broadcasts.get(key)
+        after_seq = None
+        if after is not None:
+            generation, after_seq = parse_event_id(after)
+            if broadcast is None or broadcast.generation != generation:
+                raise StreamExpired(f"Stream '{key}' is no longer buffered")
+            self.resumed += 1
+        elif broadcast is None or broadcast.failed:
+            broadcast = _Broadcast(key, self.max_chunks, self.max_bytes)
+            self._broadcasts[key] = broadcast
+            broadcast.task = asyncio.create_task(self._produce(broadcast, produce))
+            self.started += 1
+        else:
+            self.joined += 1
+        
+        broadcast.subscribers += 1
+        try:
+            async for item in broadcast.follow(after_seq):
+                yield item
+        finally:
+            broadcast.subscribers -= 1
+            loop = asyncio.get_running_loop()
+            if resumable:
+                broadcast.resume_until = max(broadcast.resume_until, loop.time() + self.orphan_grace)
+            if broadcast.subscribers == 0 and not broadcast.finished:
+                if broadcast.reap_handle:
+                    broadcast.reap_handle.cancel()
+                    broadcast.reap_handle = None
+                delay = broadcast.resume_until - loop.time()
+                if delay > 0:
+                    broadcast.reap_handle = loop.call_later(delay, self._reap, broadcast)
+                else:
+                    self._reap(broadcast)
+    
+    async def _produce(self, broadcast: _Broadcast, produce: ProduceStream):
+        try:
+            async for chunk in produce():
+                broadcast.append("chunk", chunk)
+            broadcast.append("done", "")
+        except asyncio.CancelledError:
+            broadcast.append("error", "Generation cancelled")
+        except Exception as e:
+            logger.error(f"Shared stream '{broadcast.key}' failed: {e}")
+            broadcast.append("error", str(e))
+        finally:
+            if broadcast.abandoned:
+                # Nobody is left to resume it; a late Last-Event-ID gets StreamExpired
+                self._expire(broadcast)
+            else:
+                asyncio.get_running_loop().call_later(self.retention, self._expire, broadcast)
+    
+    def _expire(self, broadcast: _Broadcast):
+        if self._broadcasts.get(broadcast.key) is broadcast:
+            del self._broadcasts[broadcast.key]
+    
+    def _reap(self, broadcast: _Broadcast):
+        """Cancel a generation every client has abandoned"""
+        broadcast.reap_handle = None
+        if self._draining:
+            # Let it finish so the answer still reaches the cache before shutdown
+            return
+        if broadcast.subscribers or broadcast.finished or not broadcast.task:
+            return
+        logger.info(f"Cancelling abandoned stream '{broadcast.key}'")
+        broadcast.abandoned = True
+        broadcast.task.cancel()
+    
+    def stats(self) -> Dict[str, Any]:
+        broadcasts = list(self._broadcasts.values())
+        return {
+            "backend": "memory",
+            "active": sum(1 for b in broadcasts if not b.finished),
+            "buffered": len(broadcasts),
+            "buffered_bytes": sum(b.buffered_bytes for b in broadcasts),
+            "subscribers": sum(b.subscribers for b in broadcasts),
+            "started": self.started,
+            "joined": self.joined,
+            "resumed": self.resumed,
+        }
+    
+    async def drain(self, timeout: float) -> int:
+        """Wait up to `timeout` seconds for running generations; returns how many are left"""
+        self._draining = True
+        tasks = [b.task for b in self._broadcasts.values() if b.task and not b.task.done()]
+        return await _wait_tasks(tasks, timeout)
+    
+    async def close(self):
+        tasks = [b.task for b in self._broadcasts.values() if b.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class RedisStreamHub:
+    """Shares generations across worker processes through Redis Streams.
+
+    The worker that wins the owner lock runs the generation and appends each
+    chunk with an explicit id "<seq + 1>-0"; every client, on any worker,
+    follows the stream with XREAD. Followers keep a lease in a sorted set
+    (member -> expiry time), extended while they read and, for resumable
+    clients, for `orphan_grace` seconds after they leave; the owner checks it
+    every `orphan_grace` seconds and cancels a generation with no live lease.
+    The buffer is capped by entry count (Redis trims by length, not bytes)
+    and kept for `retention` seconds after the generation ends.
+    """
+    
+    def __init__(
+        self,
+        redis_url: str,
+        max_chunks: int = 2048,
+        owner_lease: int = 30,
+        retention: int = 300,
+        block_ms: int = 5000,
+        orphan_grace: float = 10.0,
+    ):
+        self.max_chunks = max(1, max_chunks)
+        self.owner_lease = owner_lease
+        self.retention = retention
+        self.block_ms = block_ms
+        self.orphan_grace = orphan_grace
+        # A follower blocked in XREAD renews at least this often
+        self.follower_lease = 2 * block_ms / 1000 + 1
+        self.worker_id = uuid.uuid4().hex
+        self._client = redis.from_url(redis_url, decode_responses=True)
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._draining = False
+        self.started = 0
+        self.joined = 0
+        self.resumed = 0
+    
+    @staticmethod
+    def _stream_key(key: str) -> str:
+        return f"stream:{key}"
+    
+    @staticmethod
+    def _owner_key(key: str) -> str:
+        return f"stream:{key}:owner"
+    
+    @staticmethod
+    def _followers_key(key: str) -> str:
+        return f"stream:{key}:followers"
+    
+    async def _lease(self, key: str, follower: str, seconds: float):
+        followers_key = self._followers_key(key)
+        await self._client.zadd(followers_key, {follower: time.time() + seconds})
+        await self._client.expire(followers_key, self.retention + self.owner_lease)
+    
+    async def stream(
+        self,
+        key: str,
+        produce: ProduceStream,
+        after: Optional[str] = None,
+        resumable: bool = True,
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """Yield (event id, chunk) for `key`, starting the generation if no worker has.
+
+        `resumable=False` (WebSocket clients) drops this follower's lease as
+        soon as it leaves instead of holding it for the resume window.
+        """
+        follower = uuid.uuid4().hex
+        # Registered before the generation starts so the owner never sees it unfollowed
+        await self._lease(key, follower, self.follower_lease)
+        generation = after_seq = None
+        if after is not None:
+            generation, after_seq = parse_event_id(after)
+            self.resumed += 1
+        elif await self._claim(key):
+            self._tasks[key] = asyncio.create_task(self._produce(key, produce))
+            self.started += 1
+        else:
+            self.joined += 1
+        
+        try:
+            async for item in self._follow(key, after_seq, generation, follower):
+                yield item
+        finally:
+            try:
+                if resumable:
+                    await self._lease(key, follower, self.orphan_grace)
+                else:
+                    await self._client.zrem(self._followers_key(key), follower)
+            except Exception as e:
+                logger.debug(f"Could not release stream lease for '{key}': {e}")
+    
+    async def _followed(self, key: str) -> bool:
+        followers_key = self._followers_key(key)
+        await self._client.zremrangebyscore(followers_key, "-inf", time.time())
+        return await self._client.zcard(followers_key) > 0
+    
+    async def _reap_when_abandoned(self, key: str, producer: asyncio.Task):
+        """Owner side: cancel the generation once no follower on any worker holds a lease"""
+        while True:
+            await asyncio.sleep(self.orphan_grace)
+            if self._draining:
+                # Let it finish so the answer still reaches the cache before shutdown
+                continue
+            try:
+                if await self._followed(key):
+                    continue
+            except Exception as e:
+                logger.warning(f"Could not check followers of stream '{key}': {e}")
+                continue
+            logger.info(f"Cancelling abandoned stream '{key}'")
+            producer.cancel()
+            return
+    
+    async def _claim(self, key: str) -> bool:
+        """Become the producer unless another worker is, or a finished stream is still buffered"""
+        stream_key = self._stream_key(key)
+        if not await self._client.set(self._owner_key(key), self.worker_id, nx=True, ex=self.owner_lease):
+            return False
+        last = await self._client.xrevrange(stream_key, count=1)
+        if last and last[0][1].get("kind") == "done":
+            await self._client.delete(self._owner_key(key))
+            return False
+        # Leftovers of a failed or abandoned run
+        await self._client.delete(stream_key)
+        return True
+    
+    async def _produce(self, key: str, produce: ProduceStream):
+        stream_key = self._stream_key(key)
+        generation = uuid.uuid4().hex[:12]
+        seq = 0
+        renewed = time.monotonic()
+        
+        async def append(kind: str, data: str):
+            nonlocal seq, renewed
+            await self._client.xadd(
+                stream_key,
+                {"gen": generation, "seq": seq, "kind": kind, "data": data},
+                id=f"{seq + 1}-0",
+                maxlen=self.max_chunks,
+                approximate=True,
+            )
+            seq += 1
+            if time.monotonic() - renewed >= self.owner_lease / 3:
+                renewed = time.monotonic()
+                await self._client.expire(self._owner_key(key), self.owner_lease)
+                # Bounds a stream whose producer dies mid-generation
+                await self._client.expire(stream_key, self.retention + self.owner_lease)
+        
+        reaper = asyncio.create_task(self._reap_when_abandoned(key, asyncio.current_task()))
+        abandoned = False
+        try:
+            async for chunk in produce():
+                await append("chunk", chunk)
+            await append("done", "")
+        except asyncio.CancelledError:
+            abandoned = reaper.done()
+            await asyncio.shield(append("error", "Generation cancelled"))
+            raise
+        except Exception as e:
+            logger.error(f"Shared stream '{key}' failed: {e}")
+            await append("error", str(e))
+        finally:
+            reaper.cancel()
+            self._tasks.pop(key, None)
+            try:
+                if abandoned:
+                    # Nobody is left to resume it; a late Last-Event-ID gets StreamExpired
+                    await self._client.delete(stream_key, self._followers_key(key))
+                else:
+                    await self._client.expire(stream_key, self.retention)
+                await self._client.delete(self._owner_key(key))
+            except Exception as e:
+                logger.warning(f"Stream cleanup error for '{key}': {e}")
+    
+    async def _follow(
+        self,
+        key: str,
+        after: Optional[int],
+        generation: Optional[str],
+        follower: str,
+    ) -> AsyncIterator[Tuple[str, str]]:
+        stream_key = self._stream_key(key)
+        expected = 0 if after is None else after + 1
+        last_id = f"{expected}-0"
+        if after is not None and not await self._client.exists(stream_key):
+            raise StreamExpired(f"Stream '{key}' is no longer buffered")
+        
+        renewed = time.monotonic()
+        while True:
+            if time.monotonic() - renewed >= self.follower_lease / 3:
+                renewed = time.monotonic()
+                await self._lease(key, follower, self.follower_lease)
+            response = await self._client.xread({stream_key: last_id}, count=100, block=self.block_ms)
+            if not response:
+                if not await self._client.exists(self._owner_key(key)):
+                    # No producer and nothing new: it died without a terminal entry
+                    if not await self._client.xread({stream_key: last_id}, count=1):
+                        raise StreamError("Shared generation stopped unexpectedly")
+                continue
+            
+            for entry_id, fields in response[0][1]:
+                last_id = entry_id
+                seq = int(fields["seq"])
+                if generation is None:
+                    generation = fields["gen"]
+                if seq != expected or fields["gen"] != generation:
+                    raise StreamExpired(f"Stream '{key}' no longer buffers entry {expected}")
+                if fields["kind"] == "error":
+                    raise StreamError(fields["data"])
+                if fields["kind"] == "done":
+                    return
+                expected = seq + 1
+                yield make_event_id(generation, seq), fields["data"]
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "redis",
+            "producing": len(self._tasks),
+            "started": self.started,
+            "joined": self.joined,
+            "resumed": self.resumed,
+        }
+    
+    async def drain(self, timeout: float) -> int:
+        """Wait up to `timeout` seconds for generations this worker owns; returns how many are left"""
+        self._draining = True
+        return await _wait_tasks(list(self._tasks.values()), timeout)
+    
+    async def close(self):
+        tasks: List[asyncio.Task] = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._client.close()
+
+
+def create_stream_hub(settings: Settings):
+    if settings.stream_backend == "redis":
+        return RedisStreamHub(
+            settings.redis_url,
+            max_chunks=settings.stream_buffer_chunks,
+            owner_lease=settings.stream_owner_lease,
+            retention=settings.stream_retention,
+            orphan_grace=settings.stream_orphan_grace,
+        )
+    if settings.stream_backend not in STREAM_BACKENDS:
+        logger.warning(f"Unknown stream backend '{settings.stream_backend}', using memory")
+    return MemoryStreamHub(
+        max_chunks=settings.stream_buffer_chunks,
+        max_bytes=settings.stream_buffer_bytes,
+        orphan_grace=settings.stream_orphan_grace,
+        retention=settings.stream_retention,
+    )
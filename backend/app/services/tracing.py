@@ -0,0 +1,308 @@
+from typing import Optional, Dict, List, Any
+from contextlib import aclosing, contextmanager
+from contextvars import ContextVar
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import re
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+trace_logger = logging.getLogger("app.trace")
+
+TRACE_EXPORTERS = ("none", "log", "otlp")
+
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class Span:
+    __slots__ = ("name", "start", "duration", "error")
+    
+    def __init__(self, name: str, start: float):
+        self.name = name
+        self.start = start
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+
+
+class Trace:
+    """Spans recorded while handling one request"""
+    
+    def __init__(self, request_id: str, method: str = "", path: str = ""):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.route: Optional[str] = None
+        self.status: Optional[int] = None
+        self.started_wall = time.time()
+        self.started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.spans: List[Span] = []
+    
+    def server_timing(self) -> str:
+        """Server-Timing header value: total time per span name, plus time so far as `app`"""
+        totals: Dict[str, List[float]] = {}
+        for span in self.spans:
+            if span.duration is not None:
+                entry = totals.setdefault(span.name, [0.0, 0])
+                entry[0] += span.duration
+                entry[1] += 1
+        parts = []
+        for name, (seconds, count) in totals.items():
+            part = f"{name};dur={seconds * 1000:.1f}"
+            if count > 1:
+                part += f';desc="{count} calls"'
+            parts.append(part)
+        parts.append(f"app;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "method": self.method,
+            "route": self.route or self.path,
+            "status": self.status,
+            "duration_ms": round((self.duration or 0.0) * 1000, 2),
+            "spans": [
+                {
+                    "name": span.name,
+                    "start_ms": round((span.start - self.started) * 1000, 2),
+                    "duration_ms": round(span.duration * 1000, 2) if span.duration is not None else None,
+                    **({"error": span.error} if span.error else {}),
+                }
+                for span in self.spans
+            ],
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def current_request_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.request_id if trace else None
+
+
+def route_template(scope) -> Optional[str]:
+    """Path template of the matched route, resolved once per request and kept on its trace"""
+    trace = _current_trace.get()
+    if trace is not None and trace.route is not None:
+        return trace.route
+    route = getattr(scope.get("route"), "path", None)
+    if trace is not None:
+        trace.route = route
+    return route
+
+
+@contextmanager
+def span(name: str):
+    """Time a block as a span of the current request's trace; a no-op outside a request"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    record = Span(name, time.perf_counter())
+    trace.spans.append(record)
+    try:
+        yield
+    except (GeneratorExit, asyncio.CancelledError):
+        # A consumer that stops early or a cancelled request isn't a failure of the spanned work
+        raise
+    except BaseException as e:
+        record.error = type(e).__name__
+        raise
+    finally:
+        record.duration = time.perf_counter() - record.start
+
+
+def traced(name: str):
+    """Decorator wrapping a sync, async or async-generator function in a span"""
+    def decorator(func):
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def agen_wrapper(*args, **kwargs):
+                # aclosing: when the consumer stops early, the wrapped generator's
+                # own cleanup runs now rather than whenever it is collected
+                with span(name):
+                    async with aclosing(func(*args, **kwargs)) as items:
+                        async for item in items:
+                            yield item
+            return agen_wrapper
+        
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class LogTraceExporter:
+    """One log line per finished trace, with the spans as a structured `trace` field"""
+    
+    def export(self, trace: Trace):
+        # Serialized by the log formatter, off the event loop
+        trace_logger.info("trace %s", trace.request_id, extra={"trace": trace})
+    
+    async def close(self):
+        pass
+
+
+class OTLPTraceExporter:
+    """Batches traces and posts them as OTLP/HTTP JSON to a local collector"""
+    
+    def __init__(self, endpoint: str, service_name: str = "promptcraft-backend", flush_interval: float = 2.0, max_queue: int = 2048):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue: List[Trace] = []
+        self._task: Optional[asyncio.Task] = None
+        self._client = None
+        self.dropped = 0
+    
+    def export(self, trace: Trace):
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            return
+        self._queue.append(trace)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def _run(self):
+        import httpx
+        
+        self._client = httpx.AsyncClient(timeout=5.0)
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush()
+    
+    async def _flush(self):
+        if not self._queue or self._client is None:
+            return
+        batch, self._queue = self._queue, []
+        try:
+            response = await self._client.post(self.endpoint, json=self._payload(batch))
+            if response.status_code >= 400:
+                logger.debug(f"OTLP collector rejected {len(batch)} trace(s): HTTP {response.status_code}")
+        except Exception as e:
+            logger.debug(f"OTLP export failed for {len(batch)} trace(s): {e}")
+    
+    def _payload(self, traces: List[Trace]) -> Dict[str, Any]:
+        spans = []
+        for trace in traces:
+            trace_id = trace.request_id if re.fullmatch(r"[0-9a-f]{32}", trace.request_id) else uuid.uuid4().hex
+            root_id = os.urandom(8).hex()
+            start_ns = int(trace.started_wall * 1e9)
+            
+            def nanos(offset: float) -> str:
+                return str(start_ns + int(offset * 1e9))
+            
+            spans.append({
+                "traceId": trace_id,
+                "spanId": root_id,
+                "name": f"{trace.method} {trace.route or trace.path}",
+                "kind": 2,  # SERVER
+                "startTimeUnixNano": nanos(0.0),
+                "endTimeUnixNano": nanos(trace.duration or 0.0),
+                "attributes": [
+                    {"key": "http.request.method", "value": {"stringValue": trace.method}},
+                    {"key": "http.route", "value": {"stringValue": trace.route or trace.path}},
+                    {"key": "http.response.status_code", "value": {"intValue": str(trace.status or 0)}},
+                    {"key": "request.id", "value": {"stringValue": trace.request_id}},
+                ],
+            })
+            for child in trace.spans:
+                offset = child.start - trace.started
+                spans.append({
+                    "traceId": trace_id,
+                    "spanId": os.urandom(8).hex(),
+                    "parentSpanId": root_id,
+                    "name": child.name,
+                    "kind": 1,  # INTERNAL
+                    "startTimeUnixNano": nanos(offset),
+                    "endTimeUnixNano": nanos(offset + (child.duration or 0.0)),
+                    **({"status": {"code": 2, "message": child.error}} if child.error else {}),
+                })
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{"scope": {"name": "app.tracing"}, "spans": spans}],
+            }],
+        }
+    
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._flush()
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+
+def create_trace_exporter(settings):
+    if settings.trace_export == "log":
+        return LogTraceExporter()
+    if settings.trace_export == "otlp":
+        return OTLPTraceExporter(settings.otlp_endpoint)
+    if settings.trace_export not in TRACE_EXPORTERS:
+        logger.warning(f"Unknown TRACE_EXPORT '{settings.trace_export}', traces are not exported")
+    return None
+
+
+class TracingMiddleware:
+    """ASGI middleware: request id, a trace context for spans, and a Server-Timing header.
+
+    Server-Timing is sent with the response headers, so for streamed responses
+    it covers the work done before the first byte; the exported trace covers
+    the whole request.
+    """
+    
+    def __init__(self, app, slow_threshold_ms: float = 0.0):
+        self.app = app
+        self.slow_threshold = slow_threshold_ms / 1000
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        incoming = dict(scope.get("headers") or []).get(b"x-request-id", b"").decode("latin-1")
+        request_id = incoming if _REQUEST_ID_PATTERN.match(incoming) else uuid.uuid4().hex
+        trace = Trace(request_id, scope["method"], scope["path"])
+        token = _current_trace.set(trace)
+        
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", request_id.encode("latin-1")))
+                headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route_template(scope)
+            _current_trace.reset(token)
+            trace.duration = time.perf_counter() - trace.started
+            exporter = getattr(scope["app"].state, "trace_exporter", None) if "app" in scope else None
+            if exporter is not None and trace.duration >= self.slow_threshold:
+                exporter.export(trace)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""Compare cached-hit throughput and latency across server runner profiles.
+
+Starts `run.py` once per profile on a free port, primes the response cache
+with one request, then drives the same request at a fixed concurrency for a
+fixed duration and prints requests/second and latency percentiles. The server
+runs with the offline fake provider unless --real-provider is given; cache
+hits need Redis at REDIS_URL (without it every request regenerates, which the
+`cached` column shows).
+
+    python bench_server.py
+    python bench_server.py --profiles development production --concurrency 64 --duration 20
+    python bench_server.py --workers 4 --json
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(profile, port, args):
+    env = dict(os.environ)
+    if not args.real_provider:
+        env.setdefault("LLM_PROVIDER", "fake")
+        env.setdefault("FAKE_LLM_PROFILE", "instant")
+    command = [sys.executable, "run.py", "--profile", profile, "--host", "127.0.0.1", "--port", str(port)]
+    if args.workers:
+        command += ["--workers", str(args.workers)]
+    return subprocess.Popen(
+        command,
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(client, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            response = await client.get("/health/ready")
+            if response.status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.25)
+    raise TimeoutError("server did not become ready")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def drive(client, path, body, concurrency, duration):
+    latencies = []
+    errors = 0
+    cached = 0
+    deadline = time.monotonic() + duration
+    
+    async def user():
+        nonlocal errors, cached
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, json=body)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+            elif response.json().get("cached"):
+                cached += 1
+    
+    started = time.monotonic()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+    
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "cached": cached,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+    }
+
+
+async def bench_profile(profile, args):
+    port = free_port()
+    process = start_server(profile, port, args)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    body = {"prompt": args.prompt}
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60.0) as client:
+            await wait_ready(client, process, args.startup_timeout)
+            # Prime the cache, then warm connections before measuring
+            await client.post(args.path, json=body)
+            await drive(client, args.path, body, args.concurrency, min(2.0, args.duration))
+            result = await drive(client, args.path, body, args.concurrency, args.duration)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return {"profile": profile, **result}
+
+
+async def main(args):
+    results = []
+    for profile in args.profiles:
+        print(f"benchmarking {profile}...", file=sys.stderr)
+        results.append(await bench_profile(profile, args))
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    
+    print(f"{args.path}, concurrency {args.concurrency}, {args.duration:.0f}s per profile")
+    print(f"{'profile':<12} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'requests':>9} {'cached':>9} {'errors':>7}")
+    for row in results:
+        print(f"{row['profile']:<12} {row['rps']:>9} {row['p50_ms']!s:>9} {row['p95_ms']!s:>9} {row['p99_ms']!s:>9} "
+              f"{row['requests']:>9} {row['cached']:>9} {row['errors']:>7}")
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark cached-hit traffic across server profiles")
+    parser.add_argument("--profiles", nargs="+", default=["development", "production"], help="profiles to compare")
+    parser.add_argument("--workers", type=int, default=None, help="override worker count for every profile")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent clients (default 32)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds measured per profile (default 10)")
+    parser.add_argument("--path", default="/api/v1/chat/architecture", help="POST endpoint to drive")
+    parser.add_argument("--prompt", default="Design a URL shortener for 100M daily redirects")
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--real-provider", action="store_true", help="use the configured LLM instead of the fake one")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
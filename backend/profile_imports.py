@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Import-time profiler for the backend package.
+
+Imports a module (app.main by default) in a fresh interpreter with
+`python -X importtime`, reports the most expensive modules and packages, and
+exits non-zero when the import exceeds the startup budget or pulls in a heavy
+dependency that should only load on first use (numpy, torch,
+sentence-transformers, the Gemini SDK, the knowledge dictionaries).
+
+    python profile_imports.py                     # app.main, IMPORT_TIME_BUDGET_MS
+    python profile_imports.py --budget 400 --top 15
+    python profile_imports.py run_batch --json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+
+# Modules that must stay behind their service accessors
+LAZY_MODULES = (
+    "numpy",
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "google.generativeai",
+    "app.knowledge",
+)
+
+
+def run_importtime(target):
+    """One cold import of `target`; returns [(module, self_us, cumulative_us, depth)]"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {target} failed:\n{proc.stderr.strip().splitlines()[-1]}")
+    
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # Header line
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(fields[0]), int(fields[1]), depth))
+    return entries
+
+
+def is_lazy(module):
+    return any(module == name or module.startswith(name + ".") for name in LAZY_MODULES)
+
+
+def summarize(target, entries, top):
+    total = next((cumulative for name, _, cumulative, _ in reversed(entries) if name == target), None)
+    if total is None:
+        total = sum(self_us for _, self_us, _, depth in entries if depth == 0)
+    
+    packages = defaultdict(int)
+    for name, self_us, _, _ in entries:
+        packages[name.split(".")[0]] += self_us
+    
+    slowest = sorted(entries, key=lambda entry: entry[1], reverse=True)[:top]
+    return {
+        "target": target,
+        "total_ms": round(total / 1000, 1),
+        "modules": len(entries),
+        "slowest_modules": [
+            {"module": name, "self_ms": round(self_us / 1000, 1), "cumulative_ms": round(cumulative / 1000, 1)}
+            for name, self_us, cumulative, _ in slowest
+        ],
+        "packages": [
+            {"package": name, "self_ms": round(self_us / 1000, 1)}
+            for name, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        ],
+        "eager_heavy_modules": sorted({name for name, _, _, _ in entries if is_lazy(name)}),
+    }
+
+
+def print_report(report, budget_ms):
+    print(f"import {report['target']}: {report['total_ms']:.1f} ms across {report['modules']} modules "
+          f"(budget {budget_ms:.0f} ms)")
+    print("\nslowest modules (self / cumulative ms):")
+    for row in report["slowest_modules"]:
+        print(f"  {row['self_ms']:8.1f} {row['cumulative_ms']:9.1f}  {row['module']}")
+    print("\nby top-level package (self ms):")
+    for row in report["packages"]:
+        print(f"  {row['self_ms']:8.1f}  {row['package']}")
+    if report["eager_heavy_modules"]:
+        print("\nheavy modules imported eagerly:")
+        for name in report["eager_heavy_modules"]:
+            print(f"  {name}")
+
+
+def main(args):
+    budget_ms = args.budget
+    if budget_ms is None:
+        from app.config import get_settings
+        budget_ms = get_settings().import_time_budget_ms
+    
+    # Best of N: the first run may also be compiling bytecode
+    runs = [summarize(args.target, run_importtime(args.target), args.top) for _ in range(max(1, args.repeat))]
+    report = min(runs, key=lambda run: run["total_ms"])
+    report["budget_ms"] = budget_ms
+    report["runs_ms"] = [run["total_ms"] for run in runs]
+    
+    failures = []
+    if report["total_ms"] > budget_ms:
+        failures.append(f"import took {report['total_ms']:.1f} ms, budget is {budget_ms:.0f} ms")
+    if report["eager_heavy_modules"] and not args.allow_heavy:
+        failures.append(f"heavy modules imported eagerly: {', '.join(report['eager_heavy_modules'])}")
+    report["passed"] = not failures
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, budget_ms)
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Profile import time and enforce a startup budget")
+    parser.add_argument("target", nargs="?", default="app.main", help="module to import (default app.main)")
+    parser.add_argument("--budget", type=float, default=None, help="budget in ms (default IMPORT_TIME_BUDGET_MS)")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters to run, best is reported (default 3)")
+    parser.add_argument("--top", type=int, default=10, help="modules and packages to list (default 10)")
+    parser.add_argument("--allow-heavy", action="store_true", help="don't fail when lazy dependencies load eagerly")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
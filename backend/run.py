@@ -1,22 +1,98 @@
 #!/usr/bin/env python3
-import uvicorn
+import argparse
 import sys
 import os
+import tempfile
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the PromptCraft AI backend")
+    parser.add_argument("--profile", choices=["development", "production"], default=None,
+                        help="runner profile (default SERVER_PROFILE)")
+    parser.add_argument("--host", default=None, help="default SERVER_HOST")
+    parser.add_argument("--port", type=int, default=None, help="default SERVER_PORT")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes; more than 1 starts the pre-fork launcher (no reload)")
+    parser.add_argument("--index-path", default="data/kb_index",
+                        help="where the launcher writes the shared knowledge index (default data/kb_index)")
+    parser.add_argument("--embedding-sidecar", action="store_true",
+                        help="run the embedding model in one shared process instead of once per worker")
+    return parser.parse_args(argv)
+
+
+def server_options(args):
+    from app.config import get_settings
+    from app.server import server_options as profile_options
+    
+    options = profile_options(get_settings(), args.profile)
+    overrides = {"host": args.host, "port": args.port, "workers": args.workers}
+    options.update({key: value for key, value in overrides.items() if value is not None})
+    options["reload"] = options["reload"] and options["workers"] == 1
+    return options
+
+
+def run_prefork(args, options):
+    """Build the knowledge index once, then start workers that map it read-only"""
+    from app.config import get_settings
+    from app.server import serve
+    
+    sidecar = None
+    if args.embedding_sidecar:
+        from app.services.embedding_sidecar import EmbeddingSidecar
+        try:
+            sidecar = EmbeddingSidecar.start(get_settings().embedding_model)
+            os.environ["EMBEDDING_SIDECAR_ADDRESS"] = sidecar.address_string
+            os.environ["EMBEDDING_SIDECAR_AUTHKEY"] = sidecar.authkey.hex()
+        except Exception as e:
+            print(f"Embedding sidecar unavailable, workers load their own model: {e}")
+    
+    index_path = os.path.abspath(args.index_path)
+    os.environ["KB_INDEX_PATH"] = index_path
+    
+    # Each worker writes its metrics here, so whichever one is scraped can serve the totals
+    from app.services.metrics import clear_snapshots
+    metrics_dir = get_settings().metrics_multiprocess_dir or tempfile.mkdtemp(prefix="promptcraft-metrics-")
+    os.makedirs(metrics_dir, exist_ok=True)
+    clear_snapshots(metrics_dir)
+    os.environ["METRICS_MULTIPROCESS_DIR"] = metrics_dir
+    # Workers and the modules imported below read settings from the environment set above
+    get_settings.cache_clear()
+    
+    from app.services.knowledge_base import build_shared_index
+    try:
+        store = build_shared_index(index_path)
+        print(f"Shared knowledge index ready at {index_path} ({store.count()} documents)")
+    except Exception as e:
+        print(f"Could not build the shared knowledge index, workers build their own: {e}")
+        del os.environ["KB_INDEX_PATH"]
+    
+    try:
+        serve("app.main:app", options)
+    finally:
+        if sidecar:
+            sidecar.stop()
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    
     print("=" * 50)
     print("Starting PromptCraft AI Backend (Gemini)")
     print("=" * 50)
     print("\nMake sure GEMINI_API_KEY is set in your .env file")
     print("Get your key from: https://makersuite.google.com/app/apikey")
+    
+    from app.config import get_settings
+    from app.server import serve
+    
+    options = server_options(args)
+    print(f"Profile: {args.profile or get_settings().server_profile}, {options['workers']} worker(s), "
+          f"loop={options.get('loop', 'auto')}, http={options.get('http', 'auto')}")
     print()
     
-    uvicorn.run(
-        "app.main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
+    if options["workers"] > 1:
+        run_prefork(args, options)
+    else:
+        serve("app.main:app", options)
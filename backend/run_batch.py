@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""Offline batch runner: generate answers for a JSONL file of requests.
+
+Each input line is a JSON object:
+
+    {"id": "optional-row-id", "category": "architecture", "prompt": "...",
+     "options": {"context": "...", "industry": "...", "sectioned": false}}
+
+Results are appended to the output JSONL as they finish, so an interrupted run
+can be restarted with the same arguments and only the rows without a
+successful result are generated again.
+
+    python run_batch.py requests.jsonl results.jsonl --concurrency 4 --rate 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.generation import generate_for_category
+from app.services.knowledge_base import KnowledgeBaseService
+from app.services.llm import llm_service
+from app.services.llm_routing import TokenBucket
+
+CATEGORIES = ("architecture", "ui", "database", "api", "prompts")
+
+
+def load_rows(path):
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            if row.get("category") not in CATEGORIES:
+                raise ValueError(f"{path}:{number}: unknown category {row.get('category')!r}")
+            if not row.get("prompt"):
+                raise ValueError(f"{path}:{number}: missing prompt")
+            row["id"] = str(row.get("id") or f"line-{number}")
+            rows.append(row)
+    return rows
+
+
+def completed_ids(path):
+    """Row ids that already have a successful result in the output file"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # Partial last line from an interrupted run
+            if result.get("status") == "succeeded":
+                done.add(result["id"])
+    return done
+
+
+class Progress:
+    def __init__(self, total, interval):
+        self.total = total
+        self.interval = interval
+        self.succeeded = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self._reported = self.started
+    
+    def record(self, ok):
+        if ok:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        now = time.monotonic()
+        if now - self._reported >= self.interval:
+            self._reported = now
+            self.report()
+    
+    def report(self):
+        done = self.succeeded + self.failed
+        elapsed = time.monotonic() - self.started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - done) / rate if rate > 0 else float("inf")
+        print(
+            f"[{done}/{self.total}] {self.succeeded} ok, {self.failed} failed | "
+            f"{rate * 60:.1f} rows/min | elapsed {elapsed:.0f}s | eta {eta:.0f}s",
+            file=sys.stderr,
+            flush=True,
+        )
+
+
+async def run_row(row, knowledge_base):
+    options = row.get("options") or {}
+    response = await generate_for_category(
+        row["category"],
+        row["prompt"],
+        options.get("context"),
+        industry=options.get("industry"),
+        sectioned=bool(options.get("sectioned", False)),
+        knowledge_base=knowledge_base,
+    )
+    if row["category"] == "ui":
+        return response.model_dump()
+    return {"content": response}
+
+
+async def main(args):
+    rows = load_rows(args.input)
+    done = completed_ids(args.output) if args.resume else set()
+    todo = [row for row in rows if row["id"] not in done]
+    print(f"{len(rows)} rows, {len(rows) - len(todo)} already done, {len(todo)} to run", file=sys.stderr)
+    if not todo:
+        return 0
+    
+    await llm_service.initialize()
+    knowledge_base = None
+    if not args.no_knowledge_base:
+        try:
+            knowledge_base = KnowledgeBaseService()
+            await knowledge_base.initialize()
+        except Exception as e:
+            print(f"Knowledge base unavailable, continuing without it: {e}", file=sys.stderr)
+            knowledge_base = None
+    
+    queue = asyncio.Queue()
+    for row in todo:
+        queue.put_nowait(row)
+    bucket = TokenBucket(args.rate / 60.0, max(1, args.concurrency)) if args.rate > 0 else None
+    progress = Progress(len(todo), args.progress_interval)
+    
+    with open(args.output, "a" if args.resume else "w", encoding="utf-8") as out:
+        async def worker():
+            while True:
+                try:
+                    row = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                if bucket:
+                    await bucket.acquire()
+                started = time.monotonic()
+                record = {"id": row["id"], "category": row["category"], "prompt": row["prompt"]}
+                try:
+                    record.update(status="succeeded", result=await run_row(row, knowledge_base), error=None)
+                except Exception as e:
+                    record.update(status="failed", result=None, error=f"{type(e).__name__}: {e}")
+                record["elapsed"] = round(time.monotonic() - started, 3)
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                progress.record(record["status"] == "succeeded")
+        
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(1, args.concurrency))))
+        finally:
+            await llm_service.close()
+    
+    progress.report()
+    return 1 if progress.failed else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate answers for a JSONL file of requests")
+    parser.add_argument("input", help="input JSONL (category, prompt, options)")
+    parser.add_argument("output", help="output JSONL, appended to as rows finish")
+    parser.add_argument("--concurrency", type=int, default=4, help="rows generated at once (default 4)")
+    parser.add_argument("--rate", type=float, default=0.0, help="max rows started per minute (0 = unlimited)")
+    parser.add_argument("--no-resume", dest="resume", action="store_false", help="overwrite output instead of skipping done rows")
+    parser.add_argument("--no-knowledge-base", action="store_true", help="skip loading the embedding model")
+    parser.add_argument("--progress-interval", type=float, default=10.0, help="seconds between progress lines")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))